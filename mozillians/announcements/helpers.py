@@ -1,11 +1,41 @@
+from datetime import datetime
+
+from django.db.models import Q
+
 from jingo import register
 
-from models import Announcement
+from mozillians.common.versions import get_version
+from models import ANNOUNCEMENTS_VERSION_KEY, Announcement
+
+
+# The latest announcement of this process, as (version, expires,
+# announcement).
+_local = {}
+
+
+def _next_change(now):
+    """Return when an announcement next starts or stops being published."""
+    dates = (Announcement.objects
+             .filter(Q(publish_from__gt=now) | Q(publish_until__gt=now))
+             .values_list('publish_from', 'publish_until'))
+    changes = [date for pair in dates for date in pair if date and date > now]
+    return min(changes) if changes else None
 
 
 @register.function
 def latest_announcement():
-    """Return the latest published announcement or None."""
-    if Announcement.objects.published().count():
-        return Announcement.objects.published().latest()
-    return None
+    """Return the latest published announcement or None.
+
+    The announcement is kept in the process until the next time an
+    announcement starts or stops being published, or one is changed.
+    """
+    now = datetime.now()
+    version = get_version(ANNOUNCEMENTS_VERSION_KEY)
+    cached_version, expires, announcement = _local.get('latest', (None, None, None))
+    if cached_version == version and (expires is None or now < expires):
+        return announcement
+
+    announcements = list(Announcement.objects.published()[:1])
+    announcement = announcements[0] if announcements else None
+    _local['latest'] = (version, _next_change(now), announcement)
+    return announcement
@@ -4,6 +4,8 @@ from datetime import datetime
 
 from django.conf import settings
 from django.db import models
+from django.db.models import signals as dbsignals
+from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 
 import bleach
@@ -11,9 +13,13 @@ from jinja2 import Markup
 from sorl.thumbnail import ImageField
 
 from mozillians.announcements.managers import AnnouncementManager
+from mozillians.common.versions import bump_version
 
 
 ALLOWED_TAGS = ['em', 'strong', 'a', 'u']
+# Version of the announcements, changed on every save or delete, which
+# tells processes to drop the announcement they hold.
+ANNOUNCEMENTS_VERSION_KEY = 'announcements:version'
 
 
 def _calculate_image_filename(instance, filename):
@@ -60,3 +66,11 @@ class Announcement(models.Model):
     class Meta:
         ordering = ['-publish_from']
         get_latest_by = 'publish_from'
+
+
+@receiver(dbsignals.post_save, sender=Announcement,
+          dispatch_uid='invalidate_announcements_save_sig')
+@receiver(dbsignals.post_delete, sender=Announcement,
+          dispatch_uid='invalidate_announcements_delete_sig')
+def invalidate_announcements(sender, **kwargs):
+    bump_version(ANNOUNCEMENTS_VERSION_KEY)
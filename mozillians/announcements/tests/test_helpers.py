@@ -3,15 +3,20 @@ from datetime import datetime
 from mock import patch
 from nose.tools import eq_
 
+from mozillians.announcements import helpers
 from mozillians.announcements.helpers import latest_announcement
 from mozillians.announcements.tests import AnnouncementFactory, TestCase
 
 
 class AnnouncementManagerTests(TestCase):
+    def setUp(self):
+        helpers._local.clear()
 
+    @patch('mozillians.announcements.helpers.datetime')
     @patch('mozillians.announcements.managers.datetime')
-    def test_announcement_helper(self, mock_obj):
+    def test_announcement_helper(self, mock_obj, helpers_datetime_mock):
         """Test latest announcement helper."""
+        helpers_datetime_mock.now = mock_obj.now
         first = AnnouncementFactory.create(publish_from=datetime(2013, 2, 12),
                                            publish_until=datetime(2013, 2, 18))
         second = AnnouncementFactory.create(publish_from=datetime(2013, 2, 15),
@@ -33,3 +38,16 @@ class AnnouncementManagerTests(TestCase):
 
         mock_obj.now.return_value = datetime(2013, 2, 22)
         eq_(latest_announcement(), third)
+
+    def test_announcement_helper_cached(self):
+        announcement = AnnouncementFactory.create(publish_from=datetime(2013, 2, 12))
+        eq_(latest_announcement(), announcement)
+        with self.assertNumQueries(0):
+            eq_(latest_announcement(), announcement)
+
+    def test_announcement_helper_invalidated(self):
+        announcement = AnnouncementFactory.create(publish_from=datetime(2013, 2, 12))
+        eq_(latest_announcement().title, announcement.title)
+        announcement.title = 'Updated'
+        announcement.save()
+        eq_(latest_announcement().title, 'Updated')
@@ -7,7 +7,8 @@ from models import APIApp
 
 class APIAppAdmin(admin.ModelAdmin):
     """APIApp Admin."""
-    list_display = ['name', 'key', 'owner', 'is_mozilla_app', 'is_active']
+    list_display = ['name', 'key', 'owner', 'is_mozilla_app', 'is_active',
+                    'requests_per_minute', 'rows_per_minute']
     list_filter = ['is_mozilla_app', 'is_active']
     form = autocomplete_light.modelform_factory(APIApp)
 
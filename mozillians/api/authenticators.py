@@ -13,13 +13,14 @@ class AppAuthentication(Authentication):
         app_key = request.GET.get('app_key', '')
         app_name = request.GET.get('app_name', '')
 
-        try:
-            app = APIApp.objects.get(name__iexact=app_name, key=app_key, is_active=True)
-        except APIApp.DoesNotExist:
+        app, queried = APIApp.get_active_app(app_name, app_key)
+        statsd.incr('api.auth.cache.miss' if queried else 'api.auth.cache.hit')
+        if app is None:
             statsd.incr('api.auth.failed')
             return False
 
         statsd.incr('api.auth.success')
+        request.api_app = app
         if not app.is_mozilla_app:
             statsd.incr('api.requests.total_community')
             data = request.GET.copy()
@@ -0,0 +1,40 @@
+"""
+Time the stages of an API request locally.
+Requests the given URL, including app_name and app_key, through the
+test client a number of times and prints the average time spent in
+each stage, the number of queries and the size of the response.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.test.client import Client
+from django.test.utils import override_settings
+
+from mozillians.api import timing
+
+
+class Command(BaseCommand):
+    args = '<url> [repeat]'
+    help = 'Prints the time spent in each stage of an API request'
+
+    def handle(self, *args, **options):
+        if len(args) not in (1, 2):
+            raise CommandError('Usage: %s' % self.args)
+        url = args[0]
+        repeat = int(args[1]) if len(args) == 2 else 10
+
+        timers = []
+        client = Client()
+        with override_settings(API_TIMING_SAMPLE_RATE=1):
+            for i in range(repeat):
+                response = client.get(url, follow=True)
+                if response.status_code != 200:
+                    raise CommandError('%s answered %d' % (url, response.status_code))
+                timers.append(timing.last())
+
+        if not all(timers):
+            raise CommandError('%s is not served by an API resource.' % url)
+
+        for name in timing.STAGES:
+            average = sum(timer.stages.get(name, 0) for timer in timers) / repeat
+            self.stdout.write('%-15s %8.2f ms\n' % (name, average))
+        self.stdout.write('%-15s %8d\n' % ('queries', timers[-1].queries))
+        self.stdout.write('%-15s %8d bytes\n' % ('size', timers[-1].size or 0))
@@ -3,7 +3,25 @@ import uuid
 from hashlib import sha1
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db import models
+from django.db.models import signals as dbsignals
+from django.dispatch import receiver
+
+from mozillians.common.versions import bump_version, get_version
+
+
+API_APPS_VERSION_KEY = 'api:apps:version'
+API_APPS_KEY = 'api:apps:{version}'
+API_CACHE_GENERATION_KEY = 'api:generation'
+# Changes to models of these apps show up in API responses.
+API_CACHED_APPS = ['auth', 'groups', 'users']
+# Models of API_CACHED_APPS that do not. The changes feed validates its
+# pages by their own rows, so new profile changes need no new generation.
+API_UNCACHED_MODELS = ['auth.group', 'auth.group_permissions', 'auth.permission',
+                       'auth.user_groups', 'auth.user_user_permissions',
+                       'users.location', 'users.profilechange',
+                       'users.usernameblacklist']
 
 
 class APIApp(models.Model):
@@ -17,6 +35,12 @@ class APIApp(models.Model):
         max_length=256, blank=True, default='')
     is_mozilla_app = models.BooleanField(blank=True, default=False)
     is_active = models.BooleanField(blank=True, default=False)
+    requests_per_minute = models.PositiveIntegerField(
+        help_text='Maximum number of API requests per minute, 0 for no limit.',
+        default=600)
+    rows_per_minute = models.PositiveIntegerField(
+        help_text='Maximum number of objects returned per minute, 0 for no limit.',
+        default=30000)
     created = models.DateTimeField(auto_now_add=True)
 
     def __unicode__(self):
@@ -34,3 +58,75 @@ class APIApp(models.Model):
         """Return a key."""
         new_uuid = uuid.uuid4()
         return hmac.new(str(new_uuid), digestmod=sha1).hexdigest()
+
+    @classmethod
+    def get_active_app(cls, name, key):
+        """Return the active app with the given name and key, or None.
+
+        Names are compared case-insensitively. Active apps are read
+        from a table kept in this process and in the cache, and the
+        database is only queried after an app was saved or deleted.
+        Returns a tuple of the app and whether the database was
+        queried.
+        """
+        table, queried = cls._get_active_apps()
+        app = table.get((name.lower(), sha1(key.encode('utf-8')).hexdigest()))
+        return app, queried
+
+    @classmethod
+    def _get_active_apps(cls):
+        version = get_version(API_APPS_VERSION_KEY)
+        if _active_apps.get('version') == version:
+            return _active_apps['table'], False
+
+        key = API_APPS_KEY.format(version=version)
+        table = cache.get(key)
+        queried = table is None
+        if queried:
+            table = dict(((app.name.lower(), sha1(app.key.encode('utf-8')).hexdigest()), app)
+                         for app in cls.objects.filter(is_active=True))
+            cache.set(key, table)
+        _active_apps.update(version=version, table=table)
+        return table, queried
+
+
+# Active apps of the current version, kept in this process.
+_active_apps = {}
+
+
+def get_cache_generation():
+    """Return the current generation of cached API responses."""
+    return get_version(API_CACHE_GENERATION_KEY)
+
+
+def invalidate_api_cache():
+    """Start a new generation, so no cached API response is used again.
+
+    Called for every saved or deleted object of API_CACHED_APPS. Code
+    that changes such objects without sending signals, like
+    bulk_create() or update(), has to call it itself.
+    """
+    bump_version(API_CACHE_GENERATION_KEY)
+
+
+@receiver(dbsignals.post_save, dispatch_uid='invalidate_api_cache_save_sig')
+@receiver(dbsignals.post_delete, dispatch_uid='invalidate_api_cache_delete_sig')
+@receiver(dbsignals.m2m_changed, dispatch_uid='invalidate_api_cache_m2m_sig')
+def invalidate_api_cache_on_change(sender, **kwargs):
+    if sender._meta.app_label not in API_CACHED_APPS:
+        return
+    label = '%s.%s' % (sender._meta.app_label, sender._meta.object_name.lower())
+    if label in API_UNCACHED_MODELS:
+        return
+    if kwargs.get('update_fields') == frozenset(['last_login']):
+        # Logging in does not change anything the API returns.
+        return
+    invalidate_api_cache()
+
+
+@receiver(dbsignals.post_save, sender=APIApp,
+          dispatch_uid='invalidate_active_apps_save_sig')
+@receiver(dbsignals.post_delete, sender=APIApp,
+          dispatch_uid='invalidate_active_apps_delete_sig')
+def invalidate_active_apps(sender, **kwargs):
+    bump_version(API_APPS_VERSION_KEY)
@@ -1,9 +1,24 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from urllib import urlencode
+
 from django.conf import settings
 from tastypie import paginator
+from tastypie.exceptions import BadRequest
+
+from mozillians.api.timing import stage
 
 
 class Paginator(paginator.Paginator):
-    """Paginator with a hard limit on results per page."""
+    """Paginator with a hard limit on results per page.
+
+    Passing an ``after`` parameter switches to cursor pagination:
+    results are ordered by id, whatever order_by says, and start after
+    the object the cursor points to, so every page costs the same
+    however deep it is. An empty ``after`` requests the first page and
+    ``meta.next`` holds the URL of the following one. The total count
+    is only computed if ``total_count=true`` is passed as well.
+
+    """
 
     def get_limit(self):
         """Determines the proper maximum number of results to return.
@@ -28,3 +43,104 @@ class Paginator(paginator.Paginator):
         Elastic Search crashes and timeouts.
         """
         return min(super(Paginator, self).get_offset(), self.get_count())
+
+    def get_count(self):
+        """Count the objects only once per page."""
+        if not hasattr(self, '_count'):
+            with stage('counting'):
+                self._count = super(Paginator, self).get_count()
+        return self._count
+
+    def get_slice(self, limit, offset):
+        """Fetch the page at once, so that it is timed on its own."""
+        with stage('fetching'):
+            return list(super(Paginator, self).get_slice(limit, offset))
+
+    def is_cursor(self):
+        return 'after' in self.request_data
+
+    def _get_cursor_objects(self):
+        """Return the objects of a cursor page and the page limit."""
+        limit = self.get_limit() or getattr(settings, 'HARD_API_LIMIT_PER_PAGE', 500)
+        after = decode_cursor(self.request_data['after'])
+        objects = self.objects.order_by('id')
+        if after is not None:
+            objects = objects.filter(id__gt=after)
+        return objects, limit
+
+    def get_page_rows(self, count):
+        """Return the number of rows of an offset page out of count."""
+        self._count = count
+        limit = self.get_limit()
+        offset = self.get_offset()
+        return min(limit, count - offset) if limit else count - offset
+
+    def get_page_validator(self, field):
+        """Return what a cursor page holds: its number of rows, its last
+        id and the greatest value of field among them.
+
+        Reads only the ids and field of the page, and of the first row
+        of the next one, not whole objects.
+        """
+        objects, limit = self._get_cursor_objects()
+        with stage('fetching'):
+            rows = list(objects.values_list('id', field)[:limit + 1])
+        if not rows:
+            return [0, None, None]
+        return [min(len(rows), limit), rows[-1][0], max(row[1] for row in rows)]
+
+    def page(self):
+        if not self.is_cursor():
+            return super(Paginator, self).page()
+
+        objects, limit = self._get_cursor_objects()
+        # One extra row tells whether there is a next page.
+        with stage('fetching'):
+            objects = list(objects[:limit + 1])
+        has_next = len(objects) > limit
+        objects = objects[:limit]
+
+        meta = {'limit': limit,
+                'after': self.request_data['after'],
+                'previous': None,
+                'next': None}
+        if has_next:
+            meta['next'] = self._generate_cursor_uri(limit, objects[-1].id)
+        if self.request_data.get('total_count') == 'true':
+            meta['total_count'] = self.get_count()
+        return {'objects': objects, 'meta': meta}
+
+    def _generate_cursor_uri(self, limit, last_id):
+        if self.resource_uri is None:
+            return None
+
+        request_params = dict((key, value) for key, value in self.request_data.items()
+                              if key != 'offset')
+        request_params.update({'limit': limit, 'after': encode_cursor(last_id)})
+        return '%s?%s' % (self.resource_uri, urlencode(request_params))
+
+
+class CursorPaginator(Paginator):
+    """Paginator that always uses cursor pagination."""
+
+    def __init__(self, request_data, *args, **kwargs):
+        if 'after' not in request_data:
+            request_data = request_data.copy()
+            request_data['after'] = ''
+        super(CursorPaginator, self).__init__(request_data, *args, **kwargs)
+
+
+def encode_cursor(object_id):
+    """Return the opaque cursor pointing after object_id."""
+    return urlsafe_b64encode(str(object_id)).rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the object id of a cursor, or None for the first page."""
+    if not cursor:
+        return None
+    try:
+        object_id = int(urlsafe_b64decode(str(cursor) + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError):
+        raise BadRequest('Invalid after cursor.')
+    return object_id
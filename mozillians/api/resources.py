@@ -1,6 +1,24 @@
+import random
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max
+from django.http import HttpResponse
 from django.utils.cache import patch_cache_control
 
 from django_statsd.clients import statsd
+from tastypie.exceptions import ImmediateHttpResponse
+from tastypie.http import HttpNotModified
+
+from mozillians.api import throttle, timing
+from mozillians.api.models import get_cache_generation
+
+
+API_PAGE_CACHE_KEY = 'api:page:{etag}'
+# Parameters that identify the app, not the query.
+ETAG_IGNORED_PARAMS = ['app_key', 'app_name']
 
 
 class ClientCacheResourceMixIn(object):
@@ -9,6 +27,16 @@ class ClientCacheResourceMixIn(object):
     using a ``cache_control`` dictionary from the resource's Meta
     class.
 
+    List responses also carry an ETag, computed from the query, the
+    API cache generation and, if the resource's Meta has an
+    ``etag_field``, the maximum of that field and the number of
+    matching rows. Cursor pages use the ids and field of their own rows
+    instead, so that no page costs an aggregate over all rows. A
+    request whose If-None-Match matches gets a 304 before any object is
+    dehydrated, and the rows of its page still count against the
+    limits of ThrottleMixIn. If API_PAGE_CACHE_TIMEOUT is set,
+    serialized pages are also cached under their ETag.
+
     TODO: To be removed when we upgrade to django-tastypie >= 0.9.12.
 
     Code from http://django-tastypie.readthedocs.org/en/latest/caching.html
@@ -24,6 +52,80 @@ class ClientCacheResourceMixIn(object):
 
         return response
 
+    def get_etag(self, request, objects):
+        """Return the ETag of the list of objects for this request and
+        the number of rows of its page, or None without an etag_field.
+
+        The restricted flag set for community apps is part of the
+        query, so apps of different tiers never share an ETag.
+        """
+        params = sorted((key, request.GET.getlist(key)) for key in request.GET
+                        if key not in ETAG_IGNORED_PARAMS)
+        validator = [self._meta.resource_name, get_cache_generation(), params,
+                     request.META.get('HTTP_ACCEPT', '')]
+        rows = None
+        etag_field = getattr(self._meta, 'etag_field', None)
+        if etag_field:
+            paginator = self._meta.paginator_class(request.GET, objects,
+                                                   limit=self._meta.limit)
+            if paginator.is_cursor():
+                page_validator = paginator.get_page_validator(etag_field)
+                rows = page_validator[0]
+                validator += page_validator
+            else:
+                last = objects.aggregate(last=Max(etag_field))['last']
+                # Count the distinct ids, not the rows of the joins of
+                # filters on related objects.
+                count = objects.order_by().values('id').distinct().count()
+                rows = paginator.get_page_rows(count)
+                validator += [last, count]
+        return '"%s"' % md5(repr(validator)).hexdigest(), rows
+
+    def _count_served_rows(self, request, rows):
+        """Count rows served without dehydrating them, for resources
+        that are throttled."""
+        if rows and hasattr(self, 'count_rows'):
+            self.count_rows(request, rows)
+
+    def get_list(self, request, **kwargs):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        objects = self.obj_get_list(request=request,
+                                    **self.remove_api_resource_names(kwargs))
+        etag, rows = self.get_etag(request, objects)
+
+        if etag in [value.strip() for value in if_none_match.split(',')]:
+            statsd.incr('api.cache.not_modified')
+            self._count_served_rows(request, rows)
+            response = HttpNotModified()
+            if hasattr(self.Meta, 'cache_control'):
+                patch_cache_control(response, **self.Meta.cache_control)
+        else:
+            response = self._get_cached_list(request, etag, rows, **kwargs)
+        response['ETag'] = etag
+        return response
+
+    def _get_cached_list(self, request, etag, rows, **kwargs):
+        timeout = getattr(settings, 'API_PAGE_CACHE_TIMEOUT', 0)
+        if not timeout:
+            return super(ClientCacheResourceMixIn, self).get_list(request, **kwargs)
+
+        key = API_PAGE_CACHE_KEY.format(etag=etag.strip('"'))
+        cached = cache.get(key)
+        if cached:
+            statsd.incr('api.cache.hit')
+            self._count_served_rows(request, rows)
+            content, content_type = cached
+            response = HttpResponse(content, content_type=content_type)
+            if hasattr(self.Meta, 'cache_control'):
+                patch_cache_control(response, **self.Meta.cache_control)
+            return response
+
+        statsd.incr('api.cache.miss')
+        response = super(ClientCacheResourceMixIn, self).get_list(request, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, (response.content, response['Content-Type']), timeout)
+        return response
+
 
 class AdvancedSortingResourceMixIn(object):
     """
@@ -45,6 +147,10 @@ class AdvancedSortingResourceMixIn(object):
 class GraphiteMixIn(object):
     """
     MixIn to post to graphite server every hit of API resource.
+
+    A sample of API_TIMING_SAMPLE_RATE of the requests is also timed
+    per stage, with the number of queries and the size of the response,
+    under api.timing.{klass}.{func}. See mozillians.api.timing.
     """
 
     def wrap_view(self, view):
@@ -56,5 +162,71 @@ class GraphiteMixIn(object):
                 klass=callback.im_class.__name__,
                 func=callback.im_func.__name__)
             statsd.incr(counter_name)
-            return real_wrapper(request, *args, **kwargs)
+
+            rate = getattr(settings, 'API_TIMING_SAMPLE_RATE', 0.01)
+            if not rate or random.random() >= rate:
+                return real_wrapper(request, *args, **kwargs)
+
+            timer = timing.start()
+            use_debug_cursor = connection.use_debug_cursor
+            connection.use_debug_cursor = True
+            queries = len(connection.queries)
+            try:
+                with timer.stage('total'):
+                    response = real_wrapper(request, *args, **kwargs)
+                timer.queries = len(connection.queries) - queries
+            finally:
+                connection.use_debug_cursor = use_debug_cursor
+                timing.stop()
+            if not getattr(response, 'streaming', False):
+                timer.size = len(response.content)
+            timer.send(counter_name.replace('api.resources', 'api.timing'), rate)
+            return response
         return wrapper
+
+    def is_authenticated(self, request):
+        with timing.stage('authentication'):
+            return super(GraphiteMixIn, self).is_authenticated(request)
+
+    def obj_get_list(self, request=None, **kwargs):
+        with timing.stage('filtering'):
+            return super(GraphiteMixIn, self).obj_get_list(request=request, **kwargs)
+
+    def full_dehydrate(self, bundle):
+        with timing.stage('dehydration'):
+            return super(GraphiteMixIn, self).full_dehydrate(bundle)
+
+    def serialize(self, request, data, format, options=None):
+        with timing.stage('serialization'):
+            return super(GraphiteMixIn, self).serialize(request, data, format, options)
+
+
+class ThrottleMixIn(object):
+    """
+    MixIn to rate limit API apps by requests and returned objects per
+    minute, with the limits of their APIApp. Over the limit, requests
+    get a 429 with a Retry-After header.
+
+    Needs AppAuthentication, which sets request.api_app.
+    """
+
+    def throttle_check(self, request):
+        app = getattr(request, 'api_app', None)
+        if app is None:
+            return
+
+        response = throttle.check(app)
+        if response is not None:
+            raise ImmediateHttpResponse(response=response)
+
+    def count_rows(self, request, rows):
+        """Take rows returned to the app of request from its bucket."""
+        app = getattr(request, 'api_app', None)
+        if app is not None:
+            throttle.count_rows(app, rows)
+
+    def create_response(self, request, data, **response_kwargs):
+        if isinstance(data, dict) and 'objects' in data:
+            self.count_rows(request, len(data['objects']))
+        return (super(ThrottleMixIn, self)
+                .create_response(request, data, **response_kwargs))
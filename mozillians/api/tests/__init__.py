@@ -10,3 +10,6 @@ class APIAppFactory(factory.DjangoModelFactory):
     description = factory.Sequence(lambda n: 'Description for App {0}'.format(n))
     owner = factory.SubFactory(UserFactory)
     is_active = True
+    # Tests reuse app ids, so limits would carry over between them.
+    requests_per_minute = 0
+    rows_per_minute = 0
@@ -1,5 +1,6 @@
 from django.test.client import RequestFactory
 
+from mock import patch
 from nose.tools import eq_, ok_
 from test_utils import TestCase
 
@@ -43,6 +44,13 @@ class AppAuthenticationTests(TestCase):
         authentication = AppAuthentication()
         eq_(authentication.is_authenticated(request), False)
 
+    def test_non_ascii_app_key(self):
+        app = APIAppFactory.create()
+        request = RequestFactory()
+        request.GET = {'app_key': u'\xe9', 'app_name': app.name}
+        authentication = AppAuthentication()
+        eq_(authentication.is_authenticated(request), False)
+
     def test_invalid_app_name_and_key(self):
         request = RequestFactory()
         request.GET = {'app_key': 'invalid', 'app_name': 'invalid'}
@@ -64,3 +72,41 @@ class AppAuthenticationTests(TestCase):
         authentication = AppAuthentication()
         authentication.is_authenticated(request)
         eq_(request.GET.get('restricted'), True)
+
+    def test_case_insensitive_name(self):
+        app = APIAppFactory.create()
+        request = RequestFactory()
+        request.GET = {'app_key': app.key, 'app_name': app.name.upper()}
+        ok_(AppAuthentication().is_authenticated(request))
+
+    def test_inactive_app(self):
+        app = APIAppFactory.create(is_active=False)
+        request = RequestFactory()
+        request.GET = {'app_key': app.key, 'app_name': app.name}
+        eq_(AppAuthentication().is_authenticated(request), False)
+
+    @patch('mozillians.api.authenticators.statsd.incr')
+    def test_cached_lookup(self, incr_mock):
+        app = APIAppFactory.create()
+        request = RequestFactory()
+        request.GET = {'app_key': app.key, 'app_name': app.name}
+        authentication = AppAuthentication()
+        ok_(authentication.is_authenticated(request))
+        incr_mock.assert_any_call('api.auth.cache.miss')
+
+        request.GET = {'app_key': app.key, 'app_name': app.name}
+        with self.assertNumQueries(0):
+            ok_(authentication.is_authenticated(request))
+        incr_mock.assert_any_call('api.auth.cache.hit')
+
+    def test_deactivated_app(self):
+        app = APIAppFactory.create()
+        request = RequestFactory()
+        request.GET = {'app_key': app.key, 'app_name': app.name}
+        authentication = AppAuthentication()
+        ok_(authentication.is_authenticated(request))
+
+        app.is_active = False
+        app.save()
+        request.GET = {'app_key': app.key, 'app_name': app.name}
+        eq_(authentication.is_authenticated(request), False)
@@ -1,8 +1,10 @@
-from nose.tools import ok_
+from nose.tools import eq_, ok_
 from test_utils import TestCase
 
 from mozillians.users.tests import UserFactory
-from mozillians.api.models import APIApp
+from mozillians.api.models import APIApp, get_cache_generation
+from mozillians.groups.tests import GroupFactory
+from mozillians.users.models import ProfileChange
 
 
 class APIAppTests(TestCase):
@@ -12,3 +14,30 @@ class APIAppTests(TestCase):
                                         description='Foo',
                                         key='')
         ok_(api_app.key != '')
+
+
+class CacheGenerationTests(TestCase):
+    def test_changes_start_new_generation(self):
+        user = UserFactory.create()
+        generation = get_cache_generation()
+        eq_(get_cache_generation(), generation)
+
+        user.userprofile.save()
+        ok_(get_cache_generation() != generation)
+
+        generation = get_cache_generation()
+        GroupFactory.create().delete()
+        ok_(get_cache_generation() != generation)
+
+    def test_login_keeps_generation(self):
+        user = UserFactory.create()
+        generation = get_cache_generation()
+        user.save(update_fields=['last_login'])
+        eq_(get_cache_generation(), generation)
+
+    def test_profile_change_keeps_generation(self):
+        user = UserFactory.create()
+        generation = get_cache_generation()
+        ProfileChange.objects.create(userprofile_id=user.userprofile.id,
+                                     change_type=ProfileChange.UPDATED)
+        eq_(get_cache_generation(), generation)
@@ -0,0 +1,57 @@
+from urlparse import parse_qs, urlparse
+
+from django.http import QueryDict
+
+from nose.tools import eq_, ok_
+from tastypie.exceptions import BadRequest
+
+from mozillians.api.paginator import Paginator, decode_cursor, encode_cursor
+from mozillians.common.tests import TestCase
+from mozillians.groups.models import Group
+from mozillians.groups.tests import GroupFactory
+
+
+class PaginatorTests(TestCase):
+    def setUp(self):
+        self.groups = [GroupFactory.create() for i in range(5)]
+        self.groups.sort(key=lambda group: group.id)
+
+    def _page(self, query):
+        paginator = Paginator(QueryDict(query), Group.objects.order_by('-name'),
+                              resource_uri='/api/v1/groups/')
+        return paginator.page()
+
+    def test_cursor_roundtrip(self):
+        eq_(decode_cursor(encode_cursor(1234)), 1234)
+        eq_(decode_cursor(''), None)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(BadRequest):
+            decode_cursor('not a cursor')
+
+    def test_cursor_pages(self):
+        page = self._page('after=&limit=2')
+        eq_(page['objects'], self.groups[:2])
+        ok_('total_count' not in page['meta'])
+        next_url = urlparse(page['meta']['next'])
+        eq_(next_url.path, '/api/v1/groups/')
+        eq_(parse_qs(next_url.query),
+            {'limit': ['2'], 'after': [encode_cursor(self.groups[1].id)]})
+
+        page = self._page('limit=2&after=%s' % encode_cursor(self.groups[3].id))
+        eq_(page['objects'], self.groups[4:])
+        eq_(page['meta']['next'], None)
+
+    def test_cursor_pages_query_count(self):
+        cursor = encode_cursor(self.groups[2].id)
+        with self.assertNumQueries(1):
+            self._page('limit=2&after=%s' % cursor)
+
+    def test_cursor_total_count(self):
+        page = self._page('after=&limit=2&total_count=true')
+        eq_(page['meta']['total_count'], 5)
+
+    def test_offset_pages_count_once(self):
+        with self.assertNumQueries(1):
+            page = self._page('offset=2&limit=2')
+        eq_(page['meta']['total_count'], 5)
@@ -1,11 +1,20 @@
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+from django.test.utils import override_settings
+
+from funfactory.helpers import urlparams
 from mock import MagicMock, patch
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
+from mozillians.api import timing
 from mozillians.api.resources import GraphiteMixIn
+from mozillians.api.tests import APIAppFactory
 from mozillians.common.tests import TestCase
+from mozillians.users.tests import UserFactory
 
 
 class GraphiteMixInTests(TestCase):
+    @override_settings(API_TIMING_SAMPLE_RATE=0)
     @patch('mozillians.api.resources.statsd.incr')
     def test_statsd_call(self, incr_mock):
         real_wrapper = MagicMock()
@@ -27,3 +36,42 @@ class GraphiteMixInTests(TestCase):
         eq_(return_value, real_wrapper.return_value)
         real_wrapper.assert_called_with('request', 1, second=2)
         incr_mock.assert_called_with('api.resources.foo.bar')
+
+    @override_settings(API_TIMING_SAMPLE_RATE=1)
+    @patch('mozillians.api.timing.statsd')
+    def test_stage_timing(self, statsd_mock):
+        UserFactory.create()
+        app = APIAppFactory.create(is_mozilla_app=True)
+        url = reverse('api_dispatch_list',
+                      kwargs={'api_name': 'v1', 'resource_name': 'users'})
+        response = Client().get(urlparams(url, app_name=app.name, app_key=app.key),
+                                follow=True)
+        eq_(response.status_code, 200)
+
+        timer = timing.last()
+        for name in timing.STAGES:
+            ok_(name in timer.stages, name)
+        ok_(timer.queries > 0)
+        eq_(timer.size, len(response.content))
+        statsd_mock.timing.assert_any_call(
+            'api.timing.UserResource.dispatch_list.counting',
+            int(timer.stages['counting']), rate=1)
+        statsd_mock.gauge.assert_any_call(
+            'api.timing.UserResource.dispatch_list.queries', timer.queries, rate=1)
+
+
+class TimingTests(TestCase):
+    def test_stage_outside_request(self):
+        timing.stop()
+        with timing.stage('counting'):
+            pass
+        eq_(timing.last(), None)
+
+    def test_stages_add_up(self):
+        timer = timing.start()
+        with timing.stage('dehydration'):
+            pass
+        with timing.stage('dehydration'):
+            pass
+        eq_(timing.stop(), timer)
+        eq_(timer.stages.keys(), ['dehydration'])
@@ -0,0 +1,118 @@
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+
+from funfactory.helpers import urlparams
+from mock import patch
+from nose.tools import eq_, ok_
+
+from mozillians.api import throttle
+from mozillians.api.tests import APIAppFactory
+from mozillians.common.tests import TestCase
+from mozillians.users.tests import UserFactory
+
+
+class TakeTests(TestCase):
+    def setUp(self):
+        cache.delete(throttle.THROTTLE_KEY.format(app_id=1, kind='requests'))
+        throttle._local_buckets.clear()
+
+    def test_burst_then_wait(self):
+        for i in range(3):
+            eq_(throttle.take(1, 'requests', 3), 0)
+        wait = throttle.take(1, 'requests', 3)
+        ok_(0 < wait <= 20)
+
+    def test_refill(self):
+        with patch('mozillians.api.throttle.time.time') as time_mock:
+            time_mock.return_value = 1000
+            for i in range(3):
+                throttle.take(1, 'requests', 3)
+            ok_(throttle.take(1, 'requests', 3))
+            time_mock.return_value = 1020
+            eq_(throttle.take(1, 'requests', 3), 0)
+
+    def test_debt(self):
+        eq_(throttle.take(1, 'requests', 3, 10, debt=True), 0)
+        ok_(throttle.take(1, 'requests', 3, 0) > 100)
+
+    def test_no_limit(self):
+        for i in range(10):
+            eq_(throttle.take(1, 'requests', 0), 0)
+
+    @patch('mozillians.api.throttle.cache')
+    def test_local_fallback(self, cache_mock):
+        cache_mock.get.side_effect = Exception
+        for i in range(3):
+            eq_(throttle.take(1, 'requests', 3), 0)
+        ok_(throttle.take(1, 'requests', 3))
+        ok_(throttle._local_buckets)
+
+    @patch('mozillians.api.throttle.cache')
+    def test_local_fallback_silent_cache(self, cache_mock):
+        # Memcached loses writes and misses reads without raising.
+        cache_mock.get.return_value = None
+        cache_mock.add.return_value = False
+        for i in range(3):
+            eq_(throttle.take(1, 'requests', 3), 0)
+        ok_(throttle.take(1, 'requests', 3))
+        ok_(throttle._local_buckets)
+
+
+class ThrottleMixInTests(TestCase):
+    def setUp(self):
+        UserFactory.create()
+        self.url = reverse('api_dispatch_list',
+                           kwargs={'api_name': 'v1', 'resource_name': 'users'})
+
+    def _get(self, app):
+        url = urlparams(self.url, app_name=app.name, app_key=app.key)
+        return Client().get(url, follow=True)
+
+    @patch('mozillians.api.resources.statsd.incr')
+    def test_requests_limit(self, incr_mock):
+        app = APIAppFactory.create(is_mozilla_app=True, requests_per_minute=2)
+        cache.delete(throttle.THROTTLE_KEY.format(app_id=app.id, kind='requests'))
+        eq_(self._get(app).status_code, 200)
+        eq_(self._get(app).status_code, 200)
+        response = self._get(app)
+        eq_(response.status_code, 429)
+        ok_(int(response['Retry-After']) > 0)
+        incr_mock.assert_any_call('api.throttle.requests')
+
+    def test_rows_limit(self):
+        UserFactory.create()
+        app = APIAppFactory.create(is_mozilla_app=True, rows_per_minute=1)
+        cache.delete(throttle.THROTTLE_KEY.format(app_id=app.id, kind='rows'))
+        eq_(self._get(app).status_code, 200)
+        eq_(self._get(app).status_code, 429)
+
+    def test_not_modified_counts_rows(self):
+        app = APIAppFactory.create(is_mozilla_app=True, rows_per_minute=1)
+        cache.delete(throttle.THROTTLE_KEY.format(app_id=app.id, kind='rows'))
+        url = urlparams(self.url, app_name=app.name, app_key=app.key)
+        etag = Client().get(url, follow=True)['ETag']
+        response = Client().get(url, HTTP_IF_NONE_MATCH=etag, follow=True)
+        eq_(response.status_code, 304)
+        response = Client().get(url, HTTP_IF_NONE_MATCH=etag, follow=True)
+        eq_(response.status_code, 429)
+
+
+class VouchedEmailThrottleTests(TestCase):
+    def test_requests_limit(self):
+        user = UserFactory.create()
+        app = APIAppFactory.create(is_mozilla_app=False, requests_per_minute=1)
+        cache.delete(throttle.THROTTLE_KEY.format(app_id=app.id, kind='requests'))
+        url = urlparams(reverse('api_vouched_email'), app_name=app.name,
+                        app_key=app.key, email=user.email)
+        eq_(Client().get(url).status_code, 200)
+        eq_(Client().get(url).status_code, 429)
+
+    def test_rows_limit(self):
+        user = UserFactory.create()
+        app = APIAppFactory.create(is_mozilla_app=False, rows_per_minute=1)
+        cache.delete(throttle.THROTTLE_KEY.format(app_id=app.id, kind='rows'))
+        url = urlparams(reverse('api_vouched_email'), app_name=app.name,
+                        app_key=app.key, email=user.email)
+        eq_(Client().get(url).status_code, 200)
+        eq_(Client().get(url).status_code, 429)
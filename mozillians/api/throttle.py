@@ -0,0 +1,123 @@
+"""Token bucket rate limits for API apps.
+
+Every APIApp has a bucket of requests_per_minute request tokens and one
+of rows_per_minute row tokens, refilled continuously, so an app can
+burst up to a minute's worth and then keep the limit's average rate.
+
+Buckets live in the shared cache, so that all web processes count
+together. When the cache fails, either raising or, like memcached,
+silently losing what is written to it, they are kept in the process
+instead, which only limits each process on its own until the cache is
+back.
+Buckets are read and written without a lock, so concurrent requests of
+one app can overshoot its limits slightly.
+
+"""
+import logging
+import math
+import time
+
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from django_statsd.clients import statsd
+
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_KEY = 'api:throttle:{app_id}:{kind}'
+THROTTLE_PERIOD = 60
+
+_local_buckets = {}
+
+
+def _load(key):
+    """Return the state of a bucket and whether it came from the cache.
+
+    A bucket missing from the cache is either new or lost by a failing
+    cache, so the one kept in the process, if any, is returned and
+    whether it is shared is None until _store() finds out.
+    """
+    try:
+        state = cache.get(key)
+    except Exception:
+        statsd.incr('api.throttle.cache_error')
+        logger.warning('Cannot read throttle bucket %s from the cache.' % key)
+        return _local_buckets.get(key), False
+    if state is None:
+        return _local_buckets.get(key), None
+    return state, True
+
+
+def _store(key, state, shared):
+    if shared is not False:
+        try:
+            if shared:
+                cache.set(key, state, THROTTLE_PERIOD * 2)
+                return
+            # A new bucket only sticks if the cache works.
+            if cache.add(key, state, THROTTLE_PERIOD * 2):
+                _local_buckets.pop(key, None)
+                return
+        except Exception:
+            pass
+        statsd.incr('api.throttle.cache_error')
+        logger.warning('Cannot write throttle bucket %s to the cache.' % key)
+    _local_buckets[key] = state
+
+
+def take(app_id, kind, limit, amount=1, debt=False):
+    """Take amount tokens from a bucket of an app.
+
+    Returns 0 if they were taken, otherwise the number of seconds until
+    the bucket holds enough of them. With debt, the tokens are always
+    taken and the bucket may go below zero. A limit of 0 never throttles.
+    """
+    if not limit:
+        return 0
+
+    key = THROTTLE_KEY.format(app_id=app_id, kind=kind)
+    rate = float(limit) / THROTTLE_PERIOD
+    now = time.time()
+    state, shared = _load(key)
+    if state is None:
+        tokens = limit
+    else:
+        tokens, updated = state
+        tokens = min(limit, tokens + (now - updated) * rate)
+
+    if tokens < amount and not debt:
+        return (amount - tokens) / rate
+
+    _store(key, (tokens - amount, now), shared)
+    return 0
+
+
+def check(app):
+    """Return a 429 response if app is over one of its limits, or None.
+
+    Takes a request token. Rows are counted once served, with
+    count_rows(), so only check that the app is not in debt for them.
+    """
+    for kind, limit, amount in [('requests', app.requests_per_minute, 1),
+                                ('rows', app.rows_per_minute, 0)]:
+        wait = take(app.id, kind, limit, amount)
+        if wait:
+            statsd.incr('api.throttle.%s' % kind)
+            statsd.incr('api.throttle.app.%d' % app.id)
+            return too_many_requests(wait)
+    return None
+
+
+def count_rows(app, rows):
+    """Take rows served to app from its bucket."""
+    if rows:
+        take(app.id, 'rows', app.rows_per_minute, rows, debt=True)
+        statsd.incr('api.throttle.rows_served', rows)
+
+
+def too_many_requests(wait):
+    """Return a 429 response telling the client to retry after wait seconds."""
+    response = HttpResponse(status=429)
+    response['Retry-After'] = str(int(math.ceil(wait)))
+    return response
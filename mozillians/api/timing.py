@@ -0,0 +1,73 @@
+"""Per stage timing of API requests.
+
+GraphiteMixIn starts a RequestTimer for a sample of API requests, and
+the stages of the request (authentication, filtering, counting,
+fetching, dehydration, serialization) are timed with stage(), which
+does nothing outside a sampled request. The timer of a request lives
+in a thread local, so that code outside the resource, like the
+paginator, can time its stages too.
+
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django_statsd.clients import statsd
+
+
+STAGES = ['authentication', 'filtering', 'counting', 'fetching',
+          'dehydration', 'serialization', 'total']
+
+_local = threading.local()
+
+
+class RequestTimer(object):
+    """Milliseconds spent in each stage of one API request."""
+
+    def __init__(self):
+        self.stages = defaultdict(float)
+        self.queries = None
+        self.size = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.stages[name] += (time.time() - start) * 1000
+
+    def send(self, prefix, rate=1):
+        """Send the timings and gauges to statsd under prefix."""
+        for name, value in self.stages.items():
+            statsd.timing('%s.%s' % (prefix, name), int(value), rate=rate)
+        if self.queries is not None:
+            statsd.gauge('%s.queries' % prefix, self.queries, rate=rate)
+        if self.size is not None:
+            statsd.gauge('%s.size' % prefix, self.size, rate=rate)
+
+
+def start():
+    _local.timer = RequestTimer()
+    return _local.timer
+
+
+def stop():
+    _local.last, _local.timer = getattr(_local, 'timer', None), None
+    return _local.last
+
+
+def last():
+    """Return the timer of the last sampled request of this thread."""
+    return getattr(_local, 'last', None)
+
+
+@contextmanager
+def stage(name):
+    timer = getattr(_local, 'timer', None)
+    if timer is None:
+        yield
+    else:
+        with timer.stage(name):
+            yield
@@ -8,9 +8,12 @@ import mozillians.users.api
 
 v1_api = Api(api_name='v1')
 v1_api.register(mozillians.users.api.UserResource())
+v1_api.register(mozillians.users.api.ChangeResource())
 v1_api.register(mozillians.groups.api.GroupResource())
 v1_api.register(mozillians.groups.api.SkillResource())
 
 urlpatterns = patterns(
     '',
+    url(r'^v1/vouched/$', 'mozillians.users.views.vouched_email',
+        name='api_vouched_email'),
     url(r'', include(v1_api.urls)),)
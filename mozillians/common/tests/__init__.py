@@ -3,6 +3,7 @@ from __future__ import absolute_import
 from contextlib import contextmanager, nested
 
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
 from django.shortcuts import redirect
 from django.test.client import Client
 from django.test.utils import override_settings
@@ -24,6 +25,12 @@ ES_INDEXES = {
 @override_settings(AUTHENTICATION_BACKENDS=AUTHENTICATION_BACKENDS,
                    ES_INDEXES=ES_INDEXES)
 class TestCase(BaseTestCase):
+    def _pre_setup(self):
+        # Cached pages, fragments and versions are keyed on ids and
+        # timestamps, which tests reuse.
+        cache.clear()
+        super(TestCase, self)._pre_setup()
+
     @contextmanager
     def login(self, user):
         client = Client()
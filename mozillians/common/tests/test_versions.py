@@ -0,0 +1,26 @@
+from django.core.cache import cache
+
+from mock import patch
+from nose.tools import eq_, ok_
+
+from mozillians.common.tests import TestCase
+from mozillians.common.versions import bump_version, get_version
+
+
+class VersionsTests(TestCase):
+
+    def test_get_version(self):
+        version = get_version('test:version')
+        ok_(version)
+        eq_(get_version('test:version'), version)
+
+    def test_bump_version(self):
+        version = get_version('test:version')
+        bump_version('test:version')
+        eq_(get_version('test:version'), version + 1)
+
+    @patch('mozillians.common.versions.time.time')
+    def test_bump_missing_version(self, time_mock):
+        time_mock.return_value = 1000
+        bump_version('test:version')
+        eq_(cache.get('test:version'), 1000)
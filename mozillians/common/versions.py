@@ -0,0 +1,31 @@
+"""Version counters kept in the cache.
+
+A version tells processes whether something they hold, or a value
+cached under a key that includes it, is out of date: bumping it makes
+them all drop their copy at once. Versions start at the current time,
+so that a version evicted from the cache never comes back with a value
+that was already used.
+
+"""
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    """Return the version stored under key, starting one if there is none."""
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time())
+        if not cache.add(key, version):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(key, timeout=None):
+    """Change the version stored under key."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        # No version yet, or it was evicted.
+        cache.set(key, int(time.time()), timeout)
@@ -1,17 +1,22 @@
+from datetime import datetime
+
 from django.contrib import admin
 
 from models import FunFact
 
 
 class FunFactAdmin(admin.ModelAdmin):
-    readonly_fields = ['result', 'created', 'updated']
-    list_display = ['name', 'created', 'updated', 'result', 'is_published']
+    readonly_fields = ['result', 'computed', 'created', 'updated']
+    list_display = ['name', 'created', 'updated', 'result', 'computed',
+                    'is_published']
 
     def is_published(self, obj):
         return obj.published
     is_published.boolean = True
 
-    def result(self, obj):
-        return obj.execute()
+    def save_model(self, request, obj, form, change):
+        obj.result = obj.execute()
+        obj.computed = datetime.now()
+        super(FunFactAdmin, self).save_model(request, obj, form, change)
 
 admin.site.register(FunFact, FunFactAdmin)
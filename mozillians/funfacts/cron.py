@@ -1,22 +1,29 @@
 import logging
+from datetime import datetime
 
-from django.core.exceptions import ValidationError
 from cronjobs import register
 
-from models import FunFact, _validate_query
+from models import FunFact, compute_results, invalidate_funfacts
 
 logger = logging.getLogger('facts')
 
 
 @register
-def validate_fun_facts():
-    """Validate all published facts and unpublish those failing."""
-    for fact in FunFact.objects.published():
-        try:
-            _validate_query(fact.number)
-            if fact.divisor:
-                _validate_query(fact.divisor)
-        except ValidationError:
-            logger.error('Unpublishing fact "%s"' % fact.name)
-            fact.published = False
-            fact.save()
+def update_fun_facts():
+    """Compute and store the results of all published facts.
+
+    Results are otherwise only computed when a fact is saved in the
+    admin, so facts changed with update() or other bulk paths keep
+    their old result until this runs. Facts failing to compute are
+    unpublished.
+    """
+    facts = list(FunFact.objects.published())
+    results = compute_results(facts)
+    now = datetime.now()
+    for fact in facts:
+        values = {'result': results[fact.id], 'computed': now}
+        if values['result'].startswith('Error'):
+            logger.error('Unpublishing fact "%s": %s' % (fact.name, values['result']))
+            values['published'] = False
+        FunFact.objects.filter(id=fact.id).update(**values)
+    invalidate_funfacts(FunFact)
@@ -1,11 +1,28 @@
+import random
+
 from jingo import register
 
-from models import FunFact
+from mozillians.common.versions import get_version
+from models import FUNFACTS_VERSION_KEY, FunFact
+
+
+# The published fun facts of this process, as (version, funfacts).
+_local = {}
 
 
 @register.function
 def random_funfact():
-    """Returns random funfact or None."""
-    if FunFact.objects.published().count():
-        return FunFact.objects.random()
+    """Returns random funfact or None.
+
+    The published funfacts are kept in the process until one is changed.
+    Their results are the ones last stored by the update_fun_facts cron
+    job or an admin save, see FunFact.result.
+    """
+    version = get_version(FUNFACTS_VERSION_KEY)
+    cached_version, funfacts = _local.get('published', (None, None))
+    if cached_version != version:
+        funfacts = list(FunFact.objects.published().exclude(computed=None))
+        _local['published'] = (version, funfacts)
+    if funfacts:
+        return random.choice(funfacts)
     return None
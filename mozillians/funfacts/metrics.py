@@ -0,0 +1,107 @@
+"""Named aggregate metrics for fun facts.
+
+Fun facts can use a metric instead of a query. A metric is referenced
+by its name, followed by an argument for the metrics that take one,
+e.g. ``vouched`` or ``vouched_in_country:gr``.
+
+Every metric is a function that takes the list of arguments it is
+referenced with and returns their values in a dict, so that evaluate()
+answers all references of one metric with a single query, whatever
+their arguments.
+
+"""
+from collections import defaultdict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count
+
+from mozillians.groups.models import Group, GroupMembership, Skill
+from mozillians.users.models import UserProfile
+
+
+METRICS = {}
+
+
+def register(name, takes_argument=False):
+    """Register a metric function under name."""
+    def decorate(func):
+        METRICS[name] = (func, takes_argument)
+        return func
+    return decorate
+
+
+def parse(reference):
+    """Return the name and argument of a metric reference."""
+    name, _, argument = reference.partition(':')
+    if name not in METRICS:
+        raise ValueError('Unknown metric "%s"' % name)
+    if METRICS[name][1] != bool(argument):
+        raise ValueError('Metric "%s" takes %s argument'
+                         % (name, 'an' if METRICS[name][1] else 'no'))
+    return name, argument or None
+
+
+def validate_metric(reference):
+    try:
+        parse(reference)
+    except ValueError, exp:
+        raise ValidationError('Invalid metric: %s' % exp)
+
+
+def evaluate(references):
+    """Return the values of metric references, as a dict keyed by reference."""
+    arguments = defaultdict(set)
+    for reference in references:
+        name, argument = parse(reference)
+        arguments[name].add(argument)
+
+    values = {}
+    for name, name_arguments in arguments.items():
+        func = METRICS[name][0]
+        results = func(sorted(name_arguments))
+        for argument in name_arguments:
+            reference = name if argument is None else '%s:%s' % (name, argument)
+            values[reference] = results.get(argument, 0)
+    return values
+
+
+@register('complete')
+def complete(arguments):
+    """Number of complete profiles."""
+    return {None: UserProfile.objects.complete().count()}
+
+
+@register('vouched')
+def vouched(arguments):
+    """Number of vouched profiles."""
+    return {None: UserProfile.objects.vouched().count()}
+
+
+@register('vouched_in_country', takes_argument=True)
+def vouched_in_country(countries):
+    """Number of vouched profiles per country code.
+
+    Counted from the profiles, not from Location.vouched_count, which
+    can lag until the refresh_location_counts cron job runs.
+    """
+    counts = dict(UserProfile.objects.vouched()
+                  .filter(country__in=[c.lower() for c in countries])
+                  .order_by().values_list('country').annotate(Count('id')))
+    return dict((country, counts.get(country.lower(), 0)) for country in countries)
+
+
+@register('group_members', takes_argument=True)
+def group_members(names):
+    """Number of members per group name."""
+    counts = dict(Group.objects.filter(name__in=[name.lower() for name in names],
+                                       groupmembership__status=GroupMembership.MEMBER)
+                  .order_by().values_list('name').annotate(Count('groupmembership')))
+    return dict((name, counts.get(name.lower(), 0)) for name in names)
+
+
+@register('skill_members', takes_argument=True)
+def skill_members(names):
+    """Number of profiles per skill name."""
+    counts = dict(Skill.objects.filter(name__in=[name.lower() for name in names])
+                  .order_by().values_list('name').annotate(Count('members')))
+    return dict((name, counts.get(name.lower(), 0)) for name in names)
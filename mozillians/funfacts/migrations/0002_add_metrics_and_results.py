@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'FunFact.metric'
+        db.add_column('funfacts_funfact', 'metric',
+                      self.gf('django.db.models.fields.CharField')(default='', max_length=255, blank=True),
+                      keep_default=False)
+
+        # Adding field 'FunFact.divisor_metric'
+        db.add_column('funfacts_funfact', 'divisor_metric',
+                      self.gf('django.db.models.fields.CharField')(default='', max_length=255, blank=True),
+                      keep_default=False)
+
+        # Adding field 'FunFact.result'
+        db.add_column('funfacts_funfact', 'result',
+                      self.gf('django.db.models.fields.CharField')(default='', max_length=255, blank=True),
+                      keep_default=False)
+
+        # Adding field 'FunFact.computed'
+        db.add_column('funfacts_funfact', 'computed',
+                      self.gf('django.db.models.fields.DateTimeField')(null=True, blank=True),
+                      keep_default=False)
+
+
+    def backwards(self, orm):
+        # Deleting field 'FunFact.metric'
+        db.delete_column('funfacts_funfact', 'metric')
+
+        # Deleting field 'FunFact.divisor_metric'
+        db.delete_column('funfacts_funfact', 'divisor_metric')
+
+        # Deleting field 'FunFact.result'
+        db.delete_column('funfacts_funfact', 'result')
+
+        # Deleting field 'FunFact.computed'
+        db.delete_column('funfacts_funfact', 'computed')
+
+
+    models = {
+        'funfacts.funfact': {
+            'Meta': {'ordering': "['created']", 'object_name': 'FunFact'},
+            'computed': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'divisor': ('django.db.models.fields.TextField', [], {'max_length': '1000', 'null': 'True', 'blank': 'True'}),
+            'divisor_metric': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'metric': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255', 'blank': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'number': ('django.db.models.fields.TextField', [], {'default': "''", 'max_length': '1000', 'blank': 'True'}),
+            'public_text': ('django.db.models.fields.TextField', [], {}),
+            'published': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'result': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '255', 'blank': 'True'}),
+            'updated': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'})
+        }
+    }
+
+    complete_apps = ['funfacts']
@@ -1,15 +1,23 @@
-# Unused imports for user-defined queries to execute.
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
+from django.db.models import signals as dbsignals
+from django.dispatch import receiver
+# Unused imports for user-defined queries to execute.
 from django.db.models import Count, Avg, Min, Max  # noqa
 
 import bleach
 
+from mozillians.common.versions import bump_version
+from mozillians.funfacts import metrics
+from mozillians.funfacts.metrics import validate_metric
 from mozillians.groups.models import Group, Skill  # noqa
 from mozillians.mozspaces.models import MozSpace  # noqa
 from mozillians.users.models import Language, UserProfile  # noqa
 
 ALLOWED_TAGS = ['em', 'strong']
+# Version of the fun facts, changed on every save or delete, which tells
+# processes to drop the published fun facts they hold.
+FUNFACTS_VERSION_KEY = 'funfacts:version'
 
 
 def _validate_query(query):
@@ -54,9 +62,18 @@ class FunFact(models.Model):
                                     choices=((True, 'Published'),
                                              (False, 'Unpublished')))
     public_text = models.TextField()
-    number = models.TextField(max_length=1000, validators=[_validate_query])
+    number = models.TextField(max_length=1000, blank=True, default='',
+                              validators=[_validate_query])
     divisor = models.TextField(max_length=1000, blank=True, null=True,
                                validators=[_validate_query])
+    metric = models.CharField(
+        max_length=255, blank=True, default='', validators=[validate_metric],
+        help_text='Metric to use instead of the number query, e.g. vouched_in_country:gr')
+    divisor_metric = models.CharField(
+        max_length=255, blank=True, default='', validators=[validate_metric],
+        help_text='Metric to use instead of the divisor query')
+    result = models.CharField(max_length=255, blank=True, default='', editable=False)
+    computed = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ['created']
@@ -67,19 +84,56 @@ class FunFact(models.Model):
     def clean(self):
         self.public_text = bleach.clean(self.public_text, tags=ALLOWED_TAGS,
                                         strip=True)
+        if not (self.number or self.metric):
+            raise ValidationError('Either a number query or a metric is required.')
+
+    def metric_references(self):
+        return [reference for reference in [self.metric, self.divisor_metric]
+                if reference]
+
+    def _compute(self, metric_values):
+        def value(metric, query):
+            if metric:
+                return metric_values[metric]
+            return eval(query)['number']
+
+        if self.divisor or self.divisor_metric:
+            number = value(self.metric, self.number)
+            divisor = value(self.divisor_metric, self.divisor)
+            return '%.0f%%' % (float(number) / divisor * 100)
+        return '%d' % value(self.metric, self.number)
 
     def execute(self):
-        if not (self.divisor or self.number):
+        if not (self.divisor or self.number or self.metric):
             return 'n/a'
+        return compute_results([self])[self.id]
+
+
+def compute_results(facts):
+    """Return the formatted results of facts, keyed by fact id.
+
+    All facts are evaluated in one transaction, which is rolled back
+    since queries are user-defined, and the metrics they use are
+    evaluated together. Facts failing to compute get an error result.
+    """
+    results = {}
+    with transaction.commit_manually():
+        try:
+            metric_values = metrics.evaluate(
+                [reference for fact in facts for reference in fact.metric_references()])
+            for fact in facts:
+                try:
+                    results[fact.id] = fact._compute(metric_values)
+                except Exception, exp:
+                    results[fact.id] = 'Error: %s' % exp
+        finally:
+            transaction.rollback()
+    return results
+
 
-        with transaction.commit_manually():
-            try:
-                if self.divisor:
-                    number = eval(self.number)['number']
-                    divisor = eval(self.divisor)['number']
-                    return '%.0f%%' % (float(number) / divisor * 100)
-                return '%d' % eval(self.number)['number']
-            except Exception, exp:
-                return 'Error: %s' % exp
-            finally:
-                transaction.rollback()
+@receiver(dbsignals.post_save, sender=FunFact,
+          dispatch_uid='invalidate_funfacts_save_sig')
+@receiver(dbsignals.post_delete, sender=FunFact,
+          dispatch_uid='invalidate_funfacts_delete_sig')
+def invalidate_funfacts(sender, **kwargs):
+    bump_version(FUNFACTS_VERSION_KEY)
@@ -1,30 +1,38 @@
-from mock import call, patch
-from nose.tools import eq_
+from django.db import transaction
+
+from mock import patch
+from nose.tools import eq_, ok_
 from test_utils import TestCase
 
-from mozillians.funfacts.cron import validate_fun_facts
-from mozillians.funfacts.models import FunFact, _validate_query
+from mozillians.funfacts.cron import update_fun_facts
+from mozillians.funfacts.models import FunFact
 from mozillians.funfacts.tests import FunFactFactory
+from mozillians.users.tests import UserFactory
 
 
 class CronTests(TestCase):
-    @patch('mozillians.funfacts.cron._validate_query', wraps=_validate_query)
-    def test_cron_validator(self, validator_mock):
+    @patch('mozillians.funfacts.models.transaction', wraps=transaction)
+    def test_update_fun_facts(self, transaction_mock):
+        UserFactory.create(userprofile={'country': 'gr'})
+        UserFactory.create(userprofile={'country': 'it'})
         valid_fact_1 = FunFactFactory.create(published=True)
         valid_fact_2 = FunFactFactory.create(
-            published=True,
-            divisor='UserProfile.objects.aggregate(number=Count("id"))')
+            published=True, number='', metric='vouched_in_country:gr',
+            divisor_metric='vouched')
         invalid_fact_1 = FunFactFactory.create(published=True, number='invalid')
         invalid_fact_2 = FunFactFactory.create(published=True, divisor='invalid')
-        validate_fun_facts()
-        call_list = [call(valid_fact_1.number),
-                     call(valid_fact_2.number),
-                     call(valid_fact_2.divisor),
-                     call(invalid_fact_1.number),
-                     call(invalid_fact_2.number),
-                     call(invalid_fact_2.divisor)]
-        eq_(validator_mock.call_args_list, call_list)
-        invalid_fact_1 = FunFact.objects.get(id=invalid_fact_1.id)
-        invalid_fact_2 = FunFact.objects.get(id=invalid_fact_2.id)
-        eq_(invalid_fact_1.published, False)
-        eq_(invalid_fact_2.published, False)
+        unpublished_fact = FunFactFactory.create()
+        update_fun_facts()
+        transaction_mock.commit_manually.assert_called_once_with()
+        transaction_mock.rollback.assert_called_once_with()
+
+        valid_fact_1 = FunFact.objects.get(id=valid_fact_1.id)
+        eq_(valid_fact_1.result, '2')
+        ok_(valid_fact_1.computed)
+        valid_fact_2 = FunFact.objects.get(id=valid_fact_2.id)
+        eq_(valid_fact_2.result, '50%')
+        for fact in [invalid_fact_1, invalid_fact_2]:
+            fact = FunFact.objects.get(id=fact.id)
+            ok_(fact.result.startswith('Error'))
+            eq_(fact.published, False)
+        eq_(FunFact.objects.get(id=unpublished_fact.id).computed, None)
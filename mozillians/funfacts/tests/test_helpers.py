@@ -1,12 +1,17 @@
+from datetime import datetime
+
 from mock import patch
 from nose.tools import eq_
 from test_utils import TestCase
 
+from mozillians.funfacts import helpers
 from mozillians.funfacts.helpers import random_funfact
 from mozillians.funfacts.tests import FunFactFactory
 
 
 class HelperTests(TestCase):
+    def setUp(self):
+        helpers._local.clear()
 
     @patch('mozillians.funfacts.helpers.FunFact.objects')
     def test_helper_calls_random(self, funfact_mock):
@@ -16,3 +21,20 @@ class HelperTests(TestCase):
         """Test helper returns None when no published FunFacts."""
         FunFactFactory.create()
         eq_(random_funfact(), None)
+
+    def test_helper_cached(self):
+        funfact = FunFactFactory.create(published=True, computed=datetime.now())
+        eq_(random_funfact(), funfact)
+        with self.assertNumQueries(0):
+            eq_(random_funfact(), funfact)
+
+    def test_helper_invalidated(self):
+        funfact = FunFactFactory.create(computed=datetime.now())
+        eq_(random_funfact(), None)
+        funfact.published = True
+        funfact.save()
+        eq_(random_funfact(), funfact)
+
+    def test_helper_skips_not_computed(self):
+        FunFactFactory.create(published=True)
+        eq_(random_funfact(), None)
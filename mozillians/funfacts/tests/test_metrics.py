@@ -0,0 +1,44 @@
+from django.core.exceptions import ValidationError
+
+from nose.tools import assert_raises, eq_
+
+from mozillians.common.tests import TestCase
+from mozillians.funfacts import metrics
+from mozillians.groups.models import GroupMembership
+from mozillians.groups.tests import GroupFactory, SkillFactory
+from mozillians.users.tests import UserFactory
+
+
+class ParseTests(TestCase):
+    def test_parse(self):
+        eq_(metrics.parse('vouched'), ('vouched', None))
+        eq_(metrics.parse('vouched_in_country:gr'), ('vouched_in_country', 'gr'))
+
+    def test_validate_metric(self):
+        metrics.validate_metric('vouched')
+        assert_raises(ValidationError, metrics.validate_metric, 'foo')
+        assert_raises(ValidationError, metrics.validate_metric, 'vouched:gr')
+        assert_raises(ValidationError, metrics.validate_metric, 'vouched_in_country')
+
+
+class EvaluateTests(TestCase):
+    def test_evaluate(self):
+        user = UserFactory.create(userprofile={'country': 'gr'})
+        UserFactory.create(userprofile={'country': 'it'})
+        UserFactory.create(vouched=False, userprofile={'country': 'it'})
+        group = GroupFactory.create(name='webdev')
+        group.add_member(user.userprofile)
+        group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
+        skill = SkillFactory.create(name='python')
+        user.userprofile.skills.add(skill)
+
+        references = ['complete', 'vouched', 'vouched_in_country:gr',
+                      'vouched_in_country:it', 'vouched_in_country:fr',
+                      'group_members:webdev', 'skill_members:Python']
+        # One query per metric, whatever the number of arguments.
+        with self.assertNumQueries(5):
+            values = metrics.evaluate(references)
+        eq_(values, {'complete': 4, 'vouched': 3,
+                     'vouched_in_country:gr': 2, 'vouched_in_country:it': 1,
+                     'vouched_in_country:fr': 0, 'group_members:webdev': 1,
+                     'skill_members:Python': 1})
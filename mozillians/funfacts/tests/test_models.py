@@ -6,8 +6,9 @@ from mock import patch
 from nose.tools import assert_raises, eq_, ok_
 from test_utils import TestCase
 
-from mozillians.funfacts.models import FunFact, _validate_query
+from mozillians.funfacts.models import FunFact, _validate_query, compute_results
 from mozillians.funfacts.tests import FunFactFactory
+from mozillians.users.tests import UserFactory
 
 
 class ValidateQueryTests(TestCase):
@@ -79,3 +80,25 @@ class FunFactTests(TestCase):
         ok_(return_value.startswith('Error'))
         transaction_mock.commit_manually.assert_called_once_with()
         transaction_mock.rollback.assert_called_once_with()
+
+    def test_clean_requires_number_or_metric(self):
+        fact = FunFactFactory.create(number='')
+        assert_raises(ValidationError, fact.clean)
+        fact.metric = 'vouched'
+        fact.clean()
+
+    def test_execute_metric_funfact(self):
+        UserFactory.create()
+        fact = FunFactFactory.create(number='', metric='vouched')
+        eq_(fact.execute(), '1')
+
+    def test_compute_results_shares_metrics(self):
+        facts = [FunFactFactory.create(number='', metric='vouched_in_country:gr'),
+                 FunFactFactory.create(number='', metric='vouched_in_country:it',
+                                       divisor_metric='vouched_in_country:gr')]
+        with patch('mozillians.funfacts.metrics.UserProfile.objects') as objects_mock:
+            (objects_mock.vouched.return_value.filter.return_value.order_by.return_value
+             .values_list.return_value.annotate.return_value) = [('gr', 4), ('it', 2)]
+            results = compute_results(facts)
+        eq_(objects_mock.vouched.call_count, 1)
+        eq_(results, {facts[0].id: '4', facts[1].id: '50%'})
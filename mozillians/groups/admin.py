@@ -1,13 +1,16 @@
 from django import forms
 from django.contrib import admin
+from django.contrib import messages
 from django.contrib.admin import SimpleListFilter
 from django.contrib.admin.widgets import FilteredSelectMultiple
+from django.core.cache import cache
 from django.db.models import Count
 
 import autocomplete_light
 
 from mozillians.groups.models import (Group, GroupAlias, GroupMembership,
                                       Skill, SkillAlias)
+from mozillians.groups.tasks import MERGE_PROGRESS_KEY, merge_groups
 
 
 class EmptyGroupFilter(SimpleListFilter):
@@ -101,7 +104,10 @@ class GroupBaseEditAdminForm(forms.ModelForm):
         super(GroupBaseEditAdminForm, self).__init__(*args, **kwargs)
 
     def save(self, *args, **kwargs):
-        self.instance.merge_groups(self.cleaned_data.get('merge_with', []))
+        merge_with = self.cleaned_data.get('merge_with', [])
+        if merge_with:
+            merge_groups.delay(self._meta.model.__name__, self.instance.id,
+                               [group.id for group in merge_with])
         return super(GroupBaseEditAdminForm, self).save(*args, **kwargs)
 
 
@@ -131,6 +137,14 @@ class GroupBaseAdmin(admin.ModelAdmin):
         return obj.member_count
     member_count.admin_order_field = 'member_count'
 
+    def change_view(self, request, object_id, *args, **kwargs):
+        """Show the progress of a running merge into this group."""
+        key = MERGE_PROGRESS_KEY.format(model=self.model.__name__, pk=object_id)
+        progress = cache.get(key)
+        if progress and progress[0] < progress[1]:
+            messages.info(request, 'Merging groups: %d of %d done.' % progress)
+        return super(GroupBaseAdmin, self).change_view(request, object_id, *args, **kwargs)
+
     class Media:
         css = {
             'all': ('mozillians/css/admin.css',)
@@ -10,13 +10,13 @@ from tastypie.serializers import Serializer
 from mozillians.api.authenticators import AppAuthentication
 from mozillians.api.resources import (AdvancedSortingResourceMixIn,
                                       ClientCacheResourceMixIn,
-                                      GraphiteMixIn)
+                                      GraphiteMixIn, ThrottleMixIn)
 from mozillians.api.paginator import Paginator
 from mozillians.groups.models import Group, Skill
 
 
 class GroupBaseResource(AdvancedSortingResourceMixIn, ClientCacheResourceMixIn,
-                        GraphiteMixIn, ModelResource):
+                        GraphiteMixIn, ThrottleMixIn, ModelResource):
     number_of_members = fields.IntegerField(attribute='number_of_members',
                                             readonly=True)
 
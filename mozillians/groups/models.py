@@ -1,6 +1,8 @@
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import Q, signals as dbsignals
+from django.dispatch import receiver
 from django.utils.timezone import now
 
 from autoslug.fields import AutoSlugField
@@ -9,9 +11,14 @@ from funfactory.utils import absolutify
 from tower import ugettext as _
 from tower import ugettext_lazy as _lazy
 
+from mozillians.common.versions import bump_version, get_version
 from mozillians.groups.helpers import slugify
 from mozillians.groups.tasks import email_membership_change
-from mozillians.users.tasks import update_basket_task
+from mozillians.users.tasks import schedule_basket_update
+
+
+CURATED_GROUPS_VERSION_KEY = 'groups:curated:version'
+CURATED_GROUPS_KEY = 'groups:curated:{version}'
 
 
 class GroupBase(models.Model):
@@ -46,6 +53,36 @@ class GroupBase(models.Model):
         results = results.distinct()
         return results
 
+    @classmethod
+    def create_groups(cls, names):
+        """Create a group and its alias for every name in names.
+
+        Groups and aliases are inserted in bulk. Names that would
+        end up with the same alias url are created one by one, so
+        that the alias url field can keep them unique.
+
+        Returns a dictionary mapping each name to its new group.
+        """
+        names = set(name.lower() for name in names)
+        # The alias url is cropped to the length of its unique column.
+        max_length = cls.ALIAS_MODEL._meta.get_field('url').max_length
+        batch = dict((slugify(name)[:max_length], name) for name in names).values()
+
+        cls.objects.bulk_create([cls(name=name) for name in batch])
+        groups = dict((group.name, group)
+                      for group in cls.objects.filter(name__in=batch))
+        aliases = [cls.ALIAS_MODEL(name=name, alias=group)
+                   for name, group in groups.items()]
+        # The url of every alias is populated while it's inserted.
+        cls.ALIAS_MODEL.objects.bulk_create(aliases)
+        for alias in aliases:
+            cls.objects.filter(pk=alias.alias_id).update(url=alias.url)
+            groups[alias.name].url = alias.url
+
+        for name in names.difference(batch):
+            groups[name] = cls.objects.create(name=name)
+        return groups
+
     def save(self, *args, **kwargs):
         self.name = self.name.lower()
         super(GroupBase, self).save()
@@ -57,12 +94,39 @@ class GroupBase(models.Model):
     def __unicode__(self):
         return self.name
 
-    def merge_groups(self, group_list):
-        for group in group_list:
-            map(lambda x: self.add_member(x),
-                group.members.all())
-            group.aliases.update(alias=self)
-            group.delete()
+    def merge_groups(self, group_list, progress=None):
+        """Merge the groups in group_list into this group.
+
+        Members of every merged group are added to this group in bulk,
+        aliases are repointed to this group and the merged groups are
+        deleted. A Basket update is scheduled for every affected user
+        once everything is merged.
+
+        If given, progress is called with the number of groups merged
+        so far and the total number of groups after each merge.
+        """
+        group_list = list(group_list)
+        affected_ids = set()
+        with transaction.commit_on_success():
+            for done, group in enumerate(group_list, 1):
+                affected_ids |= self._merge_members(group)
+                group.aliases.update(alias=self)
+                group.delete()
+                if progress:
+                    progress(done, len(group_list))
+
+        for profile_id in sorted(affected_ids):
+            schedule_basket_update(profile_id)
+
+    def _merge_members(self, group):
+        """Add the members of group to this group.
+
+        Returns the set of ids of the newly added userprofiles.
+        """
+        member_ids = set(self.members.values_list('id', flat=True))
+        new_ids = set(group.members.values_list('id', flat=True)) - member_ids
+        self.members.add(*new_ids)
+        return new_ids
 
     def user_can_leave(self, userprofile):
         return (
@@ -73,8 +137,7 @@ class GroupBase(models.Model):
             getattr(self, 'curator', None) != userprofile
             and
             # only makes sense to leave a group they belong to (at least pending)
-            (self.has_member(userprofile=userprofile)
-             or self.has_pending_member(userprofile=userprofile))
+            self.membership_state(userprofile) is not None
         )
 
     def user_can_join(self, userprofile):
@@ -86,8 +149,7 @@ class GroupBase(models.Model):
             (getattr(self, 'accepting_new_members', 'yes') != 'no')
             and
             # only makes sense to join if not already a member (full or pending)
-            not (self.has_member(userprofile=userprofile)
-                 or self.has_pending_member(userprofile=userprofile))
+            self.membership_state(userprofile) is None
         )
 
     # Read-only properties so clients don't care which subclasses have some fields
@@ -95,13 +157,38 @@ class GroupBase(models.Model):
     def is_visible(self):
         return getattr(self, 'visible', True)
 
+    def membership_state(self, userprofile):
+        """
+        Return the status of userprofile in this group.
+
+        Returns GroupMembership.MEMBER, GroupMembership.PENDING or None
+        if the user is not in this group. The status is fetched once and
+        memoized on this instance, so that all permission checks for a
+        request share a single query.
+        """
+        if not hasattr(self, '_membership_states'):
+            self._membership_states = {}
+        if userprofile.id not in self._membership_states:
+            self._membership_states[userprofile.id] = self._get_membership_state(userprofile)
+        return self._membership_states[userprofile.id]
+
+    def _get_membership_state(self, userprofile):
+        if self.members.filter(pk=userprofile.pk).exists():
+            return GroupMembership.MEMBER
+        return None
+
+    def _forget_membership_state(self, userprofile):
+        getattr(self, '_membership_states', {}).pop(userprofile.id, None)
+
     def add_member(self, userprofile):
         self.members.add(userprofile)
-        update_basket_task.delay(userprofile.id)
+        self._forget_membership_state(userprofile)
+        schedule_basket_update(userprofile.id)
 
     def remove_member(self, userprofile):
         self.members.remove(userprofile)
-        update_basket_task.delay(userprofile.id)
+        self._forget_membership_state(userprofile)
+        schedule_basket_update(userprofile.id)
 
     def has_member(self, userprofile):
         return self.members.filter(user=userprofile.user).exists()
@@ -225,6 +312,21 @@ class Group(GroupBase):
         """Return all non-functional areas that are curated."""
         return cls.get_non_functional_areas(curator__isnull=False)
 
+    @classmethod
+    def get_curated_names(cls):
+        """
+        Return a list of (id, name) tuples of all curated groups.
+
+        The list is cached under a version which is bumped every time a
+        group is saved or deleted, see invalidate_curated_groups().
+        """
+        key = CURATED_GROUPS_KEY.format(version=get_version(CURATED_GROUPS_VERSION_KEY))
+        curated = cache.get(key)
+        if curated is None:
+            curated = list(cls.objects.exclude(curator=None).values_list('id', 'name'))
+            cache.set(key, curated)
+        return curated
+
     @classmethod
     def search(cls, query):
         results = super(Group, cls).search(query)
@@ -234,16 +336,55 @@ class Group(GroupBase):
     def get_absolute_url(self):
         return absolutify(reverse('groups:show_group', args=[self.url]))
 
-    def merge_groups(self, group_list):
-        for membership in GroupMembership.objects.filter(group__in=group_list):
-            # add_member will never demote someone, so just add them with the current membership
-            # level from the merging group and they'll end up with the highest level from
-            # either group.
-            self.add_member(membership.userprofile, membership.status)
+    def _merge_members(self, group):
+        """Add the memberships of group to this group.
+
+        Like add_member(), this never demotes anyone: users end up
+        with the highest status they had in either group, so pending
+        members of this group who are full members of the merged
+        group get promoted.
 
-        for group in group_list:
-            group.aliases.update(alias=self)
-            group.delete()
+        Bulk inserts and updates send no signals, so the changes of
+        the affected profiles are logged and their versions bumped here.
+
+        Returns the set of ids of the userprofiles that became full
+        members of this group.
+        """
+        current = dict(self.groupmembership_set.values_list('userprofile_id', 'status'))
+        memberships = (GroupMembership.objects.filter(group=group)
+                       .values_list('userprofile_id', 'userprofile__user_id', 'status'))
+
+        new_memberships = []
+        promoted = {}
+        for profile_id, user_id, status in memberships:
+            if profile_id not in current:
+                new_memberships.append(
+                    GroupMembership(group=self, userprofile_id=profile_id,
+                                    status=status, date_joined=now()))
+            elif (current[profile_id], status) == (GroupMembership.PENDING,
+                                                   GroupMembership.MEMBER):
+                promoted[profile_id] = user_id
+
+        GroupMembership.objects.bulk_create(new_memberships)
+        if promoted:
+            (self.groupmembership_set.filter(userprofile__in=promoted.keys())
+             .update(status=GroupMembership.MEMBER))
+            for user_id in promoted.values():
+                email_membership_change.delay(self.pk, user_id, GroupMembership.PENDING,
+                                              GroupMembership.MEMBER)
+
+        changed_ids = ([membership.userprofile_id for membership in new_memberships]
+                       + promoted.keys())
+        # mozillians.users.models imports this module.
+        from mozillians.users.models import ProfileChange, invalidate_profile_version
+        ProfileChange.objects.bulk_create(
+            [ProfileChange(userprofile_id=profile_id, change_type=ProfileChange.MEMBERSHIP)
+             for profile_id in changed_ids])
+        invalidate_profile_version(changed_ids)
+
+        return (set(membership.userprofile_id for membership in new_memberships
+                    if membership.status == GroupMembership.MEMBER)
+                | set(promoted))
 
     def add_member(self, userprofile, status=GroupMembership.MEMBER):
         """
@@ -254,6 +395,7 @@ class Group(GroupBase):
         If user is already in the group with a different status, their status will
         be updated if the change is a promotion. Otherwise, their status will not change.
         """
+        self._forget_membership_state(userprofile)
         defaults = dict(status=status,
                         date_joined=now())
         membership, created = GroupMembership.objects.get_or_create(userprofile=userprofile,
@@ -262,7 +404,7 @@ class Group(GroupBase):
         if created:
             if status == GroupMembership.MEMBER:
                 # Joined
-                update_basket_task.delay(userprofile.id)
+                schedule_basket_update(userprofile.id)
         elif not created and membership.status != status:
             # Status changed
             old_status = membership.status
@@ -270,23 +412,29 @@ class Group(GroupBase):
             if (old_status, status) == (GroupMembership.PENDING, GroupMembership.MEMBER):
                 # Request accepted
                 membership.save()
-                update_basket_task.delay(userprofile.id)
+                schedule_basket_update(userprofile.id)
                 email_membership_change.delay(self.pk, userprofile.user.pk, old_status, status)
             # else? never demote people from full member to requested, that doesn't make sense
 
     def remove_member(self, userprofile, send_email=True):
-        try:
-            membership = GroupMembership.objects.get(group=self, userprofile=userprofile)
-        except GroupMembership.DoesNotExist:
+        # Memberships can be created without going through this
+        # instance, so the memoized state is not trusted for writes.
+        self._forget_membership_state(userprofile)
+        old_status = self._get_membership_state(userprofile)
+        if old_status is None:
             return
-        old_status = membership.status
-        membership.delete()
-        update_basket_task.delay(userprofile.id)
+        self.groupmembership_set.filter(userprofile=userprofile).delete()
+        schedule_basket_update(userprofile.id)
         if old_status == GroupMembership.PENDING and send_email:
             # Request denied
             email_membership_change.delay(self.pk, userprofile.user.pk,
                                           old_status, None)
 
+    def _get_membership_state(self, userprofile):
+        statuses = list(self.groupmembership_set.filter(userprofile=userprofile)
+                         .values_list('status', flat=True)[:1])
+        return statuses[0] if statuses else None
+
     def has_member(self, userprofile):
         """
         Return True if this user is in this group with status MEMBER.
@@ -338,3 +486,17 @@ class SkillAlias(GroupAliasBase):
 
 class Skill(GroupBase):
     ALIAS_MODEL = SkillAlias
+
+
+@receiver(dbsignals.post_save, sender=Group,
+          dispatch_uid='invalidate_curated_groups_save_sig')
+@receiver(dbsignals.post_delete, sender=Group,
+          dispatch_uid='invalidate_curated_groups_delete_sig')
+def invalidate_curated_groups(sender, **kwargs):
+    """Invalidate the cached list of curated groups.
+
+    Creating, renaming or deleting a group or changing its curator all
+    go through here, since they all save or delete the group. So does
+    deleting a profile, which may remove the curator of groups.
+    """
+    bump_version(CURATED_GROUPS_VERSION_KEY)
@@ -1,6 +1,8 @@
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
+from django.core.cache import cache
+from django.core.mail import get_connection, send_mail, send_mass_mail
+from django.db import connection, transaction
 from django.db.models import Count, Max
 from django.db.models.loading import get_model
 from django.template import Context
@@ -8,9 +10,15 @@ from django.template.loader import get_template, render_to_string
 
 import tower
 from celery.task import task
+from celeryutils import chunked
 from tower import ugettext as _
 
 
+MERGE_PROGRESS_KEY = 'groups:merge_progress:{model}:{pk}'
+MERGE_PROGRESS_TIMEOUT = 60 * 60
+REMINDER_BATCH_SIZE = 100
+
+
 @task(ignore_result=True)
 def remove_empty_groups():
     """Remove empty groups."""
@@ -22,6 +30,25 @@ def remove_empty_groups():
          .annotate(mcount=Count('members')).filter(mcount=0).delete())
 
 
+@task(ignore_result=True)
+def merge_groups(model_name, group_pk, merged_pks):
+    """Merge the groups or skills with pks in merged_pks into group_pk.
+
+    Queued from the admin, so that merging large groups doesn't time
+    out the request. Progress is stored in the cache under
+    MERGE_PROGRESS_KEY as a (merged, total) tuple.
+    """
+    model = get_model('groups', model_name)
+    group = model.objects.get(pk=group_pk)
+    key = MERGE_PROGRESS_KEY.format(model=model_name, pk=group_pk)
+
+    def progress(done, total):
+        cache.set(key, (done, total), MERGE_PROGRESS_TIMEOUT)
+
+    progress(0, len(merged_pks))
+    group.merge_groups(model.objects.filter(pk__in=merged_pks), progress=progress)
+
+
 # TODO: Schedule this task nightly
 
 @task(ignore_result=True)
@@ -30,25 +57,36 @@ def send_pending_membership_emails():
     For each curated group that has pending memberships that the curator has not yet been
     emailed about, send the curator an email with the count of all pending memberships
     and a link to view and manage the requests.
+
+    Groups, curators, pending counts and the max pk of pending memberships are fetched
+    in a single query. Emails are sent in batches of REMINDER_BATCH_SIZE over one mail
+    connection, and max_reminder is updated with one statement per batch.
     """
     Group = get_model('groups', 'Group')
     GroupMembership = get_model('groups', 'GroupMembership')
 
-    # Curated groups that have pending membership requests
-    groups = Group.objects.exclude(curator__isnull=True)
-    groups = groups.filter(groupmembership__status=GroupMembership.PENDING).distinct()
-
-    for group in groups:
-        # what's the max pk of pending memberships?
-        pending_memberships = group.groupmembership_set.filter(status=GroupMembership.PENDING)
-        max_pk = pending_memberships.aggregate(max_pk=Max('pk'))['max_pk']
-        # Only send reminder if there are newer requests than we'd previously reminded about
-        if max_pk > group.max_reminder:
-            # TODO: Switch locale to curator's preferred language so translation will occur
-            # Using English for now
-            tower.activate('en-us')
-
-            count = pending_memberships.count()
+    # Curated groups that have pending membership requests, annotated
+    # with the count and max pk of pending memberships only.
+    groups = (Group.objects.exclude(curator__isnull=True)
+              .filter(groupmembership__status=GroupMembership.PENDING)
+              .annotate(pending_count=Count('groupmembership'),
+                        max_pk=Max('groupmembership__pk'))
+              .select_related('curator__user'))
+
+    # Only send reminder if there are newer requests than we'd previously reminded about
+    groups = [group for group in groups if group.max_pk > group.max_reminder]
+    if not groups:
+        return
+
+    # TODO: Switch locale to curator's preferred language so translation will occur
+    # Using English for now
+    tower.activate('en-us')
+
+    mail_connection = get_connection()
+    for batch in chunked(groups, REMINDER_BATCH_SIZE):
+        messages = []
+        for group in batch:
+            count = group.pending_count
             subject = tower.ungettext(
                 '%(count)d outstanding request to join Mozillians group "%(name)s"',
                 '%(count)d outstanding requests to join Mozillians group "%(name)s"',
@@ -61,12 +99,33 @@ def send_pending_membership_emails():
                 'group': group,
                 'count': count,
             })
+            messages.append((subject, body, settings.FROM_NOREPLY,
+                             [group.curator.user.email]))
 
-            send_mail(subject, body, settings.FROM_NOREPLY,
-                      [group.curator.user.email], fail_silently=False)
+        send_mass_mail(messages, fail_silently=False,
+                       connection=mail_connection)
+        _update_max_reminder(batch)
+
+
+def _update_max_reminder(groups):
+    """Set max_reminder of groups to the max_pk they were annotated with.
+
+    A single UPDATE sets every group to its own annotated max_pk, the
+    highest pk we reminded about, so that requests made in the meantime
+    are still reminded about next time.
+    """
+    Group = get_model('groups', 'Group')
 
-            group.max_reminder = max_pk
-            group.save()
+    qn = connection.ops.quote_name
+    sql = ('UPDATE {group} SET max_reminder = CASE {group}.id {cases} END '
+           'WHERE {group}.id IN ({ids})').format(
+               group=qn(Group._meta.db_table),
+               cases=' '.join(['WHEN %s THEN %s'] * len(groups)),
+               ids=', '.join(['%s'] * len(groups)))
+    params = ([value for group in groups for value in (group.id, group.max_pk)]
+              + [group.id for group in groups])
+    connection.cursor().execute(sql, params)
+    transaction.commit_unless_managed()
 
 
 @task(ignore_result=True)
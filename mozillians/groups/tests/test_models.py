@@ -2,12 +2,14 @@
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 
+from mock import Mock, patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
 from mozillians.groups.models import Group, GroupAlias, GroupMembership
 from mozillians.groups.tests import (GroupAliasFactory, GroupFactory,
                                      SkillFactory)
+from mozillians.users.models import ProfileChange
 from mozillians.users.tests import UserFactory
 
 
@@ -24,6 +26,28 @@ class GroupBaseTests(TestCase):
         group = GroupFactory.create()
         ok_(group.url)
 
+    def test_create_groups(self):
+        groups = Group.create_groups(['Foo', 'bar'])
+        eq_(set(groups), set(['foo', 'bar']))
+        for name, group in groups.items():
+            eq_(group.name, name)
+            alias = GroupAlias.objects.get(alias=group)
+            eq_(alias.name, name)
+            eq_(Group.objects.get(pk=group.pk).url, alias.url)
+
+    def test_create_groups_clashing_urls(self):
+        groups = Group.create_groups(['foo', 'foo+'])
+        eq_(Group.objects.filter(pk__in=[g.pk for g in groups.values()])
+            .values_list('url', flat=True).distinct().count(), 2)
+
+    def test_create_groups_clashing_cropped_urls(self):
+        # Transliterated names share the first 50 characters of their
+        # slug, the length alias urls are cropped to.
+        prefix = u'\u5317' * 15
+        groups = Group.create_groups([prefix + u'a', prefix + u'b'])
+        eq_(Group.objects.filter(pk__in=[g.pk for g in groups.values()])
+            .values_list('url', flat=True).distinct().count(), 2)
+
     def test_merge_groups(self):
         master_group = GroupFactory.create()
         merge_group_1 = GroupFactory.create()
@@ -74,6 +98,42 @@ class GroupBaseTests(TestCase):
         # user5 pending in both, and is still pending
         ok_(master_group.has_pending_member(user5.userprofile))
 
+    @patch('mozillians.groups.models.schedule_basket_update')
+    def test_merge_groups_schedules_basket_updates(self, schedule_mock):
+        master_group = GroupFactory.create()
+        merge_group = GroupFactory.create()
+        user_1 = UserFactory.create()
+        user_2 = UserFactory.create()
+        merge_group.add_member(user_1.userprofile)
+        merge_group.add_member(user_2.userprofile, GroupMembership.PENDING)
+        progress = Mock()
+
+        master_group.merge_groups([merge_group], progress=progress)
+
+        schedule_mock.assert_called_once_with(user_1.userprofile.id)
+        progress.assert_called_once_with(1, 1)
+
+    @patch('mozillians.users.models.invalidate_profile_version')
+    def test_merge_groups_logs_membership_changes(self, invalidate_mock):
+        master_group = GroupFactory.create()
+        merge_group = GroupFactory.create()
+        user_1 = UserFactory.create()
+        user_2 = UserFactory.create()
+        master_group.add_member(user_2.userprofile, GroupMembership.PENDING)
+        merge_group.add_member(user_1.userprofile)
+        merge_group.add_member(user_2.userprofile)
+        changes = ProfileChange.objects.filter(change_type=ProfileChange.MEMBERSHIP)
+        last_id = changes.order_by('-id')[0].id
+
+        master_group.merge_groups([merge_group])
+
+        # One row for the deleted membership in merge_group and one for
+        # the membership in master_group, for each of the users.
+        for user in [user_1, user_2]:
+            eq_(changes.filter(id__gt=last_id,
+                               userprofile_id=user.userprofile.id).count(), 2)
+        invalidate_mock.assert_any_call([user_1.userprofile.id, user_2.userprofile.id])
+
     def test_search(self):
         group = GroupFactory.create(visible=True)
         GroupFactory.create(visible=False)
@@ -212,6 +272,40 @@ class GroupTests(TestCase):
         GroupFactory.create(functional_area=False)
         eq_(set(Group.get_functional_areas()), set([cgroup_1]))
 
+    def test_get_curated_names(self):
+        curator = UserFactory.create()
+        group = GroupFactory.create(curator=curator.userprofile)
+        GroupFactory.create()
+        eq_(Group.get_curated_names(), [(group.id, group.name)])
+        with self.assertNumQueries(0):
+            Group.get_curated_names()
+
+    def test_get_curated_names_invalidation(self):
+        curator = UserFactory.create()
+        group = GroupFactory.create(curator=curator.userprofile)
+        other_group = GroupFactory.create()
+        Group.get_curated_names()
+
+        group.name = 'renamed'
+        group.save()
+        eq_(Group.get_curated_names(), [(group.id, 'renamed')])
+
+        other_group.curator = curator.userprofile
+        other_group.save()
+        eq_(set(Group.get_curated_names()),
+            set([(group.id, 'renamed'), (other_group.id, other_group.name)]))
+
+        group.delete()
+        eq_(Group.get_curated_names(), [(other_group.id, other_group.name)])
+
+    def test_get_curated_names_deleted_curator(self):
+        curator = UserFactory.create()
+        GroupFactory.create(curator=curator.userprofile)
+        Group.get_curated_names()
+
+        curator.userprofile.delete()
+        eq_(Group.get_curated_names(), [])
+
     def test_deleted_curator_sets_null(self):
         user = UserFactory.create()
         group = GroupFactory.create(curator=user.userprofile)
@@ -255,6 +349,35 @@ class GroupTests(TestCase):
         group.remove_member(user.userprofile)
         ok_(not group.has_member(user.userprofile))
 
+    def test_remove_member_ignores_memoized_state(self):
+        user = UserFactory.create()
+        group = GroupFactory.create()
+        eq_(group.membership_state(user.userprofile), None)
+        GroupMembership.objects.create(group=group, userprofile=user.userprofile,
+                                       status=GroupMembership.MEMBER)
+        group.remove_member(user.userprofile, send_email=False)
+        ok_(not group.has_member(user.userprofile))
+
+    def test_membership_state(self):
+        user = UserFactory.create()
+        group = GroupFactory.create()
+        eq_(group.membership_state(user.userprofile), None)
+        group.add_member(user.userprofile, GroupMembership.PENDING)
+        eq_(group.membership_state(user.userprofile), GroupMembership.PENDING)
+        group.add_member(user.userprofile)
+        eq_(group.membership_state(user.userprofile), GroupMembership.MEMBER)
+        group.remove_member(user.userprofile)
+        eq_(group.membership_state(user.userprofile), None)
+
+    def test_membership_state_is_memoized(self):
+        user = UserFactory.create()
+        group = GroupFactory.create()
+        group.add_member(user.userprofile)
+        with self.assertNumQueries(1):
+            group.membership_state(user.userprofile)
+            group.user_can_join(user.userprofile)
+            group.user_can_leave(user.userprofile)
+
 
 class GroupAliasBaseTests(TestCase):
     def test_auto_slug_field(self):
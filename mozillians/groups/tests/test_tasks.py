@@ -4,6 +4,7 @@ from mozillians.groups.tasks import email_membership_change
 from nose.tools import eq_, ok_
 
 from django.conf import settings
+from django.core.cache import cache
 
 from mozillians.common.tests import TestCase
 from mozillians.groups import tasks
@@ -42,14 +43,15 @@ class SendPendingMembershipEmailsTests(TestCase):
         group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
         group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
 
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             tasks.send_pending_membership_emails()
-        ok_(mock_send_mail.called)
+        ok_(mock_send_mass_mail.called)
         # Should only have been called once
-        eq_(1, len(mock_send_mail.call_args_list))
+        eq_(1, len(mock_send_mass_mail.call_args_list))
+        eq_(1, len(mock_send_mass_mail.call_args[0][0]))
 
         # The message body should mention that there are 2 pending memberships
-        subject, body, from_addr, to_list = mock_send_mail.call_args[0]
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][0]
         eq_('2 outstanding requests to join Mozillians group "%s"' % group.name, subject)
         ok_('There are 2 outstanding requests' in body)
         # Full path to group page is in the message
@@ -59,9 +61,9 @@ class SendPendingMembershipEmailsTests(TestCase):
         # Add another pending membership
         group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
         # Should send email again
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             tasks.send_pending_membership_emails()
-        ok_(mock_send_mail.called)
+        ok_(mock_send_mass_mail.called)
 
     def test_sending_pending_email_singular(self):
         # If a curated group has exactly one pending membership, added since the reminder email
@@ -73,12 +75,12 @@ class SendPendingMembershipEmailsTests(TestCase):
         # Add one pending membership
         group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
 
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             tasks.send_pending_membership_emails()
-        ok_(mock_send_mail.called)
+        ok_(mock_send_mass_mail.called)
 
         # The message body should mention that there is 1 pending memberships
-        subject, body, from_addr, to_list = mock_send_mail.call_args[0]
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][0]
         eq_('1 outstanding request to join Mozillians group "%s"' % group.name, subject)
         ok_('There is 1 outstanding request' in body)
         # Full path to group page is in the message
@@ -106,18 +108,54 @@ class SendPendingMembershipEmailsTests(TestCase):
         group.add_member(user2.userprofile, GroupMembership.MEMBER)
 
         # None of this should trigger an email send
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             tasks.send_pending_membership_emails()
-        ok_(not mock_send_mail.called)
+        ok_(not mock_send_mass_mail.called)
 
     def test_sending_pending_email_non_curated(self):
         # If a non-curated group has a pending membership,  do not send anyone an email
         group = GroupFactory.create()
         user = UserFactory.create()
         group.add_member(user.userprofile, GroupMembership.PENDING)
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
+            tasks.send_pending_membership_emails()
+        ok_(not mock_send_mass_mail.called)
+
+    def test_sending_pending_emails_batched(self):
+        # Reminders for all curated groups go out in a single batch and
+        # max_reminder is updated for each of them.
+        group_1 = GroupFactory.create(curator=UserFactory.create().userprofile)
+        group_2 = GroupFactory.create(curator=UserFactory.create().userprofile)
+        group_1.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
+        group_2.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
+        group_2.add_member(UserFactory.create().userprofile, GroupMembership.MEMBER)
+
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             tasks.send_pending_membership_emails()
-        ok_(not mock_send_mail.called)
+        eq_(1, len(mock_send_mass_mail.call_args_list))
+        eq_(2, len(mock_send_mass_mail.call_args[0][0]))
+
+        for group in [group_1, group_2]:
+            max_pk = (GroupMembership.objects
+                      .filter(group=group, status=GroupMembership.PENDING)
+                      .order_by('-pk')[0].pk)
+            eq_(Group.objects.get(pk=group.pk).max_reminder, max_pk)
+
+    def test_update_max_reminder_per_group(self):
+        # Requests made after the groups were annotated are not marked
+        # as reminded about, even if another group of the batch has a
+        # higher max_pk.
+        group_1 = GroupFactory.create(curator=UserFactory.create().userprofile)
+        group_2 = GroupFactory.create(curator=UserFactory.create().userprofile)
+        group_1.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
+        group_2.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
+        for group in [group_1, group_2]:
+            group.max_pk = GroupMembership.objects.get(group=group).pk
+        group_1.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
+
+        tasks._update_max_reminder([group_1, group_2])
+        eq_(Group.objects.get(pk=group_1.pk).max_reminder, group_1.max_pk)
+        eq_(Group.objects.get(pk=group_2.pk).max_reminder, group_2.max_pk)
 
 
 class EmailMembershipChangeTests(TestCase):
@@ -158,3 +196,31 @@ class EmailMembershipChangeTests(TestCase):
         eq_([self.user.email], to_list)
         eq_('Not accepted to Mozillians group "%s"' % self.group.name, subject)
         ok_('You have not been accepted' in body)
+
+
+class MergeGroupsTests(TestCase):
+    def test_merge_groups(self):
+        group = GroupFactory.create()
+        merged_group_1 = GroupFactory.create()
+        merged_group_2 = GroupFactory.create()
+        user = UserFactory.create()
+        merged_group_1.add_member(user.userprofile)
+
+        tasks.merge_groups('Group', group.pk, [merged_group_1.pk, merged_group_2.pk])
+
+        ok_(group.has_member(user.userprofile))
+        ok_(not Group.objects.filter(pk__in=[merged_group_1.pk,
+                                             merged_group_2.pk]).exists())
+        key = tasks.MERGE_PROGRESS_KEY.format(model='Group', pk=group.pk)
+        eq_(cache.get(key), (2, 2))
+
+    def test_merge_skills(self):
+        skill = SkillFactory.create()
+        merged_skill = SkillFactory.create()
+        user = UserFactory.create()
+        merged_skill.members.add(user.userprofile)
+
+        tasks.merge_groups('Skill', skill.pk, [merged_skill.pk])
+
+        ok_(skill.has_member(user.userprofile))
+        ok_(not Skill.objects.filter(pk=merged_skill.pk).exists())
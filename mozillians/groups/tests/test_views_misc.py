@@ -21,7 +21,7 @@ class ToggleGroupSubscriptionTests(TestCase):
                                  kwargs={'url': self.group.url,
                                          'user_pk': self.user.userprofile.pk})
 
-    @patch('mozillians.groups.models.update_basket_task.delay')
+    @patch('mozillians.groups.models.schedule_basket_update')
     def test_group_subscription(self, basket_task_mock):
         with self.login(self.user) as client:
             client.post(self.join_url, follow=True)
@@ -29,7 +29,7 @@ class ToggleGroupSubscriptionTests(TestCase):
         ok_(group.members.filter(id=self.user.userprofile.id).exists())
         basket_task_mock.assert_called_with(self.user.userprofile.id)
 
-    @patch('mozillians.groups.models.update_basket_task.delay')
+    @patch('mozillians.groups.models.schedule_basket_update')
     def test_group_unsubscription(self, basket_task_mock):
         self.group.add_member(self.user.userprofile)
         with self.login(self.user) as client:
@@ -103,7 +103,8 @@ def show(request, url, alias_model, template):
 
     group = group_alias.alias
     profile = request.user.userprofile
-    in_group = group.has_member(profile)
+    membership_state = group.membership_state(profile)
+    in_group = membership_state == GroupMembership.MEMBER
 
     if alias_model is GroupAlias:
         # Curator?
@@ -125,7 +126,7 @@ def show(request, url, alias_model, template):
             profiles = group.get_annotated_members(statuses=[GroupMembership.MEMBER],
                                                    always_include=profile)
         # Is this user's membership pending?
-        is_pending = group.has_pending_member(profile)
+        is_pending = membership_state == GroupMembership.PENDING
     else:
         # not a Group
         profiles = group.members.all()
@@ -143,7 +144,12 @@ def show(request, url, alias_model, template):
     show_pagination = paginator.count > settings.ITEMS_PER_PAGE
 
     # Curator can delete their group if there are no other members.
-    show_delete_group_button = (is_curator or is_manager) and group.members.all().count() == 1
+    show_delete_group_button = False
+    if is_curator or is_manager:
+        # Unless filtered by status, curators and managers see everyone.
+        member_count = (group.members.count() if m_selected or r_selected
+                        else paginator.count)
+        show_delete_group_button = member_count == 1
 
     data = dict(people=people,
                 group=group,
@@ -152,8 +158,8 @@ def show(request, url, alias_model, template):
                 is_pending=is_pending,
                 show_pagination=show_pagination,
                 show_delete_group_button=show_delete_group_button,
-                show_join_button=group.user_can_join(request.user.userprofile),
-                show_leave_button=group.user_can_leave(request.user.userprofile),
+                show_join_button=group.user_can_join(profile),
+                show_leave_button=group.user_can_leave(profile),
                 m_selected=m_selected,
                 r_selected=r_selected,
                 )
@@ -226,16 +232,14 @@ def confirm_member(request, url, user_pk):
 
     if not (is_curator or is_manager):
         raise Http404()
-    try:
-        membership = GroupMembership.objects.get(group=group, userprofile=profile)
-    except GroupMembership.DoesNotExist:
+    membership_state = group.membership_state(profile)
+    if membership_state is None:
         messages.error(request, _('This user has not requested membership in this group.'))
+    elif membership_state == GroupMembership.MEMBER:
+        messages.error(request, _('This user is already a member of this group.'))
     else:
-        if membership.status == GroupMembership.MEMBER:
-            messages.error(request, _('This user is already a member of this group.'))
-        else:
-            group.add_member(profile)
-            messages.info(request, _('This user has been added as a member of this group.'))
+        group.add_member(profile)
+        messages.info(request, _('This user has been added as a member of this group.'))
     return redirect('groups:show_group', url=group.url)
 
 
@@ -253,9 +257,10 @@ def join_group(request, url):
     # want to give the user a message that's specific to the reason they can't join.
     # Can we make this DRYer?
 
-    if group.has_member(profile_to_add):
+    membership_state = group.membership_state(profile_to_add)
+    if membership_state == GroupMembership.MEMBER:
         messages.error(request, _('You are already in this group.'))
-    elif group.has_pending_member(profile_to_add):
+    elif membership_state == GroupMembership.PENDING:
         messages.error(request, _('Your request to join this group is still pending.'))
     elif group.accepting_new_members == 'no':
         messages.error(request, _('This group is not accepting requests to join.'))
@@ -330,7 +335,8 @@ def group_add_edit(request, url=None):
     if form.is_valid():
         group = form.save()
         # Ensure curator is in the group when it's created
-        if profile == group.curator and not group.has_member(profile):
+        if (profile == group.curator
+                and group.membership_state(profile) != GroupMembership.MEMBER):
             group.add_member(profile)
         return redirect(reverse('groups:show_group', args=[group.url]))
 
@@ -6,6 +6,7 @@ from mock import patch
 from nose.tools import eq_
 
 from mozillians.common.tests import TestCase, requires_login, requires_vouch
+from mozillians.users.models import Location
 from mozillians.users.tests import UserFactory
 
 
@@ -161,3 +162,57 @@ class ListTests(TestCase):
         eq_(response.context['city_name'], None)
         eq_(response.context['region_name'], None)
         eq_(response.context['people'].paginator.count, 0)
+
+    def test_list_mozillians_in_location_normalized_city(self):
+        UserFactory.create(userprofile={'country': 'it', 'city': 'Madova'})
+        UserFactory.create(userprofile={'country': 'it', 'city': ' madova '})
+        user = UserFactory.create()
+        with self.login(user) as client:
+            url = reverse('phonebook:list_city',
+                          kwargs={'country': 'it', 'city': 'MADOVA'})
+            response = client.get(url, follow=True)
+        eq_(response.context['people'].paginator.count, 2)
+        eq_(len(response.context['people'].object_list), 2)
+
+    def test_list_mozillians_in_location_count_from_profiles(self):
+        # Location counts can lag until refresh_location_counts runs.
+        UserFactory.create(userprofile={'country': 'it', 'city': 'Madova'})
+        Location.objects.filter(country='it').update(vouched_count=5)
+        user = UserFactory.create()
+        with self.login(user) as client:
+            url = reverse('phonebook:list_country', kwargs={'country': 'it'})
+            response = client.get(url, follow=True)
+        eq_(response.context['people'].paginator.count, 1)
+
+    def test_list_locations(self):
+        UserFactory.create(userprofile={'country': 'it', 'city': 'Madova'})
+        UserFactory.create(userprofile={'country': 'it', 'region': 'Florence'})
+        UserFactory.create(vouched=False, userprofile={'country': 'fr'})
+        user = UserFactory.create()
+        with self.login(user) as client:
+            response = client.get(reverse('phonebook:list_locations'), follow=True)
+        eq_(response.status_code, 200)
+        self.assertTemplateUsed(response, 'phonebook/locations.html')
+        eq_(response.context['countries'], [('gr', 'Greece', 1), ('it', 'Italy', 2)])
+
+    def test_list_locations_country(self):
+        UserFactory.create(userprofile={'country': 'it', 'city': 'Madova'})
+        UserFactory.create(userprofile={'country': 'it', 'region': 'Florence'})
+        UserFactory.create(userprofile={'country': 'it'})
+        UserFactory.create(vouched=False, userprofile={'country': 'it', 'city': 'Rome'})
+        user = UserFactory.create()
+        with self.login(user) as client:
+            url = reverse('phonebook:list_locations_country', kwargs={'country': 'IT'})
+            response = client.get(url, follow=True)
+        eq_(response.status_code, 200)
+        eq_(response.context['country_name'], 'Italy')
+        eq_(response.context['total'], 3)
+        eq_([(location.region_name, location.city_name)
+             for location in response.context['locations']],
+            [('', 'Madova'), ('Florence', '')])
+
+    @requires_vouch()
+    def test_list_locations_unvouched(self):
+        user = UserFactory.create(vouched=False)
+        with self.login(user) as client:
+            client.get(reverse('phonebook:list_locations'), follow=True)
@@ -9,6 +9,7 @@ from nose.tools import ok_, eq_
 
 from mozillians.common.helpers import redirect
 from mozillians.common.tests import TestCase
+from mozillians.groups.tests import GroupFactory
 from mozillians.users.managers import PUBLIC, MOZILLIANS, EMPLOYEES, PRIVILEGED
 from mozillians.users.tests import UserFactory
 
@@ -224,3 +225,51 @@ class ViewProfileTests(TestCase):
         ok_('vouch_form' in response.context)
         eq_(response.context['vouch_form'].initial['vouchee'],
             unvouched_user.userprofile.id)
+
+    def test_view_profile_does_not_exist(self):
+        user = UserFactory.create()
+        with self.login(user) as client:
+            url = reverse('phonebook:profile_view', kwargs={'username': 'nonexistent'})
+            response = client.get(url, follow=True)
+        eq_(response.status_code, 404)
+
+    def test_view_profile_incomplete(self):
+        lookup_user = UserFactory.create(userprofile={'full_name': '',
+                                                      'privacy_ircname': PUBLIC})
+        client = Client()
+        url = reverse('phonebook:profile_view',
+                      kwargs={'username': lookup_user.username})
+        response = client.get(url, follow=True)
+        eq_(response.status_code, 404)
+
+    def test_view_profile_details_cached(self):
+        lookup_user = UserFactory.create(userprofile={'privacy_full_name': PUBLIC})
+        url = reverse('phonebook:profile_view',
+                      kwargs={'username': lookup_user.username})
+        with patch('mozillians.phonebook.views.render_to_string',
+                   return_value='details') as render_mock:
+            Client().get(url, follow=True)
+            Client().get(url, follow=True)
+        eq_(render_mock.call_count, 1)
+
+    def test_view_profile_details_cache_per_viewer(self):
+        lookup_user = UserFactory.create(userprofile={'privacy_full_name': PUBLIC})
+        url = reverse('phonebook:profile_view',
+                      kwargs={'username': lookup_user.username})
+        with patch('mozillians.phonebook.views.render_to_string',
+                   return_value='details') as render_mock:
+            Client().get(url, follow=True)
+            with self.login(UserFactory.create()) as client:
+                client.get(url, follow=True)
+        eq_(render_mock.call_count, 2)
+
+    def test_view_profile_details_invalidated(self):
+        lookup_user = UserFactory.create(userprofile={'privacy_full_name': PUBLIC,
+                                                      'privacy_groups': PUBLIC})
+        url = reverse('phonebook:profile_view',
+                      kwargs={'username': lookup_user.username})
+        Client().get(url, follow=True)
+        group = GroupFactory.create()
+        group.add_member(lookup_user.userprofile)
+        response = Client().get(url, follow=True)
+        ok_(group.name in response.content.decode('utf-8'))
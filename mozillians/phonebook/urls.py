@@ -30,6 +30,9 @@ urlpatterns = patterns(
         'views.list_mozillians_in_location', name='list_region_city'),
     url(r'^country/(?P<country>[A-Za-z]+)/region/(?P<region>.+)/$',
         'views.list_mozillians_in_location', name='list_region'),
+    url(r'^locations/$', 'views.list_locations', name='list_locations'),
+    url(r'^locations/(?P<country>[A-Za-z]+)/$', 'views.list_locations',
+        name='list_locations_country'),
 
 
     # Static pages need csrf for browserID post to work
@@ -3,9 +3,13 @@ from django.contrib import auth
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import Sum
 from django.http import Http404, HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, render
+from django.template import RequestContext
+from django.template.loader import render_to_string
 from django.views.decorators.cache import cache_page, never_cache
 from django.views.decorators.http import require_POST
 
@@ -24,7 +28,12 @@ from mozillians.groups.models import Group
 from mozillians.phonebook.models import Invite
 from mozillians.phonebook.utils import redeem_invite
 from mozillians.users.managers import EMPLOYEES, MOZILLIANS, PUBLIC, PRIVILEGED
-from mozillians.users.models import COUNTRIES, UserProfile
+from mozillians.users.models import (COUNTRIES, Location, UserProfile,
+                                     get_profile_version)
+
+
+PROFILE_DETAILS_KEY = ('phonebook:profile:{pk}:{updated}:{version}:{level}:'
+                       '{pending}:{vouched}:{locale}')
 
 
 class BrowserIDVerify(Verify):
@@ -89,10 +98,15 @@ def view_profile(request, username):
         profile = UserProfile.objects.privacy_level(privacy_level).get(user__username=username)
         data['privacy_mode'] = view_as
     else:
-        userprofile_query = UserProfile.objects.filter(user__username=username)
-        public_profile_exists = userprofile_query.public().exists()
-        profile_exists = userprofile_query.exists()
-        profile_complete = userprofile_query.exclude(full_name='').exists()
+        # Load the profile once and check in Python what public() and
+        # complete() would, instead of one query for each.
+        try:
+            profile = (UserProfile.objects.select_related('user')
+                       .get(user__username=username))
+        except UserProfile.DoesNotExist:
+            profile = None
+        public_profile_exists = profile is not None and profile.is_public
+        profile_complete = profile is not None and profile.full_name != ''
 
         if not public_profile_exists:
             if not request.user.is_authenticated():
@@ -106,10 +120,9 @@ def view_profile(request, username):
                 messages.error(request, GET_VOUCHED_MESSAGE)
                 return redirect('phonebook:home')
 
-        if not profile_exists or not profile_complete:
+        if not profile_complete:
             raise Http404
 
-        profile = UserProfile.objects.get(user__username=username)
         profile.set_instance_privacy_level(PUBLIC)
         if request.user.is_authenticated():
             profile.set_instance_privacy_level(
@@ -123,16 +136,44 @@ def view_profile(request, username):
 
     data['shown_user'] = profile.user
     data['profile'] = profile
-    data['groups'] = profile.get_annotated_groups()
     data['locale'] = request.locale
+    data['profile_details'] = _render_profile_details(request, profile)
+
+    return render(request, 'phonebook/profile.html', data)
+
 
+def _render_profile_details(request, profile):
+    """Render the details section of a profile page, or get it from the cache.
+
+    The section only depends on the profile, its groups, skills,
+    languages and accounts, the privacy level it is shown at, whether
+    the viewer may see pending groups and links, and the locale. The
+    cache key holds all of them, so saving the profile or changing its
+    related data starts a new entry. Changes to other objects shown,
+    like group names, show up once PROFILE_DETAILS_CACHE_TIMEOUT runs
+    out.
+    """
+    user = request.user
     # Only show pending groups if user is looking at their own profile,
     # or current user is a superuser
-    if not (request.user.is_authenticated()
-            and (request.user.username == username or request.user.is_superuser)):
-        data['groups'] = [grp for grp in data['groups'] if not grp.pending]
-
-    return render(request, 'phonebook/profile.html', data)
+    show_pending = (user.is_authenticated()
+                    and (user.username == profile.user.username or user.is_superuser))
+    viewer_vouched = user.is_authenticated() and user.userprofile.is_vouched
+
+    key = PROFILE_DETAILS_KEY.format(
+        pk=profile.pk, updated=profile.last_updated.isoformat(),
+        version=get_profile_version(profile.pk), level=profile._privacy_level,
+        pending=int(show_pending), vouched=int(viewer_vouched), locale=request.locale)
+    details = cache.get(key)
+    if details is None:
+        groups = profile.get_annotated_groups()
+        if not show_pending:
+            groups = [grp for grp in groups if not grp.pending]
+        details = render_to_string('phonebook/includes/profile_details.html',
+                                   {'profile': profile, 'groups': groups},
+                                   context_instance=RequestContext(request))
+        cache.set(key, details, getattr(settings, 'PROFILE_DETAILS_CACHE_TIMEOUT', 600))
+    return details
 
 
 @allow_unvouched
@@ -331,14 +372,16 @@ def vouch(request):
 def list_mozillians_in_location(request, country, region=None, city=None):
     country = country.lower()
     country_name = COUNTRIES.get(country, country)
-    queryset = UserProfile.objects.vouched().filter(country=country)
+    location = {'country': country}
     show_pagination = False
 
     if city:
-        queryset = queryset.filter(city__iexact=city)
+        location['city'] = Location.normalize(city)
     if region:
-        queryset = queryset.filter(region__iexact=region)
+        location['region'] = Location.normalize(region)
 
+    queryset = UserProfile.objects.vouched().filter(
+        **dict(('location__' + key, value) for key, value in location.items()))
     paginator = Paginator(queryset, settings.ITEMS_PER_PAGE)
     page = request.GET.get('page', 1)
 
@@ -361,6 +404,29 @@ def list_mozillians_in_location(request, country, region=None, city=None):
     return render(request, 'phonebook/location_list.html', data)
 
 
+def list_locations(request, country=None):
+    """List countries, or the regions and cities of a country, with
+    their number of vouched Mozillians.
+    """
+    locations = Location.objects.filter(vouched_count__gt=0)
+    if not country:
+        totals = (locations.order_by().values_list('country')
+                  .annotate(Sum('vouched_count')))
+        countries = sorted(((code, COUNTRIES.get(code, code), count)
+                            for code, count in totals),
+                           key=lambda item: item[1])
+        return render(request, 'phonebook/locations.html',
+                      {'countries': countries})
+
+    country = country.lower()
+    locations = locations.filter(country=country)
+    data = {'country': country,
+            'country_name': COUNTRIES.get(country, country),
+            'total': locations.aggregate(count=Sum('vouched_count'))['count'] or 0,
+            'locations': locations.exclude(region='', city='')}
+    return render(request, 'phonebook/locations.html', data)
+
+
 @allow_unvouched
 def logout(request):
     """Logout view that wraps Django's logout but always redirects.
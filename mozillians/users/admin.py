@@ -13,6 +13,7 @@ from django.http import HttpResponse, HttpResponseRedirect
 
 import autocomplete_light
 from celery.task.sets import TaskSet
+from celeryutils import chunked
 from functools import update_wrapper
 from sorl.thumbnail.admin import AdminImageMixin
 
@@ -82,9 +83,10 @@ def subscribe_to_basket_action():
 
     def subscribe_to_basket(modeladmin, request, queryset):
         """Subscribe to Basket or update details of already subscribed."""
-        ts = [(mozillians.users.tasks.update_basket_task
-               .subtask(args=[userprofile.id]))
-              for userprofile in queryset]
+        ids = queryset.order_by('id').values_list('id', flat=True)
+        ts = [(mozillians.users.tasks.reconcile_basket_task
+               .subtask(args=[chunk], kwargs={'force': True}))
+              for chunk in chunked(list(ids), mozillians.users.tasks.BASKET_RECONCILE_CHUNK_SIZE)]
         TaskSet(ts).apply_async()
         messages.success(request, 'Basket update started.')
     subscribe_to_basket.short_description = 'Subscribe to or Update Basket'
@@ -1,30 +1,58 @@
+import time
+import zlib
+from datetime import datetime, timedelta
 from urllib2 import unquote
 from urlparse import urljoin
 
 from django.conf import settings
+from django.conf.urls.defaults import url
 from django.core.urlresolvers import reverse
 from django.db.models import Q
+from django.http import StreamingHttpResponse
 
 from funfactory import utils
 from tastypie import fields, http
 from tastypie.authorization import ReadOnlyAuthorization
 from tastypie.bundle import Bundle
-from tastypie.exceptions import ImmediateHttpResponse
+from tastypie.exceptions import BadRequest, ImmediateHttpResponse
 from tastypie.resources import ModelResource
 from tastypie.serializers import Serializer
+from tastypie.utils import trailing_slash
 
 from mozillians.api.authenticators import AppAuthentication
-from mozillians.api.paginator import Paginator
+from mozillians.api.paginator import CursorPaginator, Paginator
 from mozillians.api.resources import (ClientCacheResourceMixIn,
-                                      GraphiteMixIn)
-from mozillians.users.models import UserProfile
+                                      GraphiteMixIn, ThrottleMixIn)
+from mozillians.api.timing import stage
+from mozillians.users.models import ExternalAccount, ProfileChange, UserProfile
 
 
-class UserResource(ClientCacheResourceMixIn, GraphiteMixIn, ModelResource):
+EXPORT_CHUNK_SIZE = 500
+VOUCHED_LOOKUP_MAX = getattr(settings, 'VOUCHED_LOOKUP_MAX', 100)
+
+# What each field of UserResource needs loaded, for ``fields=``: the
+# profile columns, whether the user is needed and the relation to
+# prefetch. Fields missing here are plain profile columns.
+SPARSE_FIELD_REQUIREMENTS = {
+    'id': ([], False, None),
+    'resource_uri': ([], False, None),
+    'email': ([], True, None),
+    'username': ([], True, None),
+    'vouched_by': (['vouched_by'], False, None),
+    'url': ([], True, None),
+    'groups': ([], False, 'groups'),
+    'skills': ([], False, 'skills'),
+    'languages': (['privacy_languages'], False, 'language_set'),
+    'accounts': ([], False, 'externalaccount_set'),
+}
+
+
+class UserResource(ClientCacheResourceMixIn, GraphiteMixIn, ThrottleMixIn,
+                   ModelResource):
     """User Resource."""
     email = fields.CharField(attribute='user__email', null=True, readonly=True)
     username = fields.CharField(attribute='user__username', null=True, readonly=True)
-    vouched_by = fields.IntegerField(attribute='vouched_by__id',
+    vouched_by = fields.IntegerField(attribute='vouched_by_id',
                                      null=True, readonly=True)
     groups = fields.CharField()
     skills = fields.CharField()
@@ -33,12 +61,13 @@ class UserResource(ClientCacheResourceMixIn, GraphiteMixIn, ModelResource):
     accounts = fields.CharField()
 
     class Meta:
-        queryset = UserProfile.objects.all()
+        queryset = UserProfile.objects.select_related('user')
         authentication = AppAuthentication()
         authorization = ReadOnlyAuthorization()
         serializer = Serializer(formats=['json', 'jsonp'])
         paginator_class = Paginator
         cache_control = {'max-age': 0}
+        etag_field = 'last_updated'
         list_allowed_methods = ['get']
         detail_allowed_methods = ['get']
         resource_name = 'users'
@@ -50,6 +79,112 @@ class UserResource(ClientCacheResourceMixIn, GraphiteMixIn, ModelResource):
                   'date_mozillian', 'timezone', 'email', 'allows_mozilla_sites',
                   'allows_community_sites']
 
+    def override_urls(self):
+        return [
+            url(r'^(?P<resource_name>%s)/export%s$'
+                % (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('export'), name='api_users_export'),
+            url(r'^(?P<resource_name>%s)/vouched%s$'
+                % (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('vouched'), name='api_users_vouched'),
+        ]
+
+    def export(self, request, **kwargs):
+        """Stream all matching profiles as newline delimited JSON.
+
+        Only for Mozilla apps. Takes the same filters as the list view
+        plus ``since``, a unix timestamp, to only export profiles
+        updated after it. Each line holds one profile, dehydrated
+        exactly as in the list view. Profiles are read in id order,
+        EXPORT_CHUNK_SIZE at a time, so memory use does not grow with
+        the size of the directory. The output is gzip compressed if the
+        client accepts it. The X-Export-Started header holds the time
+        the export started, to pass as ``since`` on the next pull.
+        """
+        started = int(time.time())
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        if request.GET.get('restricted', False):
+            raise ImmediateHttpResponse(response=http.HttpForbidden())
+
+        objects = self.obj_get_list(request=request,
+                                    **self.remove_api_resource_names(kwargs))
+        since = request.GET.get('since')
+        if since:
+            try:
+                since = datetime.fromtimestamp(float(since))
+            except ValueError:
+                raise BadRequest('Invalid since timestamp.')
+            objects = objects.filter(last_updated__gt=since)
+
+        lines = self._export_lines(request, objects)
+        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+            response = StreamingHttpResponse(_gzip(lines),
+                                             content_type='application/x-ndjson')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        response['X-Export-Started'] = str(started)
+        self.log_throttled_access(request)
+        return response
+
+    def vouched(self, request, **kwargs):
+        """Return the vouched status of many users at once.
+
+        Takes ``emails`` and ``usernames``, comma separated or repeated,
+        in the query string or as POST data, up to VOUCHED_LOOKUP_MAX
+        in total. Returns the restricted fields of each profile found,
+        with a single query, and lists the values that matched no
+        profile in ``meta.not_found``. Community apps only see profiles
+        that allow community sites.
+        """
+        self.method_check(request, allowed=['get', 'post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        data = request.POST if request.method == 'POST' else request.GET
+        emails, usernames = [
+            set(value.strip().lower() for values in data.getlist(key)
+                for value in values.split(',') if value.strip())
+            for key in ['emails', 'usernames']]
+        if not emails and not usernames:
+            raise BadRequest('Pass emails or usernames to look up.')
+        if len(emails) + len(usernames) > VOUCHED_LOOKUP_MAX:
+            raise BadRequest('Look up at most %d users at once.' % VOUCHED_LOOKUP_MAX)
+
+        # user__email and user__username are indexed and compared
+        # case insensitively by MySQL.
+        profiles = (UserProfile.objects.complete()
+                    .filter(Q(user__email__in=emails) | Q(user__username__in=usernames)))
+        if request.GET.get('restricted', False):
+            profiles = profiles.filter(allows_community_sites=True)
+
+        objects = []
+        for email, username, is_vouched in profiles.values_list(
+                'user__email', 'user__username', 'is_vouched'):
+            emails.discard(email.lower())
+            usernames.discard(username.lower())
+            objects.append({'email': email, 'is_vouched': is_vouched})
+
+        self.log_throttled_access(request)
+        return self.create_response(
+            request, {'objects': objects,
+                      'meta': {'not_found': sorted(emails | usernames)}})
+
+    def _export_lines(self, request, objects):
+        serializer = self._meta.serializer
+        last_id = 0
+        while True:
+            chunk = list(objects.filter(id__gt=last_id)[:EXPORT_CHUNK_SIZE])
+            if not chunk:
+                return
+            for obj in chunk:
+                bundle = self.full_dehydrate(self.build_bundle(obj=obj, request=request))
+                yield serializer.to_json(bundle) + '\n'
+            last_id = chunk[-1].id
+            self.count_rows(request, len(chunk))
+
     def build_filters(self, filters=None):
         database_filters = {}
         valid_filters = [f for f in filters if f in
@@ -59,8 +194,7 @@ class UserResource(ClientCacheResourceMixIn, GraphiteMixIn, ModelResource):
         getvalue = lambda x: unquote(filters[x].lower())
 
         if 'accounts' in valid_filters:
-            database_filters['accounts'] = Q(
-                externalaccount__identifier__icontains=getvalue('accounts'))
+            database_filters['accounts'] = self._build_accounts_filter(filters)
 
         if 'email' in valid_filters:
             database_filters['email'] = Q(
@@ -94,31 +228,86 @@ class UserResource(ClientCacheResourceMixIn, GraphiteMixIn, ModelResource):
 
         return database_filters
 
+    def _build_accounts_filter(self, filters):
+        """Return the filter on external account identifiers.
+
+        ``accounts_match`` picks how ``accounts`` is compared: ``exact``,
+        the default, and ``prefix`` use the indexed normalized
+        identifier, ``contains`` searches all identifiers and is much
+        slower. ``accounts_type`` limits the match to one account type,
+        whose profile URLs are then accepted as identifiers too.
+        """
+        account_type = filters.get('accounts_type', '').upper() or None
+        if account_type and account_type not in ExternalAccount.ACCOUNT_TYPES:
+            raise BadRequest('Invalid accounts_type.')
+        identifier = unquote(filters['accounts'])
+
+        match = filters.get('accounts_match', 'exact')
+        if match == 'exact':
+            query = Q(externalaccount__normalized_identifier=ExternalAccount
+                      .normalize_identifier(identifier, account_type))
+        elif match == 'prefix':
+            query = Q(externalaccount__normalized_identifier__startswith=ExternalAccount
+                      .normalize_identifier(identifier, account_type))
+        elif match == 'contains':
+            query = Q(externalaccount__identifier__icontains=identifier.lower())
+        else:
+            raise BadRequest('Invalid accounts_match.')
+
+        if account_type:
+            query &= Q(externalaccount__type=account_type)
+        return query
+
+    def get_sparse_fields(self, request):
+        """Return the fields listed in ``fields``, or None for all of them."""
+        if not request.GET.get('fields'):
+            return None
+
+        requested = set(name.strip() for name in request.GET['fields'].split(','))
+        unknown = requested - set(self.fields)
+        if unknown:
+            raise BadRequest('Unknown fields: %s.' % ', '.join(sorted(unknown)))
+        return [name for name in self.fields if name in requested]
+
+    def full_dehydrate(self, bundle):
+        """Only dehydrate the fields listed in ``fields``, if given."""
+        field_names = self.get_sparse_fields(bundle.request)
+        if field_names is None:
+            return super(UserResource, self).full_dehydrate(bundle)
+
+        with stage('dehydration'):
+            for field_name in field_names:
+                bundle.data[field_name] = self.fields[field_name].dehydrate(bundle)
+                method = getattr(self, 'dehydrate_%s' % field_name, None)
+                if method:
+                    bundle.data[field_name] = method(bundle)
+            return self.dehydrate(bundle)
+
     def dehydrate(self, bundle):
         if (bundle.request.GET.get('restricted', False)
-            or not bundle.data['allows_mozilla_sites']):
+            or not bundle.obj.allows_mozilla_sites):
             data = {}
             for key in self._meta.restricted_fields:
-                data[key] = bundle.data[key]
+                if key in bundle.data:
+                    data[key] = bundle.data[key]
             bundle = Bundle(obj=bundle.obj, data=data, request=bundle.request)
         return bundle
 
+    # Related objects are read through all() so that the page
+    # prefetched in apply_filters() is served from memory.
     def dehydrate_accounts(self, bundle):
         accounts = [{'identifier': a.identifier, 'type': a.type}
                     for a in bundle.obj.externalaccount_set.all()]
         return accounts
 
     def dehydrate_groups(self, bundle):
-        groups = bundle.obj.groups.values_list('name', flat=True)
-        return list(groups)
+        return [group.name for group in bundle.obj.groups.all()]
 
     def dehydrate_skills(self, bundle):
-        skills = bundle.obj.skills.values_list('name', flat=True)
-        return list(skills)
+        return [skill.name for skill in bundle.obj.skills.all()]
 
     def dehydrate_languages(self, bundle):
-        languages = bundle.obj.languages.values_list('code', flat=True)
-        return list(languages)
+        return [language.code for language in bundle.obj.languages]
 
     def dehydrate_photo(self, bundle):
         if bundle.obj.photo:
@@ -149,4 +338,83 @@ class UserResource(ClientCacheResourceMixIn, GraphiteMixIn, ModelResource):
         if request.GET.get('restricted', False):
             mega_filter &= Q(allows_community_sites=True)
 
-        return UserProfile.objects.complete().filter(mega_filter).distinct().order_by('id')
+        objects = UserProfile.objects.complete().filter(mega_filter).distinct()
+        field_names = self.get_sparse_fields(request)
+        if field_names is None:
+            return (objects.select_related('user')
+                    .prefetch_related('groups', 'skills', 'language_set',
+                                      'externalaccount_set')
+                    .order_by('id'))
+
+        columns = ['allows_mozilla_sites']
+        prefetch = []
+        for field_name in field_names:
+            field_columns, needs_user, relation = SPARSE_FIELD_REQUIREMENTS.get(
+                field_name, ([self.fields[field_name].attribute], False, None))
+            columns += field_columns
+            if needs_user:
+                columns.append('user')
+                objects = objects.select_related('user')
+            if relation:
+                prefetch.append(relation)
+        return objects.only(*columns).prefetch_related(*prefetch).order_by('id')
+
+
+class ChangeResource(ClientCacheResourceMixIn, GraphiteMixIn, ThrottleMixIn,
+                     ModelResource):
+    """Feed of profile changes, oldest first.
+
+    Only for Mozilla apps. Pass ``since``, a unix timestamp, to get the
+    changes logged after it, then follow ``meta.next`` until it is
+    null. Pages are cursor paginated on the id of the change, so no
+    change is repeated while new ones are logged.
+
+    Ids are taken when changes are logged but only seen once their
+    transaction commits, possibly after newer ones were served. So
+    changes are only served once they are PROFILE_CHANGES_DELAY seconds
+    old, and only changes logged in transactions longer than that can
+    be skipped.
+    """
+    profile = fields.IntegerField(attribute='userprofile_id', readonly=True)
+    change_type = fields.CharField(readonly=True)
+
+    class Meta:
+        queryset = ProfileChange.objects.all()
+        authentication = AppAuthentication()
+        authorization = ReadOnlyAuthorization()
+        serializer = Serializer(formats=['json', 'jsonp'])
+        paginator_class = CursorPaginator
+        cache_control = {'max-age': 0}
+        etag_field = 'id'
+        list_allowed_methods = ['get']
+        detail_allowed_methods = []
+        resource_name = 'changes'
+        fields = ['id', 'profile', 'change_type', 'created']
+
+    def dehydrate_change_type(self, bundle):
+        return bundle.obj.get_change_type_display()
+
+    def apply_filters(self, request, applicable_filters):
+        if request.GET.get('restricted', False):
+            raise ImmediateHttpResponse(response=http.HttpForbidden())
+
+        objects = super(ChangeResource, self).apply_filters(request, applicable_filters)
+        since = request.GET.get('since')
+        if since:
+            try:
+                since = datetime.fromtimestamp(float(since))
+            except ValueError:
+                raise BadRequest('Invalid since timestamp.')
+            objects = objects.filter(created__gt=since)
+        delay = getattr(settings, 'PROFILE_CHANGES_DELAY', 60)
+        return objects.filter(created__lte=datetime.now() - timedelta(seconds=delay))
+
+
+def _gzip(lines):
+    """Gzip compress an iterable of strings as it is consumed."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for line in lines:
+        data = compressor.compress(line)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,124 @@
+"""Basket client with a shared HTTP session and a circuit breaker.
+
+basket-client opens a new connection for every call. The functions
+here talk to the same Basket API but go through one keep-alive session
+per worker process, with explicit connect and read timeouts.
+
+After BASKET_CIRCUIT_THRESHOLD consecutive connection errors, timeouts
+or server errors the circuit opens, and for BASKET_CIRCUIT_RESET
+seconds every call raises BasketCircuitOpen without touching the
+network. The state is kept in the cache so that all workers share it.
+
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+
+import basket.base
+import requests
+from basket.base import parse_response
+from django_statsd.clients import statsd
+
+
+logger = logging.getLogger(__name__)
+
+BASKET_API_KEY = os.environ.get('BASKET_API_KEY', getattr(settings, 'BASKET_API_KEY', False))
+BASKET_CONNECT_TIMEOUT = getattr(settings, 'BASKET_CONNECT_TIMEOUT', 3.05)
+BASKET_READ_TIMEOUT = getattr(settings, 'BASKET_READ_TIMEOUT', 10)
+BASKET_POOL_SIZE = getattr(settings, 'BASKET_POOL_SIZE', 10)
+BASKET_CIRCUIT_THRESHOLD = getattr(settings, 'BASKET_CIRCUIT_THRESHOLD', 5)
+BASKET_CIRCUIT_RESET = getattr(settings, 'BASKET_CIRCUIT_RESET', 300)
+CIRCUIT_FAILURES_KEY = 'users:basket:circuit:failures'
+CIRCUIT_OPEN_KEY = 'users:basket:circuit:open'
+
+_session = None
+
+
+class BasketCircuitOpen(Exception):
+    """Basket failed repeatedly and is not called for the time being."""
+
+
+def get_session():
+    """Return the Basket session of this process, creating it if needed."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=BASKET_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+
+def circuit_open():
+    return bool(cache.get(CIRCUIT_OPEN_KEY))
+
+
+def _record_failure():
+    cache.add(CIRCUIT_FAILURES_KEY, 0, BASKET_CIRCUIT_RESET)
+    try:
+        failures = cache.incr(CIRCUIT_FAILURES_KEY)
+    except ValueError:
+        failures = 1
+        cache.set(CIRCUIT_FAILURES_KEY, failures, BASKET_CIRCUIT_RESET)
+
+    if failures >= BASKET_CIRCUIT_THRESHOLD:
+        cache.set(CIRCUIT_OPEN_KEY, True, BASKET_CIRCUIT_RESET)
+        cache.delete(CIRCUIT_FAILURES_KEY)
+        statsd.incr('basket.circuit.opened')
+        logger.warning('Basket failed %d times in a row, not calling it for %d seconds.'
+                       % (failures, BASKET_CIRCUIT_RESET))
+
+
+def request(method, action, data=None, token=None, params=None, headers=None):
+    """Call a Basket API endpoint through the shared session.
+
+    Same signature and return value as basket.base.request. Raises
+    BasketCircuitOpen while the circuit is open.
+
+    """
+    if circuit_open():
+        statsd.incr('basket.circuit.rejected')
+        raise BasketCircuitOpen('Basket is unavailable.')
+
+    url = '%s/news/%s/' % (basket.base.BASKET_URL, action)
+    if token:
+        url = '%s%s/' % (url, token)
+
+    try:
+        response = get_session().request(
+            method, url, data=data, params=params, headers=headers,
+            timeout=(BASKET_CONNECT_TIMEOUT, BASKET_READ_TIMEOUT))
+    except requests.exceptions.RequestException:
+        _record_failure()
+        raise
+
+    if response.status_code >= 500:
+        _record_failure()
+    else:
+        cache.delete(CIRCUIT_FAILURES_KEY)
+    return parse_response(response)
+
+
+def subscribe(email, newsletters, **kwargs):
+    data = dict(kwargs, email=email, newsletters=newsletters)
+    return request('post', 'subscribe', data=data)
+
+
+def unsubscribe(token, email, newsletters=None, optout=False):
+    data = {'email': email}
+    if optout:
+        data['optout'] = 'Y'
+    elif newsletters:
+        data['newsletters'] = newsletters
+    return request('post', 'unsubscribe', data=data, token=token)
+
+
+def lookup_user(email=None, token=None):
+    if token:
+        return request('get', 'lookup-user', params={'token': token})
+    return request('get', 'lookup-user', params={'email': email},
+                   headers={'x-api-key': BASKET_API_KEY})
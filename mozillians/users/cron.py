@@ -1,14 +1,27 @@
+import logging
+import time
+from datetime import datetime, timedelta
+
 from django.conf import settings
+from django.db.models import Count
 
 import cronjobs
 import pyes.exceptions
 
 from celery.task.sets import TaskSet
 from celeryutils import chunked
+from django_statsd.clients import statsd
 from elasticutils.contrib.django import get_es
 
-from mozillians.users.tasks import index_objects
-from mozillians.users.models import PUBLIC, UserProfile
+from mozillians.users import vouched
+from mozillians.users.tasks import (BASKET_RECONCILE_CHUNK_SIZE, index_objects,
+                                    reconcile_basket_task)
+from mozillians.users.models import PUBLIC, Location, ProfileChange, UserProfile
+
+
+logger = logging.getLogger(__name__)
+
+PRUNE_CHUNK_SIZE = 1000
 
 
 @cronjobs.register
@@ -39,3 +52,68 @@ def index_all_profiles():
            for chunk in chunked(sorted(list(ids)), 150)]
 
     TaskSet(ts).apply_async()
+
+
+@cronjobs.register
+def reconcile_basket():
+    """Push the Basket data of all vouched profiles that changed since their last sync."""
+    start = time.time()
+    totals = dict(checked=0, skipped=0, pushed=0, queued=0, failed=0)
+    ids = (UserProfile.objects.filter(is_vouched=True)
+           .order_by('id').values_list('id', flat=True))
+    for chunk in chunked(list(ids), BASKET_RECONCILE_CHUNK_SIZE):
+        stats = reconcile_basket_task(chunk)
+        for key, value in stats.items():
+            totals[key] += value
+
+    elapsed = time.time() - start
+    for key, value in totals.items():
+        statsd.gauge('basket.reconcile.%s' % key, value)
+    statsd.timing('basket.reconcile.time', int(elapsed * 1000))
+    logger.info('Basket reconciliation: %(checked)d profiles checked, '
+                '%(pushed)d pushed, %(skipped)d unchanged, %(queued)d queued '
+                'for subscription, %(failed)d failed' % totals)
+    logger.info('Basket reconciliation took %.1fs (%.1f profiles/s)'
+                % (elapsed, totals['checked'] / max(elapsed, 0.001)))
+    return totals
+
+
+@cronjobs.register
+def prune_profile_changes():
+    """Delete the profile changes older than PROFILE_CHANGES_MAX_DAYS."""
+    max_days = getattr(settings, 'PROFILE_CHANGES_MAX_DAYS', 30)
+    cutoff = datetime.now() - timedelta(days=max_days)
+    old_changes = ProfileChange.objects.filter(created__lt=cutoff)
+    pruned = 0
+    while True:
+        ids = list(old_changes.values_list('id', flat=True)[:PRUNE_CHUNK_SIZE])
+        if not ids:
+            break
+        ProfileChange.objects.filter(id__in=ids).delete()
+        pruned += len(ids)
+    logger.info('Pruned %d profile changes older than %d days' % (pruned, max_days))
+
+
+@cronjobs.register
+def rebuild_vouched_index():
+    index = vouched.build_index()
+    logger.info('Vouched index rebuilt with %d emails (%d bytes)'
+                % (len(index), len(index.data)))
+
+
+@cronjobs.register
+def refresh_location_counts():
+    """Recount the vouched profiles of all locations.
+
+    Profile saves keep the counts up to date, this catches the changes
+    made without saving profiles, like bulk updates.
+    """
+    counts = dict(UserProfile.objects.vouched().exclude(location=None).order_by()
+                  .values_list('location').annotate(Count('id')))
+    fixed = 0
+    for location_id, vouched_count in Location.objects.values_list('id', 'vouched_count'):
+        count = counts.get(location_id, 0)
+        if count != vouched_count:
+            Location.objects.filter(id=location_id).update(vouched_count=count)
+            fixed += 1
+    logger.info('Location counts refreshed, %d of them were out of date' % fixed)
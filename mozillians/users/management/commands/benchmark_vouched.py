@@ -0,0 +1,53 @@
+"""
+Compare the vouched email endpoint with the UserResource email lookup.
+Prints the size of the vouched index and the requests per second of
+both endpoints, for the given number of lookups of vouched emails.
+"""
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+
+from funfactory.helpers import urlparams
+
+from mozillians.users import vouched
+from mozillians.users.models import UserProfile
+
+
+class Command(BaseCommand):
+    args = '<app_name> <app_key> [requests]'
+    help = 'Benchmarks the vouched email endpoint against UserResource'
+
+    def handle(self, *args, **options):
+        if len(args) not in (2, 3):
+            raise CommandError('Usage: %s' % self.args)
+        app_name, app_key = args[:2]
+        requests = int(args[2]) if len(args) == 3 else 1000
+
+        index = vouched.build_index()
+        self.stdout.write('Vouched index: %d emails, %d bytes\n'
+                          % (len(index), len(index.data)))
+
+        emails = list(UserProfile.objects.vouched()
+                      .values_list('user__email', flat=True))
+        if not emails:
+            raise CommandError('There are no vouched users to look up.')
+        emails = [random.choice(emails) for i in range(requests)]
+
+        urls = [
+            ('vouched email', reverse('api_vouched_email')),
+            ('UserResource', reverse('api_dispatch_list',
+                                     kwargs={'api_name': 'v1', 'resource_name': 'users'}))]
+        client = Client()
+        for name, url in urls:
+            start = time.time()
+            for email in emails:
+                response = client.get(urlparams(url, app_name=app_name,
+                                                app_key=app_key, email=email))
+                if response.status_code != 200:
+                    raise CommandError('%s answered %d' % (name, response.status_code))
+            elapsed = time.time() - start
+            self.stdout.write('%s: %d requests in %.2fs, %.1f requests/s\n'
+                              % (name, requests, elapsed, requests / elapsed))
@@ -1,6 +1,8 @@
 import os
+import re
 import uuid
 from datetime import datetime
+from urllib import unquote
 
 from django.conf import settings
 from django.contrib.auth.models import User
@@ -10,6 +12,7 @@ from django.db.models import signals as dbsignals, ManyToManyField
 from django.dispatch import receiver
 from django.utils.encoding import iri_to_uri
 from django.utils.http import urlquote
+from django.utils.timezone import now
 
 import basket
 from elasticutils.contrib.django import S, get_es
@@ -21,24 +24,43 @@ from sorl.thumbnail import ImageField, get_thumbnail
 from south.modelsinspector import add_introspection_rules
 from tower import ugettext as _, ugettext_lazy as _lazy
 
+from mozillians.api.models import invalidate_api_cache
 from mozillians.common.helpers import gravatar
 from mozillians.common.helpers import offset_of_timezone
+from mozillians.common.versions import bump_version, get_version
 from mozillians.groups.models import (Group, GroupAlias, GroupMembership,
-                                      Skill, SkillAlias)
+                                      Skill, SkillAlias, invalidate_curated_groups)
+from mozillians.groups.tasks import email_membership_change
 from mozillians.phonebook.helpers import langcode_to_name
 from mozillians.phonebook.validators import (validate_twitter, validate_website,
                                              validate_username_not_url)
-from mozillians.users import get_languages_for_locale
+from mozillians.users import basket_client, get_languages_for_locale, vouched
 from mozillians.users.managers import (EMPLOYEES,
                                        MOZILLIANS, PRIVACY_CHOICES, PRIVILEGED,
                                        PUBLIC, PUBLIC_INDEXABLE_FIELDS,
                                        UserProfileManager)
-from mozillians.users.tasks import (index_objects, remove_from_basket_task,
-                                    update_basket_task, unindex_objects)
+from mozillians.users.tasks import (VOUCHED_INDEX_RETRY_DELAY, index_objects,
+                                    remove_from_basket_task, schedule_basket_update,
+                                    unindex_objects, update_vouched_index_task)
 
 
 COUNTRIES = product_details.get_regions('en-US')
 AVATAR_SIZE = (300, 300)
+# Version of the related data of a profile (groups, skills, languages,
+# accounts), which does not change its last_updated.
+PROFILE_VERSION_KEY = 'users:profile:{pk}:version'
+# Fields of a profile that decide its location or whether it is counted
+# in it.
+LOCATION_COUNT_FIELDS = ['country', 'region', 'city', 'is_vouched', 'full_name']
+
+
+def get_profile_version(profile_id):
+    return get_version(PROFILE_VERSION_KEY.format(pk=profile_id))
+
+
+def invalidate_profile_version(profile_ids):
+    for profile_id in profile_ids:
+        bump_version(PROFILE_VERSION_KEY.format(pk=profile_id))
 
 
 def _calculate_photo_filename(instance, filename):
@@ -146,6 +168,55 @@ class UserProfilePrivacyModel(models.Model):
         return cls.CACHED_PRIVACY_FIELDS
 
 
+class Location(models.Model):
+    """A country, region and city pair with its number of vouched profiles.
+
+    Region and city are normalized, so that spellings differing only in
+    case or spacing share a location, and the name they were first
+    entered with is kept for display. Profiles point to their location,
+    and saving or deleting a profile recounts the locations it left and
+    joined. The refresh_location_counts cron job recounts all of them.
+    """
+    country = models.CharField(max_length=50)
+    region = models.CharField(max_length=255, default='', blank=True)
+    city = models.CharField(max_length=255, default='', blank=True)
+    region_name = models.CharField(max_length=255, default='', blank=True)
+    city_name = models.CharField(max_length=255, default='', blank=True)
+    vouched_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('country', 'region', 'city')
+        ordering = ['country', 'region', 'city']
+
+    def __unicode__(self):
+        return u', '.join(name for name in [self.city_name, self.region_name,
+                                            self.country] if name)
+
+    @staticmethod
+    def normalize(value):
+        return u' '.join((value or u'').split()).lower()
+
+    @classmethod
+    def for_profile(cls, profile):
+        """Return the location of profile, creating it if needed."""
+        if not profile.country:
+            return None
+        location, created = cls.objects.get_or_create(
+            country=profile.country.lower(), region=cls.normalize(profile.region),
+            city=cls.normalize(profile.city),
+            defaults={'region_name': u' '.join(profile.region.split()),
+                      'city_name': u' '.join(profile.city.split())})
+        return location
+
+    @classmethod
+    def refresh_counts(cls, location_ids):
+        """Recount the vouched profiles of the given locations."""
+        for location_id in set(location_ids) - set([None]):
+            count = (UserProfile.objects.vouched()
+                     .filter(location_id=location_id).count())
+            cls.objects.filter(id=location_id).update(vouched_count=count)
+
+
 class UserProfile(UserProfilePrivacyModel, SearchMixin):
     objects = UserProfileManager()
 
@@ -174,6 +245,8 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
                               verbose_name=_lazy(u'Province/State'))
     city = models.CharField(max_length=255, default='', blank=True,
                             verbose_name=_lazy(u'City'))
+    location = models.ForeignKey(Location, null=True, blank=True, editable=False,
+                                 on_delete=models.SET_NULL)
     allows_community_sites = models.BooleanField(
         default=True,
         verbose_name=_lazy(u'Sites that can determine my vouched status'),
@@ -184,6 +257,7 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
         verbose_name=_lazy(u'Allow Mozilla sites to access my profile data?'),
         choices=((True, _lazy(u'Yes')), (False, _lazy(u'No'))))
     basket_token = models.CharField(max_length=1024, default='', blank=True)
+    basket_payload_hash = models.CharField(max_length=40, default='', blank=True)
     date_mozillian = models.DateField('When was involved with Mozilla',
                                       null=True, blank=True, default=None)
     timezone = models.CharField(max_length=100, blank=True, default='',
@@ -212,6 +286,15 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
         db_table = 'profile'
         ordering = ['full_name']
 
+    def __init__(self, *args, **kwargs):
+        super(UserProfile, self).__init__(*args, **kwargs)
+        self._saved_location_state = self._get_location_state()
+
+    def _get_location_state(self):
+        """Return the values of LOCATION_COUNT_FIELDS, without loading
+        deferred fields."""
+        return tuple(self.__dict__.get(field) for field in LOCATION_COUNT_FIELDS)
+
     def __getattribute__(self, attrname):
         """Special privacy aware __getattribute__ method.
 
@@ -458,39 +541,80 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
             self.save()
 
     def set_membership(self, model, membership_list):
-        """Alters membership to Groups and Skills."""
+        """Alters membership to Groups and Skills.
+
+        All names in membership_list are resolved through the alias
+        table in one query and missing groups are created in bulk.
+        Existing memberships are diffed in memory and the changes are
+        written with bulk inserts and deletes. A single Basket update
+        and search index update is queued for this profile, no matter
+        how many memberships changed.
+
+        """
         if model is Group:
-            m2mfield = self.groups
             alias_model = GroupAlias
+            through = GroupMembership
         elif model is Skill:
-            m2mfield = self.skills
             alias_model = SkillAlias
+            through = UserProfile.skills.through
 
-        # Remove any visible groups that weren't supplied in this list.
+        names = set(name.lower() for name in membership_list)
+        aliases = alias_model.objects.filter(name__in=names).select_related('alias')
+        groups = dict((alias.name, alias.alias) for alias in aliases)
+        missing = names.difference(groups)
+        if missing:
+            groups.update(model.create_groups(missing))
+        wanted_ids = set(group.id for group in groups.values() if group.is_visible)
+
+        memberships = through.objects.filter(userprofile=self)
         if model is Group:
-            GroupMembership.objects.filter(userprofile=self, group__visible=True)\
-                .exclude(group__name__in=membership_list).delete()
+            current = dict(memberships.values_list('group_id', 'status'))
+            visible_ids = set(memberships.filter(group__visible=True)
+                              .values_list('group_id', flat=True))
         else:
-            m2mfield.remove(*[g for g in m2mfield.all()
-                              if g.name not in membership_list
-                              and g.is_visible])
-
-        # Add/create the rest of the groups
-        groups_to_add = []
-        for g in membership_list:
-            if alias_model.objects.filter(name=g).exists():
-                group = alias_model.objects.get(name=g).alias
-            else:
-                group = model.objects.create(name=g)
+            current = dict((skill_id, None) for skill_id in
+                           memberships.values_list('skill_id', flat=True))
+            visible_ids = set(current)
 
-            if group.is_visible:
-                groups_to_add.append(group)
+        # Remove any visible groups that weren't supplied in this list.
+        ids_to_remove = visible_ids - wanted_ids
+        ids_to_add = wanted_ids.difference(current)
+        if ids_to_remove:
+            if model is Group:
+                memberships.filter(group__in=ids_to_remove).delete()
+            else:
+                memberships.filter(skill__in=ids_to_remove).delete()
 
         if model is Group:
-            for group in groups_to_add:
-                group.add_member(self)
+            through.objects.bulk_create(
+                [GroupMembership(userprofile=self, group_id=group_id,
+                                 status=GroupMembership.MEMBER,
+                                 date_joined=now())
+                 for group_id in ids_to_add])
+            # Like Group.add_member(), supplying a group the user is
+            # pending in accepts their request.
+            ids_to_promote = [group_id for group_id in wanted_ids
+                              if current.get(group_id) == GroupMembership.PENDING]
+            if ids_to_promote:
+                memberships.filter(group__in=ids_to_promote).update(
+                    status=GroupMembership.MEMBER)
+                for group_id in ids_to_promote:
+                    email_membership_change.delay(group_id, self.user_id,
+                                                  GroupMembership.PENDING,
+                                                  GroupMembership.MEMBER)
         else:
-            m2mfield.add(*groups_to_add)
+            through.objects.bulk_create(
+                [through(userprofile=self, skill_id=skill_id) for skill_id in ids_to_add])
+            ids_to_promote = []
+
+        if ids_to_remove or ids_to_add or ids_to_promote:
+            # bulk_create() and update() do not send signals.
+            invalidate_api_cache()
+            ProfileChange.objects.create(userprofile_id=self.id,
+                                         change_type=ProfileChange.MEMBERSHIP)
+            invalidate_profile_version([self.id])
+            schedule_basket_update(self.id)
+            update_search_index(UserProfile, self)
 
     def get_photo_thumbnail(self, geometry='160x160', **kwargs):
         if 'crop' not in kwargs:
@@ -550,7 +674,7 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
         (Does not update the token field on the UserProfile.)
         """
         try:
-            result = basket.lookup_user(email=self.user.email)
+            result = basket_client.lookup_user(email=self.user.email)
         except basket.BasketException as exception:
             if exception.code == basket.errors.BASKET_UNKNOWN_EMAIL:
                 return None
@@ -586,7 +710,25 @@ class UserProfile(UserProfilePrivacyModel, SearchMixin):
     def save(self, *args, **kwargs):
         self._privacy_level = None
         self.auto_vouch()
+        update_fields = kwargs.get('update_fields')
+        # Only touch locations when what decides them or their counts
+        # changed since the profile was loaded or last saved.
+        state = tuple(getattr(self, field) for field in LOCATION_COUNT_FIELDS)
+        previous_state = self._saved_location_state
+        missing_location = self.location_id is None and self.country
+        track_location = ((state != previous_state or missing_location) and
+                          (update_fields is None or
+                           set(update_fields) & set(LOCATION_COUNT_FIELDS)))
+        if track_location:
+            previous_location_id = self.location_id
+            if state[:3] != previous_state[:3] or missing_location:
+                self.location = Location.for_profile(self)
+                if update_fields is not None:
+                    kwargs['update_fields'] = list(update_fields) + ['location']
         super(UserProfile, self).save(*args, **kwargs)
+        if track_location:
+            Location.refresh_counts([previous_location_id, self.location_id])
+            self._saved_location_state = state
 
     @classmethod
     def get_index(cls, public_index=False):
@@ -639,7 +781,7 @@ def create_user_profile(sender, instance, created, raw, **kwargs):
 @receiver(dbsignals.post_save, sender=UserProfile,
           dispatch_uid='update_basket_sig')
 def update_basket(sender, instance, **kwargs):
-    update_basket_task.delay(instance.id)
+    schedule_basket_update(instance.id)
 
 
 @receiver(dbsignals.post_save, sender=UserProfile,
@@ -667,6 +809,85 @@ def remove_from_basket(sender, instance, **kwargs):
                                   instance.userprofile.basket_token)
 
 
+@receiver(dbsignals.post_save, sender=UserProfile,
+          dispatch_uid='update_vouched_index_sig')
+def update_vouched_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _update_vouched_index(instance.user.email,
+                              (instance.is_complete and instance.is_vouched
+                               and instance.allows_community_sites))
+
+
+@receiver(dbsignals.pre_delete, sender=UserProfile,
+          dispatch_uid='remove_from_vouched_index_sig')
+def remove_from_vouched_index(sender, instance, **kwargs):
+    _update_vouched_index(instance.user.email, False)
+
+
+def _update_vouched_index(email, is_vouched):
+    if not vouched.update_index(email, is_vouched):
+        update_vouched_index_task.apply_async(
+            args=[email, is_vouched], countdown=VOUCHED_INDEX_RETRY_DELAY)
+
+
+@receiver(dbsignals.post_save, sender=UserProfile,
+          dispatch_uid='log_profile_update_sig')
+def log_profile_update(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ProfileChange.objects.create(userprofile_id=instance.id,
+                                     change_type=ProfileChange.UPDATED)
+
+
+# post_delete rather than pre_delete, so that the deletion is logged
+# after the changes of the memberships deleted along with the profile.
+@receiver(dbsignals.post_delete, sender=UserProfile,
+          dispatch_uid='log_profile_delete_sig')
+def log_profile_delete(sender, instance, **kwargs):
+    ProfileChange.objects.create(userprofile_id=instance.id,
+                                 change_type=ProfileChange.DELETED)
+
+
+@receiver(dbsignals.post_delete, sender=UserProfile,
+          dispatch_uid='refresh_location_count_sig')
+def refresh_location_count(sender, instance, **kwargs):
+    Location.refresh_counts([instance.location_id])
+
+
+@receiver(dbsignals.post_delete, sender=UserProfile,
+          dispatch_uid='invalidate_curated_groups_profile_delete_sig')
+def invalidate_curated_groups_on_profile_delete(sender, instance, **kwargs):
+    # Deleting a curator sets the curator of their groups to NULL,
+    # which sends no signal for the groups.
+    invalidate_curated_groups(Group)
+
+
+@receiver(dbsignals.post_save, sender=GroupMembership,
+          dispatch_uid='log_membership_save_sig')
+@receiver(dbsignals.post_delete, sender=GroupMembership,
+          dispatch_uid='log_membership_delete_sig')
+def log_membership_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ProfileChange.objects.create(userprofile_id=instance.userprofile_id,
+                                     change_type=ProfileChange.MEMBERSHIP)
+        invalidate_profile_version([instance.userprofile_id])
+
+
+@receiver(dbsignals.m2m_changed, sender=UserProfile.skills.through,
+          dispatch_uid='log_skills_change_sig')
+def log_skills_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance is a Skill, pk_set holds the userprofiles.
+        profile_ids = pk_set or []
+    else:
+        profile_ids = [instance.id]
+    ProfileChange.objects.bulk_create(
+        [ProfileChange(userprofile_id=profile_id, change_type=ProfileChange.MEMBERSHIP)
+         for profile_id in profile_ids])
+    invalidate_profile_version(profile_ids)
+
+
 class UsernameBlacklist(models.Model):
     value = models.CharField(max_length=30, unique=True)
     is_regex = models.BooleanField(default=False)
@@ -752,6 +973,10 @@ class ExternalAccount(models.Model):
 
     user = models.ForeignKey(UserProfile)
     identifier = models.CharField(max_length=255, verbose_name=_lazy(u'Account Username'))
+    # Lowercased identifier without the profile URL around it, set on
+    # save() and indexed for exact and prefix lookups.
+    normalized_identifier = models.CharField(max_length=255, default='', blank=True,
+                                             db_index=True)
     type = models.CharField(
         max_length=30,
         choices=sorted([(k, v['name'])
@@ -768,6 +993,41 @@ class ExternalAccount(models.Model):
         url = self.ACCOUNT_TYPES[self.type]['url'].format(identifier=urlquote(self.identifier))
         return iri_to_uri(url)
 
+    @classmethod
+    def _identifier_url_pattern(cls, account_type):
+        if account_type not in _identifier_url_patterns:
+            url = cls.ACCOUNT_TYPES.get(account_type, {}).get('url', '')
+            pattern = None
+            if url:
+                url = re.sub(r'^https?://(www\.)?', '', url)
+                before, after = url.split('{identifier}')
+                pattern = re.compile(r'^(?:https?://)?(?:www\.)?%s(?P<identifier>[^/?#]+)%s/?$'
+                                     % (re.escape(before), re.escape(after.rstrip('/'))),
+                                     re.IGNORECASE)
+            _identifier_url_patterns[account_type] = pattern
+        return _identifier_url_patterns[account_type]
+
+    @classmethod
+    def normalize_identifier(cls, identifier, account_type=None):
+        """Return identifier lowercased, without the profile URL of account_type.
+
+        For example https://github.com/Foo/ and foo both normalize to
+        foo as GitHub identifiers, and @Foo to foo as a Twitter one.
+        """
+        identifier = identifier.strip()
+        pattern = cls._identifier_url_pattern(account_type)
+        if pattern:
+            match = pattern.match(identifier)
+            if match:
+                identifier = unquote(match.group('identifier'))
+        if account_type == cls.TYPE_TWITTER:
+            identifier = identifier.lstrip('@')
+        return identifier.lower()
+
+    def save(self, *args, **kwargs):
+        self.normalized_identifier = self.normalize_identifier(self.identifier, self.type)
+        super(ExternalAccount, self).save(*args, **kwargs)
+
     def unique_error_message(self, model_class, unique_check):
         if model_class == type(self) and unique_check == ('identifier', 'type', 'user'):
             return _('You already have an account with this name and type.')
@@ -775,6 +1035,10 @@ class ExternalAccount(models.Model):
             return super(ExternalAccount, self).unique_error_message(model_class, unique_check)
 
 
+# Compiled profile URL patterns of ExternalAccount.ACCOUNT_TYPES.
+_identifier_url_patterns = {}
+
+
 class Language(models.Model):
     code = models.CharField(max_length=63, choices=get_languages_for_locale('en'))
     userprofile = models.ForeignKey(UserProfile)
@@ -790,3 +1054,45 @@ class Language(models.Model):
         if (model_class == type(self) and unique_check == ('code', 'userprofile')):
             return _('This language has already been selected.')
         return super(Language, self).unique_error_message(model_class, unique_check)
+
+
+class ProfileChange(models.Model):
+    """Append-only log of changes to profiles, read by the changes API.
+
+    Rows keep the id of the profile, not a foreign key, so that they
+    outlive deleted profiles. Old rows are removed by the
+    prune_profile_changes cron job.
+    """
+    UPDATED = 1
+    DELETED = 2
+    MEMBERSHIP = 3
+    CHANGE_TYPES = ((UPDATED, 'updated'),
+                    (DELETED, 'deleted'),
+                    (MEMBERSHIP, 'membership'))
+
+    userprofile_id = models.PositiveIntegerField()
+    change_type = models.PositiveSmallIntegerField(choices=CHANGE_TYPES)
+    created = models.DateTimeField(default=datetime.now, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __unicode__(self):
+        return u'%s %s' % (self.userprofile_id, self.get_change_type_display())
+
+
+@receiver(dbsignals.post_save, sender=ExternalAccount,
+          dispatch_uid='log_externalaccount_save_sig')
+@receiver(dbsignals.post_delete, sender=ExternalAccount,
+          dispatch_uid='log_externalaccount_delete_sig')
+@receiver(dbsignals.post_save, sender=Language,
+          dispatch_uid='log_language_save_sig')
+@receiver(dbsignals.post_delete, sender=Language,
+          dispatch_uid='log_language_delete_sig')
+def log_related_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    profile_id = getattr(instance, 'userprofile_id', None) or instance.user_id
+    ProfileChange.objects.create(userprofile_id=profile_id,
+                                 change_type=ProfileChange.UPDATED)
+    invalidate_profile_version([profile_id])
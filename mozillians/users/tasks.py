@@ -1,20 +1,28 @@
+from collections import defaultdict
 from datetime import datetime, timedelta
+from multiprocessing.pool import ThreadPool
+import hashlib
+import json
 import logging
 import os
+import time
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.db.models import get_model
 
 import basket
 import requests
 import pyes
-from basket.base import request
 from celery.task import task
 from celery.exceptions import MaxRetriesExceededError
+from django_statsd.clients import statsd
 from elasticutils.contrib.django import get_es
 
+from mozillians.users import basket_client, vouched
+from mozillians.users.basket_client import BASKET_CIRCUIT_RESET, BasketCircuitOpen
 from mozillians.users.managers import PUBLIC
 
 
@@ -26,7 +34,15 @@ BASKET_URL = getattr(settings, 'BASKET_URL', False)
 BASKET_NEWSLETTER = getattr(settings, 'BASKET_NEWSLETTER', False)
 BASKET_API_KEY = os.environ.get('BASKET_API_KEY', getattr(settings, 'BASKET_API_KEY', False))
 BASKET_ENABLED = all([BASKET_URL, BASKET_NEWSLETTER, BASKET_API_KEY])
+BASKET_SYNC_QUIET_PERIOD = getattr(settings, 'BASKET_SYNC_QUIET_PERIOD', 30)
+BASKET_SYNC_MAX_DELAY = getattr(settings, 'BASKET_SYNC_MAX_DELAY', 600)
+BASKET_RECONCILE_CHUNK_SIZE = 100
+BASKET_RECONCILE_CONCURRENCY = getattr(settings, 'BASKET_RECONCILE_CONCURRENCY', 4)
+BASKET_DIRTY_KEY = 'users:basket:dirty:{pk}'
+BASKET_PENDING_KEY = 'users:basket:pending:{pk}'
 INCOMPLETE_ACC_MAX_DAYS = 7
+VOUCHED_INDEX_RETRY_DELAY = 10
+VOUCHED_INDEX_MAX_RETRIES = 5
 
 
 def _email_basket_managers(action, email, error_message):
@@ -56,6 +72,70 @@ def _email_basket_managers(action, email, error_message):
               settings.BASKET_MANAGERS, fail_silently=False)
 
 
+def _requeue_basket_task(basket_task, *args):
+    """Run basket_task again once the Basket circuit may have closed.
+
+    Used instead of retrying, so that an outage neither uses up the
+    retries of every task nor emails BASKET_MANAGERS about each user.
+    """
+    statsd.incr('basket.circuit.requeued')
+    if getattr(settings, 'CELERY_ALWAYS_EAGER', False):
+        # The countdown would be ignored and the task would run into
+        # the open circuit again right away.
+        logger.warning('Basket is unavailable, dropping %s%r' % (basket_task.name, args))
+        return
+    basket_task.apply_async(args=args, countdown=BASKET_CIRCUIT_RESET)
+
+
+def schedule_basket_update(instance_id):
+    """Mark a userprofile as changed and schedule a Basket sync.
+
+    Only one sync per userprofile is queued at a time. It runs once no
+    further changes have been made for BASKET_SYNC_QUIET_PERIOD
+    seconds, or at the latest BASKET_SYNC_MAX_DELAY seconds after it
+    was scheduled, and sends the state of the profile at that time.
+    Calls folded into an already scheduled sync are counted in the
+    basket.sync.collapsed statsd counter.
+
+    """
+    if getattr(settings, 'CELERY_ALWAYS_EAGER', False):
+        # Countdowns are ignored when tasks run eagerly, there is
+        # nothing to wait for.
+        update_basket_task.delay(instance_id)
+        return
+
+    now = time.time()
+    cache.set(BASKET_DIRTY_KEY.format(pk=instance_id), now, BASKET_SYNC_MAX_DELAY * 2)
+    if cache.add(BASKET_PENDING_KEY.format(pk=instance_id), now, BASKET_SYNC_MAX_DELAY * 2):
+        statsd.incr('basket.sync.scheduled')
+        sync_basket_task.apply_async(args=[instance_id], countdown=BASKET_SYNC_QUIET_PERIOD)
+    else:
+        statsd.incr('basket.sync.collapsed')
+
+
+@task
+def sync_basket_task(instance_id):
+    """Run the Basket update scheduled by schedule_basket_update.
+
+    If the userprofile changed again during the quiet period, the sync
+    is postponed until the period has passed since the last change.
+
+    """
+    now = time.time()
+    pending_key = BASKET_PENDING_KEY.format(pk=instance_id)
+    scheduled = cache.get(pending_key) or now
+    changed = cache.get(BASKET_DIRTY_KEY.format(pk=instance_id)) or 0
+    wait = min(changed + BASKET_SYNC_QUIET_PERIOD,
+               scheduled + BASKET_SYNC_MAX_DELAY) - now
+    if wait > 0:
+        sync_basket_task.apply_async(args=[instance_id], countdown=wait)
+        return
+
+    # Changes from now on need a sync of their own.
+    cache.delete(pending_key)
+    update_basket_task.delay(instance_id)
+
+
 @task(default_retry_delay=BASKET_TASK_RETRY_DELAY,
       max_retries=BASKET_TASK_MAX_RETRIES)
 def update_basket_task(instance_id):
@@ -82,9 +162,12 @@ def update_basket_task(instance_id):
     if not instance.basket_token:
         # no token yet, they're probably not subscribed, so subscribe them.
         try:
-            basket.subscribe(instance.user.email,
-                             settings.BASKET_NEWSLETTER,
-                             trigger_welcome='N')
+            basket_client.subscribe(instance.user.email,
+                                    settings.BASKET_NEWSLETTER,
+                                    trigger_welcome='N')
+        except BasketCircuitOpen:
+            _requeue_basket_task(update_basket_task, instance_id)
+            return
         except (requests.exceptions.RequestException,
                 basket.BasketException) as exception:
             try:
@@ -106,26 +189,17 @@ def update_basket_phonebook_task(user_pk):
     Create or update profile information in the Exact Target PHONEBOOK
     data extension about the user.
     """
-    instance = User.objects.get(pk=user_pk).userprofile
+    UserProfile = get_model('users', 'UserProfile')
+    instance = UserProfile.objects.select_related('user').get(user=user_pk)
     email = instance.user.email
     if not BASKET_ENABLED or not instance.is_vouched:
         return
 
     GroupMembership = get_model('groups', 'GroupMembership')
-    Group = get_model('groups', 'Group')
-    data = {}
     # What groups is the user in?
-    user_group_pks = (instance.groups.filter(groupmembership__status=GroupMembership.MEMBER)
-                      .values_list('pk', flat=True))
-    for group in Group.objects.exclude(curator=None):
-        name = group.name.upper().replace(' ', '_')
-        data[name] = 'Y' if group.id in user_group_pks else 'N'
-
-    # User location if known
-    if instance.country:
-        data['country'] = instance.country
-    if instance.city:
-        data['city'] = instance.city
+    user_group_pks = set(instance.groups.filter(groupmembership__status=GroupMembership.MEMBER)
+                         .values_list('pk', flat=True))
+    data = _basket_phonebook_data(instance, user_group_pks)
 
     # We need their token to do the update
     token = instance.basket_token
@@ -133,6 +207,9 @@ def update_basket_phonebook_task(user_pk):
         msg = 'Cannot find user in Basket'
         try:
             token = instance.lookup_basket_token()
+        except BasketCircuitOpen:
+            _requeue_basket_task(update_basket_phonebook_task, user_pk)
+            return
         except (requests.exceptions.RequestException,
                 basket.BasketException) as exception:
             msg = exception.message
@@ -153,8 +230,11 @@ def update_basket_phonebook_task(user_pk):
 
     # We have a token, proceed with the update
     try:
-        request('post', 'custom_update_phonebook',
-                token=token, data=data)
+        basket_client.request('post', 'custom_update_phonebook',
+                              token=token, data=data)
+    except BasketCircuitOpen:
+        _requeue_basket_task(update_basket_phonebook_task, user_pk)
+        return
     except (requests.exceptions.RequestException,
             basket.BasketException) as exception:
         try:
@@ -162,6 +242,107 @@ def update_basket_phonebook_task(user_pk):
         except (MaxRetriesExceededError, basket.BasketException):
             _email_basket_managers('update_phonebook', email,
                                    exception.message)
+        return
+    UserProfile.objects.filter(pk=instance.pk).update(
+        basket_payload_hash=_basket_payload_hash(data))
+
+
+def _basket_phonebook_data(instance, user_group_pks):
+    """Return the PHONEBOOK data of userprofile instance.
+
+    user_group_pks are the ids of the groups instance is a full member of.
+    """
+    Group = get_model('groups', 'Group')
+    data = {}
+    for group_id, group_name in Group.get_curated_names():
+        name = group_name.upper().replace(' ', '_')
+        data[name] = 'Y' if group_id in user_group_pks else 'N'
+
+    # User location if known
+    if instance.country:
+        data['country'] = instance.country
+    if instance.city:
+        data['city'] = instance.city
+    return data
+
+
+def _basket_payload_hash(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True)).hexdigest()
+
+
+def _push_basket_phonebook(args):
+    """Send PHONEBOOK data to Basket, return the error message on failure."""
+    token, data = args
+    try:
+        basket_client.request('post', 'custom_update_phonebook', token=token, data=data)
+    except (requests.exceptions.RequestException, basket.BasketException,
+            BasketCircuitOpen) as exception:
+        return exception.message or repr(exception)
+    return None
+
+
+@task
+def reconcile_basket_task(instance_ids, force=False):
+    """Bring the Basket PHONEBOOK data of the given userprofiles up to date.
+
+    Profiles whose data hashes to the same value as at their last
+    successful sync are skipped, unless force is True. Profiles
+    without a basket token go through update_basket_task, which
+    subscribes them first. The rest are sent to Basket with at most
+    BASKET_RECONCILE_CONCURRENCY requests in flight.
+
+    Returns a dict with the number of profiles checked, skipped,
+    pushed, queued for subscription and failed.
+
+    """
+    stats = dict(checked=0, skipped=0, pushed=0, queued=0, failed=0)
+    if not BASKET_ENABLED:
+        return stats
+
+    UserProfile = get_model('users', 'UserProfile')
+    GroupMembership = get_model('groups', 'GroupMembership')
+    profiles = (UserProfile.objects.filter(id__in=instance_ids, is_vouched=True)
+                .order_by('id'))
+    memberships = (GroupMembership.objects
+                   .filter(userprofile__in=instance_ids, status=GroupMembership.MEMBER)
+                   .values_list('userprofile_id', 'group_id'))
+    user_group_pks = defaultdict(set)
+    for userprofile_id, group_id in memberships:
+        user_group_pks[userprofile_id].add(group_id)
+
+    to_push = []
+    for profile in profiles:
+        stats['checked'] += 1
+        if not profile.basket_token:
+            update_basket_task.delay(profile.id)
+            stats['queued'] += 1
+            continue
+        data = _basket_phonebook_data(profile, user_group_pks[profile.id])
+        payload_hash = _basket_payload_hash(data)
+        if not force and payload_hash == profile.basket_payload_hash:
+            stats['skipped'] += 1
+            continue
+        to_push.append((profile.id, profile.basket_token, data, payload_hash))
+
+    if to_push:
+        pool = ThreadPool(min(BASKET_RECONCILE_CONCURRENCY, len(to_push)))
+        try:
+            errors = pool.map(_push_basket_phonebook,
+                              [(item[1], item[2]) for item in to_push])
+        finally:
+            pool.close()
+            pool.join()
+
+        for (profile_id, token, data, payload_hash), error in zip(to_push, errors):
+            if error:
+                logger.error('Basket reconciliation failed for userprofile %s: %s'
+                             % (profile_id, error))
+                stats['failed'] += 1
+                continue
+            UserProfile.objects.filter(pk=profile_id).update(basket_payload_hash=payload_hash)
+            stats['pushed'] += 1
+
+    return stats
 
 
 @task(default_retry_delay=BASKET_TASK_RETRY_DELAY,
@@ -183,6 +364,9 @@ def remove_from_basket_task(email, basket_token):
         user = User.objects.get(email=email)
         try:
             basket_token = user.userprofile.lookup_basket_token()
+        except BasketCircuitOpen:
+            _requeue_basket_task(remove_from_basket_task, email, basket_token)
+            return
         except basket.BasketException as exception:
             try:
                 remove_from_basket_task.retry()
@@ -200,8 +384,11 @@ def remove_from_basket_task(email, basket_token):
         UserProfile.objects.filter(user__email=email).update(basket_token=basket_token)
 
     try:
-        basket.unsubscribe(basket_token, email,
-                           newsletters=settings.BASKET_NEWSLETTER)
+        basket_client.unsubscribe(basket_token, email,
+                                  newsletters=settings.BASKET_NEWSLETTER)
+    except BasketCircuitOpen:
+        _requeue_basket_task(remove_from_basket_task, email, basket_token)
+        return
     except (requests.exceptions.RequestException,
             basket.BasketException), exception:
         try:
@@ -255,3 +442,18 @@ def remove_incomplete_accounts(days=INCOMPLETE_ACC_MAX_DAYS):
     now = datetime.now() - timedelta(days=days)
     (User.objects.filter(date_joined__lt=now)
      .filter(userprofile__full_name='').delete())
+
+
+@task(ignore_result=True, default_retry_delay=VOUCHED_INDEX_RETRY_DELAY,
+      max_retries=VOUCHED_INDEX_MAX_RETRIES)
+def update_vouched_index_task(email, is_vouched):
+    """Update the vouched index, retrying while another process updates it.
+
+    Queued when update_index() finds the index locked on a request.
+    If the retries run out, the nightly rebuild_vouched_index fixes it.
+    """
+    if not vouched.update_index(email, is_vouched):
+        try:
+            update_vouched_index_task.retry()
+        except MaxRetriesExceededError:
+            logger.warning('Could not update the vouched index for %s' % email)
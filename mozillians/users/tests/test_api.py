@@ -1,19 +1,25 @@
 # -*- coding: utf-8 -*-
+import gzip
 import json
+import time
+from datetime import datetime
+from StringIO import StringIO
 
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test.client import Client
 from django.test.utils import override_settings
 
 from funfactory.helpers import urlparams
 from funfactory.utils import absolutify
+from mock import patch
 from nose.tools import eq_, ok_
 
 from mozillians.api.tests import APIAppFactory
 from mozillians.common.tests import TestCase
 from mozillians.groups.tests import GroupFactory, SkillFactory
-from mozillians.users.models import ExternalAccount
-from mozillians.users.tests import UserFactory
+from mozillians.users.models import ExternalAccount, ProfileChange, UserProfile
+from mozillians.users.tests import LanguageFactory, UserFactory
 
 
 class UserResourceTests(TestCase):
@@ -49,6 +55,70 @@ class UserResourceTests(TestCase):
         eq_(response.status_code, 200)
         ok_(json.loads(response.content))
 
+    def _count_queries(self, url):
+        use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        start = len(connection.queries)
+        try:
+            response = Client().get(url, follow=True)
+        finally:
+            connection.use_debug_cursor = use_debug_cursor
+        eq_(response.status_code, 200)
+        return len(connection.queries) - start
+
+    def test_get_list_constant_queries(self):
+        LanguageFactory.create(userprofile=self.user.userprofile)
+        # Load the API apps once, so that both counts skip it.
+        self._count_queries(self.mozilla_resource_url)
+        queries = self._count_queries(self.mozilla_resource_url)
+        ok_(queries <= 8)
+
+        group = GroupFactory.create()
+        skill = SkillFactory.create()
+        for i in range(10):
+            profile = UserFactory.create().userprofile
+            group.add_member(profile)
+            profile.skills.add(skill)
+            LanguageFactory.create(userprofile=profile)
+            profile.externalaccount_set.create(type=ExternalAccount.TYPE_SUMO,
+                                               identifier='Apitest%d' % i)
+        eq_(self._count_queries(self.mozilla_resource_url), queries)
+
+    def test_get_list_not_modified(self):
+        client = Client()
+        response = client.get(self.mozilla_resource_url, follow=True)
+        eq_(response.status_code, 200)
+        etag = response['ETag']
+        ok_(etag)
+
+        with self.assertNumQueries(2):
+            response = client.get(self.mozilla_resource_url, follow=True,
+                                  HTTP_IF_NONE_MATCH=etag)
+        eq_(response.status_code, 304)
+        eq_(response.content, '')
+
+        self.user.userprofile.full_name = 'Changed'
+        self.user.userprofile.save()
+        response = client.get(self.mozilla_resource_url, follow=True,
+                              HTTP_IF_NONE_MATCH=etag)
+        eq_(response.status_code, 200)
+        ok_(response['ETag'] != etag)
+
+    def test_get_list_etag_per_query(self):
+        client = Client()
+        etag = client.get(self.mozilla_resource_url, follow=True)['ETag']
+        url = urlparams(self.mozilla_resource_url, country='gr')
+        ok_(client.get(url, follow=True)['ETag'] != etag)
+
+    @override_settings(API_PAGE_CACHE_TIMEOUT=60)
+    def test_get_list_page_cache(self):
+        client = Client()
+        response = client.get(self.mozilla_resource_url, follow=True)
+        with self.assertNumQueries(2):
+            cached = client.get(self.mozilla_resource_url, follow=True)
+        eq_(cached.status_code, 200)
+        eq_(cached.content, response.content)
+
     def test_get_list_community_app(self):
         client = Client()
         response = client.get(self.community_resource_url, follow=True)
@@ -165,12 +235,49 @@ class UserResourceTests(TestCase):
         user_2.userprofile.externalaccount_set.create(type=ExternalAccount.TYPE_SUMO,
                                                       identifier='AccountTest')
 
-        url = urlparams(self.mozilla_resource_url, accounts='count')
+        url = urlparams(self.mozilla_resource_url, accounts='count',
+                        accounts_match='contains')
         response = client.get(url, follow=True)
         data = json.loads(response.content)
         eq_(len(data['objects']), 2)
         eq_(data['objects'][0]['accounts'][0]['identifier'], 'AccountTest')
 
+    def test_search_accounts_exact(self):
+        user = UserFactory.create()
+        user.userprofile.externalaccount_set.create(type=ExternalAccount.TYPE_SUMO,
+                                                    identifier='AccountTest')
+        url = urlparams(self.mozilla_resource_url, accounts='accounttest')
+        data = json.loads(Client().get(url, follow=True).content)
+        eq_([obj['id'] for obj in data['objects']], [user.userprofile.id])
+
+        url = urlparams(self.mozilla_resource_url, accounts='count')
+        data = json.loads(Client().get(url, follow=True).content)
+        eq_(data['objects'], [])
+
+    def test_search_accounts_prefix(self):
+        user = UserFactory.create()
+        user.userprofile.externalaccount_set.create(type=ExternalAccount.TYPE_SUMO,
+                                                    identifier='AccountTest')
+        url = urlparams(self.mozilla_resource_url, accounts='Account',
+                        accounts_match='prefix')
+        data = json.loads(Client().get(url, follow=True).content)
+        eq_([obj['id'] for obj in data['objects']], [user.userprofile.id])
+
+    def test_search_accounts_type(self):
+        user = UserFactory.create()
+        user.userprofile.externalaccount_set.create(type=ExternalAccount.TYPE_GITHUB,
+                                                    identifier='https://github.com/Foo')
+        UserFactory.create().userprofile.externalaccount_set.create(
+            type=ExternalAccount.TYPE_SUMO, identifier='foo')
+        url = urlparams(self.mozilla_resource_url, accounts='github.com/foo/',
+                        accounts_type='github')
+        data = json.loads(Client().get(url, follow=True).content)
+        eq_([obj['id'] for obj in data['objects']], [user.userprofile.id])
+
+    def test_search_accounts_invalid_match(self):
+        url = urlparams(self.mozilla_resource_url, accounts='foo', accounts_match='fuzzy')
+        eq_(Client().get(url, follow=True).status_code, 400)
+
     def test_search_skills(self):
         client = Client()
         skill_1 = SkillFactory.create()
@@ -349,3 +456,232 @@ class UserResourceTests(TestCase):
         data = json.loads(response.content)
         eq_(response.status_code, 200)
         eq_(len(data['objects']), 1)
+
+    def test_sparse_fields(self):
+        url = urlparams(self.mozilla_resource_url, email=self.user.email,
+                        fields='id,full_name,groups')
+        data = json.loads(Client().get(url, follow=True).content)
+        eq_(data['objects'],
+            [{'id': self.user.userprofile.id,
+              'full_name': self.user.userprofile.full_name,
+              'groups': [group.name for group in self.user.userprofile.groups.all()]}])
+
+    def test_sparse_fields_fewer_queries(self):
+        sparse_url = urlparams(self.mozilla_resource_url, fields='id,full_name,email')
+        self._count_queries(sparse_url)
+        ok_(self._count_queries(sparse_url) < self._count_queries(self.mozilla_resource_url))
+
+    def test_sparse_fields_mozillian_app_does_not_allow_mozilla_sites(self):
+        user = UserFactory.create(userprofile={'allows_mozilla_sites': False})
+        url = urlparams(self.mozilla_resource_url, email=user.email,
+                        fields='full_name,email')
+        data = json.loads(Client().get(url, follow=True).content)
+        eq_(data['objects'], [{'email': user.email}])
+
+    def test_sparse_fields_community_app(self):
+        user = UserFactory.create()
+        url = urlparams(self.community_resource_url, email=user.email,
+                        fields='email,city')
+        data = json.loads(Client().get(url, follow=True).content)
+        eq_(data['objects'], [{'email': user.email}])
+
+    def test_sparse_fields_unknown(self):
+        url = urlparams(self.mozilla_resource_url, fields='id,password')
+        eq_(Client().get(url, follow=True).status_code, 400)
+
+
+class UserExportTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.url = reverse('api_users_export',
+                           kwargs={'api_name': 'v1', 'resource_name': 'users'})
+        self.mozilla_app = APIAppFactory.create(is_mozilla_app=True)
+        self.community_app = APIAppFactory.create(is_mozilla_app=False)
+
+    def _export(self, app, **kwargs):
+        headers = kwargs.pop('headers', {})
+        url = urlparams(self.url, app_name=app.name, app_key=app.key, **kwargs)
+        return Client().get(url, **headers)
+
+    def _lines(self, response):
+        return [json.loads(line) for line in
+                ''.join(response.streaming_content).splitlines()]
+
+    def test_export(self):
+        UserFactory.create(userprofile={'full_name': ''})
+        response = self._export(self.mozilla_app)
+        eq_(response.status_code, 200)
+        eq_(response['Content-Type'], 'application/x-ndjson')
+        lines = self._lines(response)
+        profiles = UserProfile.objects.complete().order_by('id')
+        eq_([line['id'] for line in lines], [profile.id for profile in profiles])
+        eq_(lines[0]['email'], profiles[0].user.email)
+
+    def test_export_restricted(self):
+        UserFactory.create(userprofile={'allows_mozilla_sites': False})
+        lines = self._lines(self._export(self.mozilla_app))
+        restricted = [line for line in lines if 'full_name' not in line]
+        eq_(len(restricted), 1)
+        eq_(set(restricted[0].keys()), set(['email', 'is_vouched']))
+
+    def test_export_community_app(self):
+        eq_(self._export(self.community_app).status_code, 403)
+
+    @patch('mozillians.users.api.EXPORT_CHUNK_SIZE', 2)
+    def test_export_chunks(self):
+        for i in range(4):
+            UserFactory.create()
+        lines = self._lines(self._export(self.mozilla_app))
+        eq_(len(lines), UserProfile.objects.complete().count())
+
+    def test_export_since(self):
+        response = self._export(self.mozilla_app)
+        since = int(response['X-Export-Started'])
+        UserProfile.objects.filter(pk=self.user.userprofile.pk).update(
+            last_updated=datetime.fromtimestamp(since + 10))
+        lines = self._lines(self._export(self.mozilla_app, since=since + 5))
+        eq_([line['id'] for line in lines], [self.user.userprofile.id])
+
+    def test_export_invalid_since(self):
+        eq_(self._export(self.mozilla_app, since='yesterday').status_code, 400)
+
+    def test_export_gzip(self):
+        response = self._export(self.mozilla_app,
+                                headers={'HTTP_ACCEPT_ENCODING': 'gzip, deflate'})
+        eq_(response['Content-Encoding'], 'gzip')
+        content = gzip.GzipFile(
+            fileobj=StringIO(''.join(response.streaming_content))).read()
+        eq_(len(content.splitlines()), UserProfile.objects.complete().count())
+
+
+@override_settings(PROFILE_CHANGES_DELAY=0)
+class ChangeResourceTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.url = reverse('api_dispatch_list',
+                           kwargs={'api_name': 'v1', 'resource_name': 'changes'})
+        self.mozilla_app = APIAppFactory.create(is_mozilla_app=True)
+        self.community_app = APIAppFactory.create(is_mozilla_app=False)
+
+    def _get(self, app, url=None, **kwargs):
+        url = urlparams(url or self.url, app_name=app.name, app_key=app.key, **kwargs)
+        return Client().get(url, follow=True)
+
+    def test_list(self):
+        profile = self.user.userprofile
+        ProfileChange.objects.all().delete()
+        profile.save()
+        GroupFactory.create().add_member(profile)
+        response = self._get(self.mozilla_app)
+        eq_(response.status_code, 200)
+        data = json.loads(response.content)
+        eq_([(change['profile'], change['change_type']) for change in data['objects']],
+            [(profile.id, 'updated'), (profile.id, 'membership')])
+        eq_(data['meta']['next'], None)
+
+    def test_pages(self):
+        ProfileChange.objects.all().delete()
+        for i in range(3):
+            self.user.userprofile.save()
+        ids = list(ProfileChange.objects.values_list('id', flat=True))
+        data = json.loads(self._get(self.mozilla_app, limit=2).content)
+        eq_([change['id'] for change in data['objects']], ids[:2])
+
+        response = Client().get(data['meta']['next'], follow=True)
+        data = json.loads(response.content)
+        eq_([change['id'] for change in data['objects']], ids[2:])
+        eq_(data['meta']['next'], None)
+
+    def test_since(self):
+        ProfileChange.objects.all().delete()
+        self.user.userprofile.save()
+        change = ProfileChange.objects.get()
+        since = int(time.mktime(change.created.timetuple()))
+        ProfileChange.objects.filter(pk=change.pk).update(
+            created=datetime.fromtimestamp(since - 10))
+        self.user.userprofile.save()
+        data = json.loads(self._get(self.mozilla_app, since=since - 5).content)
+        eq_(len(data['objects']), 1)
+
+    def test_invalid_since(self):
+        eq_(self._get(self.mozilla_app, since='yesterday').status_code, 400)
+
+    def test_delay(self):
+        ProfileChange.objects.all().delete()
+        self.user.userprofile.save()
+        with self.settings(PROFILE_CHANGES_DELAY=60):
+            data = json.loads(self._get(self.mozilla_app).content)
+        eq_(data['objects'], [])
+
+    def test_community_app(self):
+        eq_(self._get(self.community_app).status_code, 403)
+
+    def test_not_modified(self):
+        ProfileChange.objects.all().delete()
+        self.user.userprofile.save()
+        url = urlparams(self.url, app_name=self.mozilla_app.name,
+                        app_key=self.mozilla_app.key)
+        client = Client()
+        etag = client.get(url, follow=True)['ETag']
+        # The page is validated by its own rows, without counting the log.
+        with patch('mozillians.api.resources.Max') as max_mock:
+            response = client.get(url, follow=True, HTTP_IF_NONE_MATCH=etag)
+        eq_(response.status_code, 304)
+        ok_(not max_mock.called)
+
+        ProfileChange.objects.create(userprofile_id=self.user.userprofile.id,
+                                     change_type=ProfileChange.UPDATED)
+        response = client.get(url, follow=True, HTTP_IF_NONE_MATCH=etag)
+        eq_(response.status_code, 200)
+
+
+class VouchedLookupTests(TestCase):
+    def setUp(self):
+        self.url = reverse('api_users_vouched',
+                           kwargs={'api_name': 'v1', 'resource_name': 'users'})
+        self.mozilla_app = APIAppFactory.create(is_mozilla_app=True)
+        self.community_app = APIAppFactory.create(is_mozilla_app=False)
+
+    def _url(self, app, **kwargs):
+        return urlparams(self.url, app_name=app.name, app_key=app.key, **kwargs)
+
+    def test_lookup(self):
+        vouched = UserFactory.create()
+        unvouched = UserFactory.create(vouched=False)
+        url = self._url(self.mozilla_app,
+                        emails='%s,foo@example.com' % vouched.email.upper(),
+                        usernames=unvouched.username)
+        # Warm the app table cache of AppAuthentication.
+        Client().get(url, follow=True)
+        with self.assertNumQueries(1):
+            response = Client().get(url, follow=True)
+        eq_(response.status_code, 200)
+        data = json.loads(response.content)
+        eq_(sorted(data['objects']),
+            sorted([{'email': vouched.email, 'is_vouched': True},
+                    {'email': unvouched.email, 'is_vouched': False}]))
+        eq_(data['meta']['not_found'], ['foo@example.com'])
+
+    def test_lookup_post(self):
+        user = UserFactory.create()
+        response = Client().post(self._url(self.mozilla_app),
+                                 {'emails': [user.email, 'foo@example.com']})
+        data = json.loads(response.content)
+        eq_(data['objects'], [{'email': user.email, 'is_vouched': True}])
+
+    def test_community_app(self):
+        user = UserFactory.create(userprofile={'allows_community_sites': False})
+        url = self._url(self.community_app, emails=user.email)
+        data = json.loads(Client().get(url, follow=True).content)
+        eq_(data['objects'], [])
+        eq_(data['meta']['not_found'], [user.email.lower()])
+
+    def test_no_values(self):
+        url = self._url(self.mozilla_app)
+        eq_(Client().get(url, follow=True).status_code, 400)
+
+    @patch('mozillians.users.api.VOUCHED_LOOKUP_MAX', 2)
+    def test_too_many_values(self):
+        url = self._url(self.mozilla_app, emails='a@example.com,b@example.com',
+                        usernames='c')
+        eq_(Client().get(url, follow=True).status_code, 400)
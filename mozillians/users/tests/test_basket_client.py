@@ -0,0 +1,85 @@
+from django.core.cache import cache
+from django.test.utils import override_settings
+
+import requests
+from mock import Mock, patch
+from nose.tools import eq_, ok_
+
+from mozillians.common.tests import TestCase
+from mozillians.users import basket_client
+from mozillians.users.basket_client import (CIRCUIT_FAILURES_KEY, CIRCUIT_OPEN_KEY,
+                                            BasketCircuitOpen)
+from mozillians.users.tasks import update_basket_phonebook_task
+from mozillians.users.tests import UserFactory
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        cache.delete(CIRCUIT_FAILURES_KEY)
+        cache.delete(CIRCUIT_OPEN_KEY)
+
+    def tearDown(self):
+        cache.delete(CIRCUIT_FAILURES_KEY)
+        cache.delete(CIRCUIT_OPEN_KEY)
+
+    @patch('mozillians.users.basket_client.BASKET_CIRCUIT_THRESHOLD', 3)
+    @patch('mozillians.users.basket_client.get_session')
+    def test_opens_after_repeated_failures(self, get_session_mock):
+        session = get_session_mock.return_value
+        session.request.side_effect = requests.exceptions.ConnectionError
+        for i in range(3):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                basket_client.request('post', 'subscribe')
+        ok_(basket_client.circuit_open())
+
+        with self.assertRaises(BasketCircuitOpen):
+            basket_client.request('post', 'subscribe')
+        eq_(session.request.call_count, 3)
+
+    @patch('mozillians.users.basket_client.BASKET_CIRCUIT_THRESHOLD', 2)
+    @patch('mozillians.users.basket_client.parse_response')
+    @patch('mozillians.users.basket_client.get_session')
+    def test_server_errors_count_as_failures(self, get_session_mock, parse_response_mock):
+        get_session_mock.return_value.request.return_value = Mock(status_code=503)
+        basket_client.request('post', 'subscribe')
+        basket_client.request('post', 'subscribe')
+        ok_(basket_client.circuit_open())
+
+    @patch('mozillians.users.basket_client.BASKET_CIRCUIT_THRESHOLD', 2)
+    @patch('mozillians.users.basket_client.parse_response')
+    @patch('mozillians.users.basket_client.get_session')
+    def test_success_resets_failures(self, get_session_mock, parse_response_mock):
+        session = get_session_mock.return_value
+        session.request.return_value = Mock(status_code=503)
+        basket_client.request('post', 'subscribe')
+        session.request.return_value = Mock(status_code=200)
+        basket_client.request('post', 'subscribe')
+        session.request.return_value = Mock(status_code=503)
+        basket_client.request('post', 'subscribe')
+        ok_(not basket_client.circuit_open())
+
+    @patch('mozillians.users.basket_client.get_session')
+    def test_timeouts(self, get_session_mock):
+        session = get_session_mock.return_value
+        session.request.return_value = Mock(status_code=200)
+        with patch('mozillians.users.basket_client.parse_response'):
+            basket_client.request('post', 'custom_update_phonebook', token='foo',
+                                  data={'city': 'athens'})
+        eq_(session.request.call_args[1]['timeout'],
+            (basket_client.BASKET_CONNECT_TIMEOUT, basket_client.BASKET_READ_TIMEOUT))
+        ok_(session.request.call_args[0][1].endswith('/news/custom_update_phonebook/foo/'))
+
+    def test_session_is_shared(self):
+        eq_(basket_client.get_session(), basket_client.get_session())
+
+    @patch('mozillians.users.tasks._email_basket_managers')
+    @patch('mozillians.users.tasks.update_basket_phonebook_task.apply_async')
+    def test_task_requeued_while_open(self, apply_async_mock, email_mock):
+        user = UserFactory.create(userprofile={'basket_token': 'token'})
+        cache.set(CIRCUIT_OPEN_KEY, True)
+        with override_settings(CELERY_ALWAYS_EAGER=False):
+            with patch('mozillians.users.tasks.BASKET_ENABLED', True):
+                update_basket_phonebook_task(user.pk)
+        apply_async_mock.assert_called_once_with(
+            args=(user.pk,), countdown=basket_client.BASKET_CIRCUIT_RESET)
+        ok_(not email_mock.called)
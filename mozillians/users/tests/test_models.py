@@ -14,11 +14,14 @@ from mock import Mock, call, patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.groups.models import Group, Skill
+from mozillians.groups.models import Group, GroupMembership, Skill
 from mozillians.groups.tests import (GroupAliasFactory, GroupFactory,
                                      SkillAliasFactory, SkillFactory)
+from mozillians.users import basket_client
 from mozillians.users.managers import (EMPLOYEES, MOZILLIANS, PUBLIC, PUBLIC_INDEXABLE_FIELDS)
-from mozillians.users.models import ExternalAccount, UserProfile, _calculate_photo_filename
+from mozillians.users.cron import refresh_location_counts
+from mozillians.users.models import (ExternalAccount, Location, ProfileChange,
+                                     UserProfile, _calculate_photo_filename)
 from mozillians.users.tests import LanguageFactory, UserFactory
 
 
@@ -27,7 +30,7 @@ class SignaledFunctionsTests(TestCase):
         user = User.objects.create(email='foo@example.com', username='foobar')
         ok_(user.userprofile)
 
-    @patch('mozillians.users.models.update_basket_task.delay')
+    @patch('mozillians.users.models.schedule_basket_update')
     def test_update_basket_post_save(self, update_basket_mock):
         user = UserFactory.create()
         update_basket_mock.assert_called_with(user.userprofile.id)
@@ -367,6 +370,44 @@ class UserProfileTests(TestCase):
         ok_(user.userprofile.groups.filter(name='bar').exists())
         eq_(user.userprofile.groups.count(), 1)
 
+    def test_set_membership_group_removes_unlisted(self):
+        group_1 = GroupFactory.create(name='foo')
+        group_2 = GroupFactory.create(name='bar')
+        user = UserFactory.create()
+        group_1.add_member(user.userprofile)
+        group_2.add_member(user.userprofile)
+        user.userprofile.set_membership(Group, ['foo'])
+        eq_(list(user.userprofile.groups.all()), [group_1])
+
+    def test_set_membership_group_accepts_pending(self):
+        group = GroupFactory.create(name='foo')
+        user = UserFactory.create()
+        group.add_member(user.userprofile, GroupMembership.PENDING)
+        user.userprofile.set_membership(Group, ['foo'])
+        ok_(group.has_member(user.userprofile))
+
+    @patch('mozillians.users.models.index_objects.delay')
+    @patch('mozillians.users.models.schedule_basket_update')
+    def test_set_membership_queues_one_update(self, update_basket_mock,
+                                              index_objects_mock):
+        GroupFactory.create(name='foo')
+        user = UserFactory.create()
+        update_basket_mock.reset_mock()
+        index_objects_mock.reset_mock()
+        user.userprofile.set_membership(Group, ['foo', 'bar', 'baz'])
+        update_basket_mock.assert_called_once_with(user.userprofile.id)
+        index_objects_mock.assert_called_once_with(
+            UserProfile, [user.userprofile.id], public_index=False)
+
+    @patch('mozillians.users.models.schedule_basket_update')
+    def test_set_membership_unchanged(self, update_basket_mock):
+        group = GroupFactory.create(name='foo')
+        user = UserFactory.create()
+        group.add_member(user.userprofile)
+        update_basket_mock.reset_mock()
+        user.userprofile.set_membership(Group, ['foo'])
+        ok_(not update_basket_mock.called)
+
     def test_set_membership_skill_matches_alias(self):
         group_1 = SkillFactory.create(name='foo')
         group_2 = SkillFactory.create(name='lo')
@@ -467,7 +508,7 @@ class UserProfileTests(TestCase):
 
         eq_(user_profile.vouched_by, None)
 
-    @patch.object(basket, 'lookup_user', autospec=basket.lookup_user)
+    @patch.object(basket_client, 'lookup_user', autospec=basket_client.lookup_user)
     def test_lookup_token_registered(self, mock_lookup_user):
         # Lookup token for a user with registered email
         # basket returns response with data, lookup_basket_token returns the token
@@ -477,7 +518,7 @@ class UserProfileTests(TestCase):
         result = profile.lookup_basket_token()
         eq_('FAKETOKEN', result)
 
-    @patch.object(basket, 'lookup_user', autospec=basket.lookup_user)
+    @patch.object(basket_client, 'lookup_user', autospec=basket_client.lookup_user)
     def test_lookup_token_unregistered(self, mock_lookup_user):
         # Lookup token for a user with no registered email
         # Basket raises unknown user exception, then lookup-token returns None
@@ -488,7 +529,7 @@ class UserProfileTests(TestCase):
         result = profile.lookup_basket_token()
         ok_(result is None)
 
-    @patch.object(basket, 'lookup_user', autospec=basket.lookup_user)
+    @patch.object(basket_client, 'lookup_user', autospec=basket_client.lookup_user)
     def test_lookup_token_exceptions(self, mock_lookup_user):
         # If basket raises any exception other than BASKET_UNKNOWN_EMAIL when
         # we call lookup_basket_token, lookup_basket_token passes it up the chain
@@ -553,12 +594,136 @@ class ExternalAccountTests(TestCase):
                                                      identifier=u'sammyウ')
         ok_('%E3%82%A6' in account.get_identifier_url())
 
+    def test_normalized_identifier(self):
+        profile = UserFactory.create().userprofile
+        account = profile.externalaccount_set.create(type=ExternalAccount.TYPE_GITHUB,
+                                                     identifier='https://www.github.com/Sammy/')
+        eq_(account.normalized_identifier, 'sammy')
+
+    def test_normalize_identifier(self):
+        normalize = ExternalAccount.normalize_identifier
+        eq_(normalize(' Sammy '), 'sammy')
+        eq_(normalize('@Sammy', ExternalAccount.TYPE_TWITTER), 'sammy')
+        eq_(normalize('sammy.makes.org', ExternalAccount.TYPE_WEBMAKER), 'sammy')
+        eq_(normalize('https://bugzilla.mozilla.org/user_profile?login=s%40example.com',
+                      ExternalAccount.TYPE_BMO), 's@example.com')
+        eq_(normalize('https://github.com/sammy', ExternalAccount.TYPE_SUMO),
+            'https://github.com/sammy')
+
     def test_urls_contain_identifiers(self):
         for value, account in ExternalAccount.ACCOUNT_TYPES.iteritems():
             if account['url']:
                 ok_('{identifier}' in account['url'])
 
 
+class ProfileChangeTests(TestCase):
+    def _changes(self, profile_id):
+        return list(ProfileChange.objects.filter(userprofile_id=profile_id)
+                    .values_list('change_type', flat=True))
+
+    def test_profile_update(self):
+        profile = UserFactory.create().userprofile
+        ProfileChange.objects.all().delete()
+        profile.full_name = 'Foo Bar'
+        profile.save()
+        eq_(self._changes(profile.id), [ProfileChange.UPDATED])
+
+    def test_profile_delete(self):
+        user = UserFactory.create()
+        profile_id = user.userprofile.id
+        ProfileChange.objects.all().delete()
+        with patch('mozillians.users.models.remove_from_basket_task'):
+            with patch('mozillians.users.models.unindex_objects'):
+                user.delete()
+        eq_(self._changes(profile_id)[-1], ProfileChange.DELETED)
+
+    def test_membership_change(self):
+        profile = UserFactory.create().userprofile
+        group = GroupFactory.create()
+        ProfileChange.objects.all().delete()
+        group.add_member(profile)
+        eq_(self._changes(profile.id), [ProfileChange.MEMBERSHIP])
+        ProfileChange.objects.all().delete()
+        group.remove_member(profile)
+        eq_(self._changes(profile.id), [ProfileChange.MEMBERSHIP])
+
+    def test_skills_change(self):
+        profile = UserFactory.create().userprofile
+        skill = SkillFactory.create()
+        ProfileChange.objects.all().delete()
+        profile.skills.add(skill)
+        eq_(self._changes(profile.id), [ProfileChange.MEMBERSHIP])
+
+    def test_related_change(self):
+        profile = UserFactory.create().userprofile
+        ProfileChange.objects.all().delete()
+        LanguageFactory.create(userprofile=profile)
+        profile.externalaccount_set.create(type=ExternalAccount.TYPE_MDN,
+                                           identifier='sammy')
+        eq_(self._changes(profile.id), [ProfileChange.UPDATED] * 2)
+
+
+class LocationTests(TestCase):
+    def test_normalized_location(self):
+        profile_1 = UserFactory.create(userprofile={'country': 'it',
+                                                    'city': 'San  Marino '}).userprofile
+        profile_2 = UserFactory.create(userprofile={'country': 'it',
+                                                    'city': 'san marino'}).userprofile
+        eq_(profile_1.location, profile_2.location)
+        location = Location.objects.get(id=profile_1.location_id)
+        eq_(location.city, 'san marino')
+        eq_(location.city_name, 'San Marino')
+        eq_(location.vouched_count, 2)
+
+    def test_no_country(self):
+        profile = UserFactory.create(userprofile={'country': ''}).userprofile
+        eq_(profile.location, None)
+
+    def test_counts_follow_profile(self):
+        profile = UserFactory.create(userprofile={'country': 'it'}).userprofile
+        italy = profile.location
+
+        profile.is_vouched = False
+        profile.save()
+        eq_(Location.objects.get(id=italy.id).vouched_count, 0)
+
+        profile.is_vouched = True
+        profile.country = 'fr'
+        profile.save()
+        eq_(Location.objects.get(id=italy.id).vouched_count, 0)
+        eq_(Location.objects.get(id=profile.location_id).vouched_count, 1)
+
+        location_id = profile.location_id
+        profile.delete()
+        eq_(Location.objects.get(id=location_id).vouched_count, 0)
+
+    def test_save_update_fields(self):
+        profile = UserFactory.create(userprofile={'country': 'it'}).userprofile
+        with patch('mozillians.users.models.Location.refresh_counts') as refresh_mock:
+            profile.save(update_fields=['ircname'])
+        ok_(not refresh_mock.called)
+
+        profile.country = 'fr'
+        profile.save(update_fields=['country'])
+        eq_(UserProfile.objects.get(id=profile.id).location.country, 'fr')
+
+    def test_save_unchanged_location(self):
+        profile = UserFactory.create(userprofile={'country': 'it'}).userprofile
+        profile = UserProfile.objects.get(id=profile.id)
+        profile.ircname = 'changed'
+        with patch('mozillians.users.models.Location') as location_mock:
+            profile.save()
+        ok_(not location_mock.for_profile.called)
+        ok_(not location_mock.refresh_counts.called)
+
+    def test_refresh_location_counts(self):
+        profile = UserFactory.create(userprofile={'country': 'it'}).userprofile
+        UserProfile.objects.filter(id=profile.id).update(is_vouched=False)
+        eq_(Location.objects.get(id=profile.location_id).vouched_count, 1)
+        refresh_location_counts()
+        eq_(Location.objects.get(id=profile.location_id).vouched_count, 0)
+
+
 class PrivacyModelTests(unittest.TestCase):
     def setUp(self):
         UserProfile.clear_privacy_fields_cache()
@@ -1,20 +1,29 @@
+import json
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 from contextlib import nested
 from datetime import datetime
+from urlparse import parse_qsl
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test.utils import override_settings
 
 from mock import MagicMock, Mock, call, patch
-from nose.tools import ok_
+from nose.tools import eq_, ok_
 from pyes.exceptions import ElasticSearchException
 
 from mozillians.common.tests import TestCase
 from mozillians.groups.tests import GroupFactory
 from mozillians.users.managers import PUBLIC
 from mozillians.users.models import UserProfile
-from mozillians.users.tasks import (_email_basket_managers, index_objects,
-                                    remove_incomplete_accounts, unindex_objects,
-                                    remove_from_basket_task, update_basket_task)
+from mozillians.users.cron import reconcile_basket
+from mozillians.users.tasks import (BASKET_DIRTY_KEY, BASKET_PENDING_KEY,
+                                    _email_basket_managers, index_objects,
+                                    reconcile_basket_task, remove_incomplete_accounts,
+                                    unindex_objects, remove_from_basket_task,
+                                    schedule_basket_update, sync_basket_task,
+                                    update_basket_task)
 from mozillians.users.tests import UserFactory
 
 
@@ -125,6 +134,54 @@ class BasketTests(TestCase):
         send_mail_mock.assert_called_with(
             subject, body, 'noreply', 'basket_managers', fail_silently=False)
 
+    @override_settings(CELERY_ALWAYS_EAGER=False)
+    @patch('mozillians.users.tasks.statsd.incr')
+    @patch('mozillians.users.tasks.sync_basket_task.apply_async')
+    def test_schedule_basket_update_collapses_calls(self, apply_async_mock, incr_mock):
+        cache.delete(BASKET_PENDING_KEY.format(pk=1))
+        for i in range(3):
+            schedule_basket_update(1)
+        apply_async_mock.assert_called_once_with(args=[1], countdown=30)
+        eq_(incr_mock.call_args_list,
+            [call('basket.sync.scheduled'), call('basket.sync.collapsed'),
+             call('basket.sync.collapsed')])
+        ok_(cache.get(BASKET_DIRTY_KEY.format(pk=1)))
+
+    @patch('mozillians.users.tasks.time.time')
+    @patch('mozillians.users.tasks.update_basket_task.delay')
+    @patch('mozillians.users.tasks.sync_basket_task.apply_async')
+    def test_sync_basket_task_postponed(self, apply_async_mock, update_mock, time_mock):
+        time_mock.return_value = 1000
+        cache.set(BASKET_PENDING_KEY.format(pk=1), 980)
+        cache.set(BASKET_DIRTY_KEY.format(pk=1), 990)
+        sync_basket_task(1)
+        apply_async_mock.assert_called_once_with(args=[1], countdown=20)
+        ok_(not update_mock.called)
+
+    @patch('mozillians.users.tasks.time.time')
+    @patch('mozillians.users.tasks.update_basket_task.delay')
+    @patch('mozillians.users.tasks.sync_basket_task.apply_async')
+    def test_sync_basket_task_max_delay(self, apply_async_mock, update_mock, time_mock):
+        time_mock.return_value = 1000
+        cache.set(BASKET_PENDING_KEY.format(pk=1), 300)
+        cache.set(BASKET_DIRTY_KEY.format(pk=1), 995)
+        sync_basket_task(1)
+        ok_(not apply_async_mock.called)
+        update_mock.assert_called_once_with(1)
+        ok_(not cache.get(BASKET_PENDING_KEY.format(pk=1)))
+
+    @patch('mozillians.users.tasks.time.time')
+    @patch('mozillians.users.tasks.update_basket_task.delay')
+    @patch('mozillians.users.tasks.sync_basket_task.apply_async')
+    def test_sync_basket_task_quiet(self, apply_async_mock, update_mock, time_mock):
+        time_mock.return_value = 1000
+        cache.set(BASKET_PENDING_KEY.format(pk=1), 940)
+        cache.set(BASKET_DIRTY_KEY.format(pk=1), 950)
+        sync_basket_task(1)
+        ok_(not apply_async_mock.called)
+        update_mock.assert_called_once_with(1)
+        ok_(not cache.get(BASKET_PENDING_KEY.format(pk=1)))
+
     @override_settings(BASKET_NEWSLETTER='newsletter')
     @patch('mozillians.users.tasks.BASKET_ENABLED', True)
     def test_update_basket_task_with_token(self):
@@ -140,8 +197,8 @@ class BasketTests(TestCase):
                 'WEB_DEVELOPMENT': 'Y',
                 'MARKETING': 'N'}
 
-        with nested(patch('mozillians.users.tasks.basket.subscribe'),
-                    patch('mozillians.users.tasks.request')) \
+        with nested(patch('mozillians.users.tasks.basket_client.subscribe'),
+                    patch('mozillians.users.tasks.basket_client.request')) \
                 as (subscribe_mock, request_mock):
             update_basket_task(user.userprofile.id)
 
@@ -151,10 +208,11 @@ class BasketTests(TestCase):
 
     @override_settings(BASKET_NEWSLETTER='newsletter')
     @patch('mozillians.users.tasks.BASKET_ENABLED', True)
-    @patch('mozillians.users.tasks.request')
+    @patch('mozillians.users.tasks.basket_client.request')
     @patch.object(UserProfile, 'lookup_basket_token')
-    @patch('mozillians.users.tasks.basket')
-    def test_update_basket_task_without_token(self, basket_mock, lookup_token_mock, request_mock):
+    @patch('mozillians.users.tasks.basket_client.subscribe')
+    def test_update_basket_task_without_token(self, subscribe_mock, lookup_token_mock,
+                                              request_mock):
         lookup_token_mock.return_value = "basket_token"
 
         user = UserFactory.create(userprofile={'country': 'gr',
@@ -168,11 +226,11 @@ class BasketTests(TestCase):
                 'WEB_DEVELOPMENT': 'Y',
                 'MARKETING': 'N'}
 
-        basket_mock.subscribe.return_value = {}
+        subscribe_mock.return_value = {}
 
         update_basket_task(user.userprofile.id)
 
-        basket_mock.subscribe.assert_called_with(
+        subscribe_mock.assert_called_with(
             user.email, 'newsletter', trigger_welcome='N')
         request_mock.assert_called_with(
             'post', 'custom_update_phonebook', token='basket_token', data=data)
@@ -181,7 +239,7 @@ class BasketTests(TestCase):
 
     @override_settings(BASKET_NEWSLETTER='newsletter')
     @patch('mozillians.users.tasks.BASKET_ENABLED', True)
-    @patch('mozillians.users.tasks.basket.unsubscribe')
+    @patch('mozillians.users.tasks.basket_client.unsubscribe')
     def test_remove_from_basket_task(self, unsubscribe_mock):
         user = UserFactory.create(userprofile={'basket_token': 'foo'})
         remove_from_basket_task(user.email, user.userprofile.basket_token)
@@ -190,7 +248,7 @@ class BasketTests(TestCase):
 
     @override_settings(BASKET_NEWSLETTER='newsletter')
     @patch('mozillians.users.tasks.BASKET_ENABLED', True)
-    @patch('mozillians.users.tasks.basket.unsubscribe')
+    @patch('mozillians.users.tasks.basket_client.unsubscribe')
     @patch.object(UserProfile, 'lookup_basket_token')
     def test_remove_from_basket_task_without_token(self, lookup_token_mock, unsubscribe_mock):
         lookup_token_mock.return_value = 'basket_token'
@@ -199,3 +257,93 @@ class BasketTests(TestCase):
         user = User.objects.get(pk=user.pk)  # refresh data from DB
         unsubscribe_mock.assert_called_with(
             'basket_token', user.email, newsletters='newsletter')
+
+
+class FakeBasketHandler(BaseHTTPRequestHandler):
+    """Answer phonebook updates, failing for the token 'broken'."""
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length', 0))
+        data = dict(parse_qsl(self.rfile.read(length)))
+        self.server.received.append((self.path, data))
+        if self.path.rstrip('/').endswith('/broken'):
+            self.send_response(400)
+            body = {'status': 'error', 'desc': 'broken token'}
+        else:
+            self.send_response(200)
+            body = {'status': 'ok'}
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps(body))
+
+    def log_message(self, *args):
+        pass
+
+
+class BasketReconcileTests(TestCase):
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeBasketHandler)
+        self.server.received = []
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.patches = [patch('basket.base.BASKET_URL', url),
+                        patch('mozillians.users.tasks.BASKET_ENABLED', True)]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _reconcile(self, *args, **kwargs):
+        with nested(*self.patches):
+            return reconcile_basket_task(*args, **kwargs)
+
+    def test_push_and_skip_unchanged(self):
+        user = UserFactory.create(userprofile={'basket_token': 'token',
+                                               'country': 'gr'})
+        group = GroupFactory.create(name='Web Development', curator=user.userprofile)
+        group.add_member(user.userprofile)
+        ids = [user.userprofile.id]
+
+        stats = self._reconcile(ids)
+        eq_(stats['pushed'], 1)
+        eq_(self.server.received,
+            [('/news/custom_update_phonebook/token/',
+              {'country': 'gr', 'WEB_DEVELOPMENT': 'Y'})])
+        ok_(UserProfile.objects.get(pk=user.userprofile.id).basket_payload_hash)
+
+        stats = self._reconcile(ids)
+        eq_(stats['skipped'], 1)
+        eq_(stats['pushed'], 0)
+        eq_(len(self.server.received), 1)
+
+        stats = self._reconcile(ids, force=True)
+        eq_(stats['pushed'], 1)
+        eq_(len(self.server.received), 2)
+
+    def test_failures(self):
+        user = UserFactory.create(userprofile={'basket_token': 'broken'})
+        stats = self._reconcile([user.userprofile.id])
+        eq_(stats['failed'], 1)
+        eq_(stats['pushed'], 0)
+        eq_(UserProfile.objects.get(pk=user.userprofile.id).basket_payload_hash, '')
+
+    @patch('mozillians.users.tasks.update_basket_task.delay')
+    def test_without_token(self, update_basket_mock):
+        user = UserFactory.create(userprofile={'basket_token': ''})
+        stats = self._reconcile([user.userprofile.id])
+        eq_(stats['queued'], 1)
+        update_basket_mock.assert_called_once_with(user.userprofile.id)
+        eq_(self.server.received, [])
+
+    def test_cron_walks_vouched_profiles(self):
+        users = [UserFactory.create(userprofile={'basket_token': 'token%d' % i})
+                 for i in range(3)]
+        UserFactory.create(vouched=False, userprofile={'basket_token': 'unvouched'})
+        users.append(UserFactory.create(userprofile={'basket_token': 'broken'}))
+
+        with nested(*self.patches):
+            totals = reconcile_basket()
+        eq_(totals, dict(checked=4, skipped=0, pushed=3, queued=0, failed=1))
+        eq_(len(self.server.received), 4)
@@ -0,0 +1,143 @@
+import json
+
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+
+from funfactory.helpers import urlparams
+from mock import patch
+from nose.tools import eq_, ok_
+
+from mozillians.api.tests import APIAppFactory
+from mozillians.common.tests import TestCase
+from mozillians.users import vouched
+from mozillians.users.tests import UserFactory
+from mozillians.users.vouched import (VOUCHED_INDEX_LOCK_KEY, VOUCHED_INDEX_SHARD_KEYS,
+                                      VOUCHED_INDEX_VERSION_KEY, DigestSet,
+                                      email_digest)
+
+
+class DigestSetTests(TestCase):
+    def test_contains(self):
+        digests = [email_digest('%d@example.com' % i) for i in range(50)]
+        index = DigestSet.from_digests(digests)
+        eq_(len(index), 50)
+        ok_(all(digest in index for digest in digests))
+        ok_(email_digest('foo@example.com') not in index)
+
+    def test_add_discard(self):
+        index = DigestSet()
+        digests = [email_digest('%d@example.com' % i) for i in range(10)]
+        for digest in digests + digests:
+            index.add(digest)
+        eq_(index.data, DigestSet.from_digests(digests).data)
+        index.discard(digests[3])
+        index.discard(email_digest('foo@example.com'))
+        eq_(len(index), 9)
+        ok_(digests[3] not in index)
+
+    def test_case_insensitive(self):
+        eq_(email_digest('Foo@Example.com '), email_digest('foo@example.com'))
+
+
+class VouchedIndexTests(TestCase):
+    def setUp(self):
+        cache.delete_many(VOUCHED_INDEX_SHARD_KEYS)
+        cache.delete(VOUCHED_INDEX_LOCK_KEY)
+        vouched._local.clear()
+
+    def test_build(self):
+        user = UserFactory.create()
+        unvouched = UserFactory.create(vouched=False)
+        private = UserFactory.create(userprofile={'allows_community_sites': False})
+        ok_(vouched.is_vouched_email(user.email))
+        ok_(not vouched.is_vouched_email(unvouched.email))
+        ok_(not vouched.is_vouched_email(private.email))
+
+    def test_shards(self):
+        users = [UserFactory.create() for i in range(5)]
+        index = vouched.build_index()
+        shards = cache.get_many(VOUCHED_INDEX_SHARD_KEYS)
+        eq_(len(shards), 256)
+        eq_(''.join(shards[key] for key in VOUCHED_INDEX_SHARD_KEYS), index.data)
+        # Another process loads the index from the shards.
+        vouched._local.clear()
+        with self.assertNumQueries(0):
+            ok_(all(vouched.is_vouched_email(user.email) for user in users))
+
+    def test_failed_store_keeps_index(self):
+        user = UserFactory.create()
+        with patch('mozillians.users.vouched.cache.set_many'):
+            vouched.get_index()
+        with self.assertNumQueries(0):
+            ok_(vouched.is_vouched_email(user.email))
+            ok_(vouched.is_vouched_email(user.email))
+
+    def test_lookup_without_queries(self):
+        user = UserFactory.create()
+        vouched.get_index()
+        with self.assertNumQueries(0):
+            ok_(vouched.is_vouched_email(user.email))
+
+    def test_incremental_update(self):
+        user = UserFactory.create(vouched=False)
+        ok_(not vouched.is_vouched_email(user.email))
+        user.userprofile.is_vouched = True
+        user.userprofile.save()
+        with self.assertNumQueries(0):
+            ok_(vouched.is_vouched_email(user.email))
+
+        user.delete()
+        ok_(not vouched.is_vouched_email(user.email))
+
+    @patch('mozillians.users.models.update_vouched_index_task')
+    def test_concurrent_update(self, update_vouched_index_task_mock):
+        user = UserFactory.create()
+        vouched.get_index()
+        shards = cache.get_many(VOUCHED_INDEX_SHARD_KEYS)
+        cache.add(VOUCHED_INDEX_LOCK_KEY, True)
+        user.userprofile.delete()
+        eq_(cache.get_many(VOUCHED_INDEX_SHARD_KEYS), shards)
+        ok_(update_vouched_index_task_mock.apply_async.called)
+        eq_(update_vouched_index_task_mock.apply_async.call_args[1]['args'],
+            [user.email, False])
+
+    def test_unchanged_update_keeps_version(self):
+        user = UserFactory.create()
+        vouched.get_index()
+        version = cache.get(VOUCHED_INDEX_VERSION_KEY)
+        ok_(vouched.update_index(user.email, True))
+        eq_(cache.get(VOUCHED_INDEX_VERSION_KEY), version)
+
+
+class VouchedEmailViewTests(TestCase):
+    def setUp(self):
+        cache.delete_many(VOUCHED_INDEX_SHARD_KEYS)
+        self.app = APIAppFactory.create(is_mozilla_app=False)
+        self.url = reverse('api_vouched_email')
+
+    def test_vouched(self):
+        user = UserFactory.create()
+        url = urlparams(self.url, app_name=self.app.name, app_key=self.app.key,
+                        email=user.email)
+        response = Client().get(url)
+        eq_(response.status_code, 200)
+        eq_(json.loads(response.content), {'email': user.email, 'is_vouched': True})
+
+    def test_not_vouched(self):
+        url = urlparams(self.url, app_name=self.app.name, app_key=self.app.key,
+                        email='foo@example.com')
+        eq_(json.loads(Client().get(url).content)['is_vouched'], False)
+
+    def test_invalid_app(self):
+        url = urlparams(self.url, app_name=self.app.name, app_key='invalid',
+                        email='foo@example.com')
+        eq_(Client().get(url).status_code, 401)
+
+    def test_non_ascii_app_key(self):
+        url = urlparams(self.url, app_name=self.app.name, email='foo@example.com')
+        eq_(Client().get(url + '&app_key=%C3%A9').status_code, 401)
+
+    def test_no_email(self):
+        url = urlparams(self.url, app_name=self.app.name, app_key=self.app.key)
+        eq_(Client().get(url).status_code, 400)
@@ -0,0 +1,43 @@
+import json
+
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_GET
+
+from django_statsd.clients import statsd
+from tastypie.http import HttpUnauthorized
+
+from mozillians.api import throttle
+from mozillians.api.models import APIApp
+from mozillians.users import vouched
+
+
+@never_cache
+@require_GET
+def vouched_email(request):
+    """Tell whether an email belongs to a vouched Mozillian.
+
+    Lightweight alternative to filtering UserResource by email, for
+    any active API app. Answers from the in-memory index of the
+    mozillians.users.vouched module. Like the restricted API, it only
+    knows about profiles that allow community sites. Throttled like
+    the rest of the API, counting one row per answer.
+    """
+    app, queried = APIApp.get_active_app(request.GET.get('app_name', ''),
+                                         request.GET.get('app_key', ''))
+    if app is None:
+        statsd.incr('api.auth.failed')
+        return HttpUnauthorized()
+
+    response = throttle.check(app)
+    if response is not None:
+        return response
+
+    email = request.GET.get('email', '').strip()
+    if not email:
+        return HttpResponseBadRequest()
+
+    statsd.incr('api.requests.vouched_email')
+    data = {'email': email, 'is_vouched': vouched.is_vouched_email(email)}
+    throttle.count_rows(app, 1)
+    return HttpResponse(json.dumps(data), mimetype='application/json')
@@ -0,0 +1,164 @@
+"""In-memory index of the emails of vouched users.
+
+Community sites mostly ask the API whether an email belongs to a
+vouched Mozillian. This module answers that from a sorted string of
+fixed size email digests, binary searched in memory, covering the
+complete and vouched profiles that allow community sites.
+
+The string is kept in the cache, split in one shard per first byte of
+the digests, and every process holds a copy of the whole of it,
+reloaded when the index version in the cache changes. Profile signals
+add or remove single digests, rewriting their shard only, and the
+rebuild_vouched_index cron job rebuilds the whole index, which also
+drops the old emails of users who changed theirs. Only lookups rebuild
+an index with missing shards, never updates, and the process that
+rebuilt it keeps it even if the cache failed to store it.
+
+Digests are the first DIGEST_SIZE bytes of the SHA-1 of the lowercased
+email, so the index takes DIGEST_SIZE bytes per user. With 8 bytes the
+chance of a false positive stays negligible for any realistic number of
+users, and with 256 shards millions of users stay well within the 1MB
+memcached item limit.
+
+"""
+from hashlib import sha1
+from itertools import groupby
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import get_model
+
+from django_statsd.clients import statsd
+
+from mozillians.common.versions import bump_version
+
+
+DIGEST_SIZE = 8
+VOUCHED_INDEX_KEY = 'users:vouched:index:{shard}'
+VOUCHED_INDEX_SHARD_KEYS = [VOUCHED_INDEX_KEY.format(shard='%02x' % shard)
+                            for shard in range(256)]
+VOUCHED_INDEX_VERSION_KEY = 'users:vouched:version'
+VOUCHED_INDEX_LOCK_KEY = 'users:vouched:lock'
+VOUCHED_INDEX_TIMEOUT = getattr(settings, 'VOUCHED_INDEX_TIMEOUT', 60 * 60 * 25)
+
+_local = {}
+
+
+def email_digest(email):
+    return sha1(email.strip().lower().encode('utf-8')).digest()[:DIGEST_SIZE]
+
+
+def _shard_key(digest):
+    return VOUCHED_INDEX_SHARD_KEYS[ord(digest[0])]
+
+
+class DigestSet(object):
+    """Set of digests stored as one sorted string."""
+
+    def __init__(self, data=''):
+        self.data = data
+
+    @classmethod
+    def from_digests(cls, digests):
+        return cls(''.join(sorted(set(digests))))
+
+    def __len__(self):
+        return len(self.data) / DIGEST_SIZE
+
+    def _position(self, digest):
+        """Return the index digest is, or would be inserted, at."""
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) / 2
+            start = middle * DIGEST_SIZE
+            if self.data[start:start + DIGEST_SIZE] < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __contains__(self, digest):
+        start = self._position(digest) * DIGEST_SIZE
+        return self.data[start:start + DIGEST_SIZE] == digest
+
+    def add(self, digest):
+        start = self._position(digest) * DIGEST_SIZE
+        if self.data[start:start + DIGEST_SIZE] != digest:
+            self.data = self.data[:start] + digest + self.data[start:]
+
+    def discard(self, digest):
+        start = self._position(digest) * DIGEST_SIZE
+        if self.data[start:start + DIGEST_SIZE] == digest:
+            self.data = self.data[:start] + self.data[start + DIGEST_SIZE:]
+
+
+def build_index():
+    """Rebuild the index from the database and store it in the cache."""
+    UserProfile = get_model('users', 'UserProfile')
+    emails = (UserProfile.objects.vouched().filter(allows_community_sites=True)
+              .values_list('user__email', flat=True))
+    index = DigestSet.from_digests(email_digest(email) for email in emails)
+    digests = [index.data[start:start + DIGEST_SIZE]
+               for start in range(0, len(index.data), DIGEST_SIZE)]
+    shards = dict.fromkeys(VOUCHED_INDEX_SHARD_KEYS, '')
+    for key, shard_digests in groupby(digests, _shard_key):
+        shards[key] = ''.join(shard_digests)
+    cache.set_many(shards, VOUCHED_INDEX_TIMEOUT)
+    bump_version(VOUCHED_INDEX_VERSION_KEY, VOUCHED_INDEX_TIMEOUT)
+    _local.update(index=index, version=cache.get(VOUCHED_INDEX_VERSION_KEY))
+    return index
+
+
+def get_index():
+    """Return the index of this process, reloaded if it is out of date."""
+    version = cache.get(VOUCHED_INDEX_VERSION_KEY)
+    if 'index' in _local and _local['version'] == version:
+        return _local['index']
+
+    shards = cache.get_many(VOUCHED_INDEX_SHARD_KEYS)
+    if len(shards) < len(VOUCHED_INDEX_SHARD_KEYS):
+        statsd.incr('users.vouched.rebuild')
+        return build_index()
+    index = DigestSet(''.join(shards[key] for key in VOUCHED_INDEX_SHARD_KEYS))
+    _local.update(index=index, version=version)
+    return index
+
+
+def is_vouched_email(email):
+    return email_digest(email) in get_index()
+
+
+def update_index(email, vouched):
+    """Add email to, or remove it from, the cached index.
+
+    Nothing is written, and the version stays the same, if the index
+    already holds the email or not as it should. Returns False, without
+    touching the index, if another process is updating it at the same
+    time, so that the caller can try again later.
+    """
+    digest = email_digest(email)
+    version = cache.get(VOUCHED_INDEX_VERSION_KEY)
+    if ('index' in _local and version is not None and _local['version'] == version
+            and (digest in _local['index']) == vouched):
+        return True
+
+    if not cache.add(VOUCHED_INDEX_LOCK_KEY, True, 10):
+        statsd.incr('users.vouched.update_contended')
+        return False
+
+    try:
+        key = _shard_key(digest)
+        data = cache.get(key)
+        if data is None:
+            return True
+        shard = DigestSet(data)
+        if vouched:
+            shard.add(digest)
+        else:
+            shard.discard(digest)
+        if shard.data != data:
+            cache.set(key, shard.data, VOUCHED_INDEX_TIMEOUT)
+            bump_version(VOUCHED_INDEX_VERSION_KEY, VOUCHED_INDEX_TIMEOUT)
+        return True
+    finally:
+        cache.delete(VOUCHED_INDEX_LOCK_KEY)
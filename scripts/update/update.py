@@ -99,9 +99,9 @@ def update_es_indexes(ctx):
         ctx.local("python2.6 manage.py cron index_all_profiles &")
 
 @task
-def validate_fun_facts(ctx):
+def update_fun_facts(ctx):
     with ctx.lcd(settings.SRC_DIR):
-        ctx.local("python2.6 manage.py cron validate_fun_facts")
+        ctx.local("python2.6 manage.py cron update_fun_facts")
 
 
 @task
@@ -180,7 +180,7 @@ def deploy(ctx):
         ping_newrelic()
         update_celery()
         update_es_indexes()
-        validate_fun_facts()
+        update_fun_facts()
         generate_humanstxt()
 
 